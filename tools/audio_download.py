@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+"""
+Parallel, resumable audio downloads for Voicy episodes.
+
+- One pooled httpx.AsyncClient for all downloads (keep-alive; HTTP/2 when h2 is installed)
+- Interrupted downloads resume from <file>.part with HTTP Range; large files are split into
+  segments that are fetched in parallel
+- The result is checked against Content-Length and, when the server exposes one, the MD5
+  (Content-MD5, x-goog-hash or a plain-MD5 ETag)
+- Finished files are recorded in <dir>/downloads.json with their sha256 and skipped next time
+- Each finished path is put on an asyncio.Queue, so transcription can start while the
+  remaining downloads are still running
+
+HLS playlists (.m3u8) are not handled; the scraper only reports direct media URLs.
+
+Usage:
+    python audio_download.py URL [URL ...] -o drafts/voicy_audio -j 4
+    python audio_download.py URL [URL ...] --transcribe     # transcribe each file as soon as it lands
+"""
+
+import argparse
+import asyncio
+import base64
+import hashlib
+import importlib.util
+import json
+import os
+import re
+from datetime import datetime
+from pathlib import Path
+from urllib.parse import unquote, urlparse
+
+import httpx
+
+AUDIO_DIR = "drafts/voicy_audio"
+MANIFEST_NAME = "downloads.json"
+CONCURRENCY = 4
+SEGMENTS = 4
+SEGMENT_MIN_BYTES = 8 * 1024 * 1024  # smaller files are fetched in one stream
+CHUNK_BYTES = 256 * 1024
+AUDIO_EXTENSIONS = (".mp3", ".m4a", ".aac", ".wav", ".ogg", ".flac")
+
+
+class ChecksumError(Exception):
+    pass
+
+
+def _expected_md5(headers):
+    """MD5 advertised by the server as hex, if any."""
+    if value := headers.get("content-md5"):
+        return base64.b64decode(value).hex()
+    for part in (headers.get("x-goog-hash") or "").split(","):
+        if part.strip().startswith("md5="):
+            return base64.b64decode(part.strip()[4:]).hex()
+    etag = (headers.get("etag") or "").strip('"')
+    # Single-part S3/CloudFront style ETags are the MD5; multipart ones contain a '-'
+    if re.fullmatch(r"[0-9a-f]{32}", etag):
+        return etag
+    return None
+
+
+def _file_digests(path):
+    sha256, md5 = hashlib.sha256(), hashlib.md5()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            sha256.update(block)
+            md5.update(block)
+    return sha256.hexdigest(), md5.hexdigest()
+
+
+def filename_for(url, name=None):
+    """<name><ext of the URL>, or the URL's own file name."""
+    path = unquote(urlparse(url).path)
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in AUDIO_EXTENSIONS:
+        ext = ".mp3"
+    if name:
+        return f"{name}{ext}"
+    return os.path.basename(path) or f"{hashlib.sha256(url.encode()).hexdigest()[:16]}{ext}"
+
+
+class Manifest:
+    """<dir>/downloads.json: file name -> {url, size, sha256, downloaded_at}"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.data = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            self.data = {}
+
+    def done(self, dest):
+        entry = self.data.get(dest.name)
+        return bool(entry) and dest.exists() and dest.stat().st_size == entry["size"]
+
+    def record(self, dest, url, size, sha256):
+        self.data[dest.name] = {
+            "url": url,
+            "size": size,
+            "sha256": sha256,
+            "downloaded_at": datetime.now().isoformat(timespec="seconds"),
+        }
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.data, f, ensure_ascii=False, indent=2)
+        tmp.replace(self.path)
+
+
+class AudioDownloader:
+    """
+    Download episodes concurrently over one pooled client.
+
+        async with AudioDownloader(queue=queue) as downloader:
+            downloader.submit(url, name="2024-01-02_title")
+            ...
+            await downloader.wait()
+    """
+
+    def __init__(self, out_dir=AUDIO_DIR, concurrency=CONCURRENCY, segments=SEGMENTS, queue=None):
+        self.out_dir = Path(out_dir)
+        self.segments = max(1, segments)
+        self.queue = queue
+        self.manifest = Manifest(self.out_dir / MANIFEST_NAME)
+        self.stats = {"downloaded": 0, "skipped": 0, "failed": 0, "bytes": 0}
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._tasks = []
+        self._limits = httpx.Limits(max_connections=concurrency * self.segments,
+                                    max_keepalive_connections=concurrency * self.segments)
+        self.client = None
+
+    async def __aenter__(self):
+        self.client = httpx.AsyncClient(
+            limits=self._limits,
+            timeout=httpx.Timeout(30.0, read=120.0),
+            follow_redirects=True,
+            http2=importlib.util.find_spec("h2") is not None,
+        )
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.client.aclose()
+
+    def submit(self, url, name=None):
+        """Schedule a download; the finished path is put on the queue."""
+        task = asyncio.create_task(self._run(url, self.out_dir / filename_for(url, name)))
+        self._tasks.append(task)
+        return task
+
+    async def wait(self):
+        """Wait for everything submitted so far; returns the finished paths."""
+        results = await asyncio.gather(*self._tasks)
+        self._tasks = []
+        return [path for path in results if path]
+
+    async def _run(self, url, dest):
+        async with self._semaphore:
+            try:
+                path = await self.download(url, dest)
+            except (httpx.HTTPError, ChecksumError, OSError) as e:
+                self.stats["failed"] += 1
+                print(f"Download failed: {url} ({type(e).__name__}: {e})")
+                return None
+        if self.queue is not None:
+            await self.queue.put(path)
+        return path
+
+    async def probe(self, url):
+        """Size, Range support and advertised MD5 of url."""
+        response = await self.client.head(url)
+        if response.status_code >= 400 or "content-length" not in response.headers:
+            # Some CDNs reject HEAD; a one-byte range request tells the same story
+            async with self.client.stream("GET", url, headers={"Range": "bytes=0-0"}) as response:
+                response.raise_for_status()
+                headers = response.headers
+                total = (headers.get("content-range") or "").rpartition("/")[2]
+                return {
+                    "size": int(total) if total.isdigit() else None,
+                    "ranges": response.status_code == 206,
+                    "md5": _expected_md5(headers),
+                }
+        headers = response.headers
+        return {
+            "size": int(headers["content-length"]),
+            "ranges": headers.get("accept-ranges") == "bytes",
+            "md5": _expected_md5(headers),
+        }
+
+    async def _fetch(self, url, part, start, end, ranges):
+        """Fetch bytes start..end (inclusive, end=None for the rest) into part, resuming what is there."""
+        have = part.stat().st_size if part.exists() else 0
+        if end is not None and have >= end - start + 1:
+            return
+        headers = {}
+        if ranges and (start + have > 0 or end is not None):
+            headers["Range"] = f"bytes={start + have}-{'' if end is None else end}"
+        elif have:
+            have = 0  # no Range support: start over
+        async with self.client.stream("GET", url, headers=headers) as response:
+            response.raise_for_status()
+            if headers and response.status_code != 206:
+                raise httpx.HTTPError(f"Range request ignored by server (status {response.status_code})")
+            with open(part, "ab" if have else "wb") as f:
+                async for chunk in response.aiter_bytes(CHUNK_BYTES):
+                    f.write(chunk)
+                    self.stats["bytes"] += len(chunk)
+
+    async def download(self, url, dest):
+        if self.manifest.done(dest):
+            self.stats["skipped"] += 1
+            print(f"Already downloaded: {dest}")
+            return dest
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        info = await self.probe(url)
+        part = dest.with_name(dest.name + ".part")
+
+        size = info["size"]
+        if info["ranges"] and size and size >= SEGMENT_MIN_BYTES and self.segments > 1:
+            step = -(-size // self.segments)
+            bounds = [(i, min(i + step, size) - 1) for i in range(0, size, step)]
+            pieces = [dest.with_name(f"{dest.name}.part{n}") for n in range(len(bounds))]
+            await asyncio.gather(*(
+                self._fetch(url, piece, start, end, True) for piece, (start, end) in zip(pieces, bounds)
+            ))
+            with open(part, "wb") as out:
+                for piece in pieces:
+                    with open(piece, "rb") as f:
+                        while block := f.read(1024 * 1024):
+                            out.write(block)
+            for piece in pieces:
+                piece.unlink()
+        else:
+            # With a known size a .part that is already complete (run killed before the rename) is kept
+            # as is; asking for bytes=<size>- would get 416
+            await self._fetch(url, part, 0, size - 1 if size else None, info["ranges"])
+
+        actual = part.stat().st_size
+        sha256, md5 = await asyncio.to_thread(_file_digests, part)
+        if (size is not None and actual != size) or (info["md5"] and info["md5"] != md5):
+            part.unlink()
+            raise ChecksumError(f"{dest.name}: expected {size} bytes / md5 {info['md5']}, got {actual} / {md5}")
+        part.replace(dest)
+        self.manifest.record(dest, url, actual, sha256)
+        self.stats["downloaded"] += 1
+        print(f"Downloaded: {dest} ({actual / 1024 / 1024:.1f} MB)")
+        return dest
+
+    def print_stats(self):
+        s = self.stats
+        print(f"Audio: {s['downloaded']} downloaded, {s['skipped']} already present, {s['failed']} failed, "
+              f"{s['bytes'] / 1024 / 1024:.1f} MB transferred")
+
+
+async def transcribe_from_queue(queue, on_transcript=None, **kwargs):
+    """
+    Transcribe each path from the queue as it arrives (None ends the loop).
+
+    With on_transcript, each transcript is passed to on_transcript(path, text) instead of being printed.
+    """
+    from transcribe_audio import transcribe_audio
+
+    if on_transcript:
+        kwargs.setdefault("echo", False)
+    while (path := await queue.get()) is not None:
+        try:
+            text = await asyncio.to_thread(transcribe_audio, str(path), **kwargs)
+            if on_transcript and text:
+                on_transcript(path, text)
+        except Exception as e:
+            # Finished chunks are cached; re-running resumes from there
+            print(f"Error during transcription of {path}: {e}")
+
+
+async def main(urls, out_dir, concurrency, segments, transcribe):
+    queue = asyncio.Queue() if transcribe else None
+    consumer = asyncio.create_task(transcribe_from_queue(queue)) if transcribe else None
+    async with AudioDownloader(out_dir, concurrency, segments, queue=queue) as downloader:
+        for url in urls:
+            downloader.submit(url)
+        await downloader.wait()
+    downloader.print_stats()
+    if consumer:
+        await queue.put(None)
+        await consumer
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Download episode audio in parallel with resume.")
+    parser.add_argument("urls", nargs="+", help="Audio URLs")
+    parser.add_argument("-o", "--output-dir", default=AUDIO_DIR, help=f"Output directory (default: {AUDIO_DIR})")
+    parser.add_argument("-j", "--jobs", type=int, default=CONCURRENCY, help="Parallel downloads")
+    parser.add_argument("--segments", type=int, default=SEGMENTS, help="Parallel ranges per large file")
+    parser.add_argument("--transcribe", action="store_true", help="Transcribe each file as soon as it is downloaded")
+    args = parser.parse_args()
+    asyncio.run(main(args.urls, args.output_dir, args.jobs, args.segments, args.transcribe))
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+書き起こし前の音声前処理
+
+実際のコンテナ・コーデックを判定し（ffprobe、無ければ先頭バイト）、正しい MIME タイプを返す。
+前処理を有効にすると ffmpeg でモノラル化・音声向けのサンプルレートへの変換・前後の無音除去（途中の長い無音も短縮）を行い、
+低ビットレートの Opus（Ogg）に変換する。アップロード量と音声トークン数（長さに比例）が減る。
+
+変換結果は入力の内容ハッシュと設定をキーに ~/.gemini-image/audio_cache/ へ保存し、
+同じ音声を何度処理しても ffmpeg は1回だけ走る（書き起こしキャッシュのキーも安定する）。
+複数ファイルはワーカープールで並列に処理する。
+
+Usage:
+    python audio_preprocess.py episode1.mp3 episode2.m4a -j 4
+    python audio_preprocess.py episode1.mp3 --probe     # 判定結果だけ表示
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+CACHE_DIR = Path(os.environ.get("GEMINI_AUDIO_CACHE", "~/.gemini-image/audio_cache")).expanduser()
+SAMPLE_RATE = 16000  # Gemini は音声を 16kHz に落として処理する
+BITRATE = "24k"
+SILENCE_THRESHOLD = "-50dB"
+SILENCE_SECONDS = 0.5
+LONG_SILENCE_SECONDS = 2.0  # これ以上続く無音（末尾を含む）を SILENCE_SECONDS に縮める
+
+# ffprobe の format_name / 先頭バイトの判定結果 → MIME タイプ
+MIME_TYPES = {
+    "mp3": "audio/mp3",
+    "wav": "audio/wav",
+    "flac": "audio/flac",
+    "ogg": "audio/ogg",
+    "aac": "audio/aac",
+    "aiff": "audio/aiff",
+    "mp4": "audio/mp4",
+    "webm": "audio/webm",
+}
+
+
+def sniff_format(path: str | Path) -> str | None:
+    """先頭バイトからコンテナを判定（ffprobe が無いとき用）"""
+    with open(path, "rb") as f:
+        head = f.read(12)
+    if head[:3] == b"ID3" or (len(head) > 1 and head[0] == 0xFF and head[1] & 0xE0 == 0xE0 and head[1] & 0x06):
+        return "mp3"
+    if len(head) > 1 and head[0] == 0xFF and head[1] & 0xF6 == 0xF0:
+        return "aac"  # ADTS
+    if head[:4] == b"RIFF" and head[8:12] == b"WAVE":
+        return "wav"
+    if head[:4] == b"fLaC":
+        return "flac"
+    if head[:4] == b"OggS":
+        return "ogg"
+    if head[:4] == b"FORM" and head[8:12] in (b"AIFF", b"AIFC"):
+        return "aiff"
+    if head[4:8] == b"ftyp":
+        return "mp4"
+    if head[:4] == b"\x1aE\xdf\xa3":
+        return "webm"
+    return None
+
+
+def probe(path: str | Path) -> dict:
+    """
+    コンテナ・コーデック・チャンネル数・サンプルレート・ビットレート・長さを調べる
+
+    ffprobe が無ければ先頭バイトでコンテナだけを判定する。
+    """
+    info = {"path": str(path), "bytes": Path(path).stat().st_size, "format": sniff_format(path)}
+    if not shutil.which("ffprobe"):
+        return info
+    result = subprocess.run(
+        ["ffprobe", "-v", "error", "-print_format", "json", "-show_format", "-show_streams", str(path)],
+        capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        return info
+    data = json.loads(result.stdout)
+    stream = next((s for s in data.get("streams", []) if s.get("codec_type") == "audio"), {})
+    fmt = data.get("format", {})
+    names = (fmt.get("format_name") or "").split(",")
+    # mov,mp4,m4a,... のような複数名は MIME_TYPES にある最初の名前を使う
+    info["format"] = next((n for n in names if n in MIME_TYPES), None) or ("mp4" if "mov" in names else info["format"])
+    info.update({
+        "codec": stream.get("codec_name"),
+        "channels": stream.get("channels"),
+        "sample_rate": int(stream["sample_rate"]) if stream.get("sample_rate") else None,
+        "bit_rate": int(fmt["bit_rate"]) if fmt.get("bit_rate") else None,
+        "duration": float(fmt["duration"]) if fmt.get("duration") else None,
+    })
+    return info
+
+
+def mime_type(path: str | Path) -> str:
+    """実際のフォーマットに合った MIME タイプ（判定できなければ拡張子、最後は audio/mp3）"""
+    fmt = sniff_format(path) or Path(path).suffix.lstrip(".").lower()
+    if fmt in ("m4a", "mp4a"):
+        fmt = "mp4"
+    return MIME_TYPES.get(fmt, "audio/mp3")
+
+
+def available() -> bool:
+    return shutil.which("ffmpeg") is not None
+
+
+def _settings_key(sample_rate: int, bitrate: str, trim_silence: bool) -> str:
+    return f"{sample_rate}_{bitrate}_{'trim' if trim_silence else 'notrim'}"
+
+
+def _file_sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def preprocess(
+    path: str | Path,
+    sample_rate: int = SAMPLE_RATE,
+    bitrate: str = BITRATE,
+    trim_silence: bool = True,
+    cache_dir: Path = CACHE_DIR,
+) -> Path:
+    """
+    モノラル・sample_rate Hz・Opus に変換し、前後の無音を除去（途中の長い無音は短縮）したファイルを返す
+
+    同じ入力・設定の変換済みファイルがあればそれを返す。ffmpeg が無ければ元のファイルを返す。
+    """
+    path = Path(path)
+    if not available():
+        return path
+    out = Path(cache_dir) / f"{_file_sha256(path)[:32]}_{_settings_key(sample_rate, bitrate, trim_silence)}.ogg"
+    if out.exists():
+        return out
+
+    filters = [f"aresample={sample_rate}", "aformat=channel_layouts=mono"]
+    if trim_silence:
+        # 1パスで処理する（areverse は音声全体をメモリに載せるので使わない）。
+        # 末尾の無音は stop_periods=-1 で長い無音ごと縮める（途中の長い間も短くなるが書き起こしには影響しない）
+        filters.append(
+            f"silenceremove=start_periods=1:start_threshold={SILENCE_THRESHOLD}:start_silence={SILENCE_SECONDS}"
+            f":stop_periods=-1:stop_threshold={SILENCE_THRESHOLD}:stop_duration={LONG_SILENCE_SECONDS}"
+            f":stop_silence={SILENCE_SECONDS}"
+        )
+
+    out.parent.mkdir(parents=True, exist_ok=True)
+    tmp = out.with_suffix(f".{os.getpid()}.tmp.ogg")
+    subprocess.run(
+        [
+            "ffmpeg", "-hide_banner", "-loglevel", "error", "-y",
+            "-i", str(path),
+            "-vn", "-af", ",".join(filters),
+            "-c:a", "libopus", "-b:a", bitrate, "-application", "voip",
+            "-map_metadata", "-1", "-fflags", "+bitexact",
+            str(tmp),
+        ],
+        check=True,
+    )
+    tmp.replace(out)
+    return out
+
+
+def preprocess_many(paths: list, workers: int | None = None, **kwargs) -> list[Path]:
+    """複数ファイルをワーカープールで前処理（結果は入力と同じ順）"""
+    if not available():
+        print("⚠️ ffmpeg not found, sending original audio")
+        return [Path(p) for p in paths]
+    workers = workers or min(len(paths), os.cpu_count() or 1)
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        outputs = list(pool.map(lambda p: preprocess(p, **kwargs), paths))
+    for src, dst in zip(paths, outputs):
+        before, after = Path(src).stat().st_size, dst.stat().st_size
+        print(f"🎚️  {Path(src).name}: {before / 1024 / 1024:.1f} MB -> {after / 1024 / 1024:.1f} MB "
+              f"({100 * after / max(before, 1):.0f}%)")
+    return outputs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Preprocess audio for transcription")
+    parser.add_argument("files", nargs="+", help="音声ファイル")
+    parser.add_argument("-j", "--jobs", type=int, help="並列数 (default: CPU 数)")
+    parser.add_argument("--sample-rate", type=int, default=SAMPLE_RATE)
+    parser.add_argument("--bitrate", default=BITRATE)
+    parser.add_argument("--no-trim", action="store_true", help="前後の無音を残す")
+    parser.add_argument("--probe", action="store_true", help="判定結果だけ表示")
+    args = parser.parse_args()
+
+    if args.probe:
+        for path in args.files:
+            info = probe(path)
+            print(json.dumps({**info, "mime_type": mime_type(path)}, ensure_ascii=False))
+        return
+
+    outputs = preprocess_many(
+        args.files, workers=args.jobs,
+        sample_rate=args.sample_rate, bitrate=args.bitrate, trim_silence=not args.no_trim,
+    )
+    for path in outputs:
+        print(path)
+
+
+if __name__ == "__main__":
+    main()
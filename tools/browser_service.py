@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Long-lived local browser for repeated Voicy runs.
+
+`serve` keeps one Chromium running on a persistent profile and exposes it over CDP on
+127.0.0.1. Scraper runs (fetch_voicy_all.py, voicy_pipeline.py) connect to it instead of
+launching a browser, and open their pages in its already-warm default context:
+app bundles in the HTTP cache, resolved hosts, open connections and logged-in cookies.
+
+When the service is not running the scraper launches its own browser as before, with
+cookies restored from the saved storage state (written by both the service and local runs),
+so authenticated pages don't repeat the login flow either way.
+
+Runs with an HTTP archive (--http-cache) always get a fresh context, because the archive
+routes every request of the context it is attached to.
+
+    VOICY_BROWSER_URL   CDP endpoint (default http://127.0.0.1:9333)
+    VOICY_BROWSER=off   never connect to the service
+    ~/.voicy-scraper/profile              service profile (cookies, HTTP cache)
+    ~/.voicy-scraper/storage_state.json   cookies/localStorage for fresh contexts
+
+Usage:
+    python browser_service.py serve                 # keep running (e.g. launchd / tmux)
+    python browser_service.py serve --headed        # log in by hand once, then keep it running
+    python browser_service.py status
+"""
+
+import argparse
+import asyncio
+import contextlib
+import os
+import signal
+import time
+from pathlib import Path
+from urllib.parse import urlparse
+
+import httpx
+from playwright.async_api import async_playwright
+
+SERVICE_URL = os.environ.get("VOICY_BROWSER_URL", "http://127.0.0.1:9333")
+STATE_DIR = Path("~/.voicy-scraper").expanduser()
+PROFILE_DIR = STATE_DIR / "profile"
+STATE_PATH = STATE_DIR / "storage_state.json"
+WARM_URL = "https://voicy.jp/channel/3577/all"
+SAVE_INTERVAL = 300
+# Same options the scraper uses for its own contexts
+CONTEXT_OPTIONS = {"locale": "ja-JP", "service_workers": "block"}
+
+
+async def service_running(url=SERVICE_URL, timeout=0.5):
+    """True if a CDP endpoint answers at url."""
+    if os.environ.get("VOICY_BROWSER") == "off":
+        return False
+    try:
+        async with httpx.AsyncClient(timeout=timeout) as client:
+            response = await client.get(f"{url}/json/version")
+            return response.status_code == 200
+    except httpx.HTTPError:
+        return False
+
+
+class BrowserSession:
+    """
+    A browser for one scraper run: the shared service or a locally launched one.
+
+    context() returns the warm service context when possible, otherwise a fresh context
+    with the saved storage state. Pages are opened with new_page(), so close() can leave the
+    service running and its context open, closing only the pages and contexts this run
+    created (another run connected at the same time keeps its pages).
+    """
+
+    def __init__(self, browser, mode):
+        self.browser = browser
+        self.mode = mode  # "service" or "local"
+        self._created = []
+        self._pages = []
+
+    async def context(self, archive=None, **options):
+        if self.mode == "service" and archive is None and self.browser.contexts:
+            return self.browser.contexts[0]
+        state = str(STATE_PATH) if STATE_PATH.exists() else None
+        context = await self.browser.new_context(storage_state=state, **{**CONTEXT_OPTIONS, **options})
+        self._created.append(context)
+        return context
+
+    async def new_page(self, context):
+        """A page in context, closed by close()."""
+        page = await context.new_page()
+        self._pages.append(page)
+        return page
+
+    async def close(self):
+        for page in self._pages:
+            if not page.is_closed():
+                await page.close()
+        if self._created and self.mode == "local":
+            # Keep cookies from this run (e.g. a refreshed session) for the next fresh context
+            STATE_DIR.mkdir(parents=True, exist_ok=True)
+            await self._created[0].storage_state(path=str(STATE_PATH))
+        for context in self._created:
+            await context.close()
+        # For a CDP connection this only disconnects; the service keeps running
+        await self.browser.close()
+
+
+@contextlib.asynccontextmanager
+async def open_browser(p, headless=True):
+    """Connect to the browser service if it is running, otherwise launch a browser."""
+    started = time.perf_counter()
+    session = None
+    if await service_running():
+        try:
+            session = BrowserSession(await p.chromium.connect_over_cdp(SERVICE_URL), "service")
+        except Exception as e:
+            print(f"Notice: Browser service at {SERVICE_URL} not usable ({e}), launching a browser")
+    if session is None:
+        session = BrowserSession(await p.chromium.launch(headless=headless), "local")
+    print(f"Browser: {session.mode} ({time.perf_counter() - started:.2f}s)")
+    try:
+        yield session
+    finally:
+        await session.close()
+
+
+async def serve(url=SERVICE_URL, headless=True, warm_url=WARM_URL):
+    port = urlparse(url).port or 9333
+    PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    async with async_playwright() as p:
+        context = await p.chromium.launch_persistent_context(
+            str(PROFILE_DIR),
+            headless=headless,
+            args=[f"--remote-debugging-port={port}", "--remote-debugging-address=127.0.0.1"],
+            **CONTEXT_OPTIONS,
+        )
+        # Pre-warm: load the channel once so DNS, TLS and the app bundles are ready for the first run
+        page = context.pages[0] if context.pages else await context.new_page()
+        try:
+            await page.goto(warm_url, wait_until="domcontentloaded")
+        except Exception as e:
+            print(f"Notice: Warm-up navigation failed ({e})")
+        print(f"Browser service listening on {url} (profile: {PROFILE_DIR})")
+
+        while not stop.is_set():
+            STATE_DIR.mkdir(parents=True, exist_ok=True)
+            await context.storage_state(path=str(STATE_PATH))
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(stop.wait(), SAVE_INTERVAL)
+
+        await context.storage_state(path=str(STATE_PATH))
+        await context.close()
+    print("Browser service stopped")
+
+
+async def status(url=SERVICE_URL):
+    if not await service_running(url):
+        print(f"No browser service at {url}")
+        return
+    async with httpx.AsyncClient(timeout=2) as client:
+        version = (await client.get(f"{url}/json/version")).json()
+        targets = (await client.get(f"{url}/json/list")).json()
+    print(f"{version.get('Browser')} at {url}, {sum(t.get('type') == 'page' for t in targets)} pages open")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Persistent browser for the Voicy scraper")
+    sub = parser.add_subparsers(dest="command", required=True)
+    serve_parser = sub.add_parser("serve", help="Run the browser service")
+    serve_parser.add_argument("--headed", action="store_true", help="Show the window (to log in by hand)")
+    serve_parser.add_argument("--warm-url", default=WARM_URL, help="Page loaded at startup")
+    sub.add_parser("status", help="Check whether the service is running")
+    args = parser.parse_args()
+    if args.command == "serve":
+        asyncio.run(serve(headless=not args.headed, warm_url=args.warm_url))
+    else:
+        asyncio.run(status())
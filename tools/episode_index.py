@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+Full-text search index over drafts/voicy_history.
+
+SQLite FTS5 with the trigram tokenizer, so Japanese text is searchable without a
+morphological analyzer: any substring of 3+ characters matches, ranked by bm25
+(title matches weigh more than body matches). Shorter terms fall back to LIKE.
+
+The index lives next to the markdown (<history dir>/index.sqlite, override with
+VOICY_INDEX) and is kept current incrementally:
+- save_episode() in fetch_voicy_all.py updates it on every write, which covers the
+  scraper and the transcripts written by voicy_pipeline.py
+- sync re-reads only files whose size/mtime changed and drops deleted ones
+
+Usage:
+    python episode_index.py sync
+    python episode_index.py search "生成AI 活用"
+    python episode_index.py search "ChatGPT" -n 5 --json
+    python episode_index.py stats
+"""
+
+import argparse
+import json
+import os
+import re
+import sqlite3
+import time
+from pathlib import Path
+
+HISTORY_DIR = "drafts/voicy_history"
+INDEX_PATH = os.environ.get("VOICY_INDEX") or os.path.join(HISTORY_DIR, "index.sqlite")
+TITLE_WEIGHT = 5.0
+SNIPPET_TOKENS = 24
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS episodes (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    title TEXT,
+    date TEXT,
+    url TEXT,
+    size INTEGER,
+    mtime REAL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS episodes_fts USING fts5(title, body, tokenize='trigram');
+"""
+
+
+# Template lines written by save_episode(); kept out of the index so snippets show content
+TEMPLATE_LINE = re.compile(r"^(#{2,} |\(自動取得された日付: )")
+
+
+def parse_markdown(text):
+    """(title, body) of an episode markdown file: the '# ' heading and the text after it."""
+    lines = text.split("\n")
+    title = None
+    for i, line in enumerate(lines):
+        if line.startswith("# "):
+            title, lines = line[2:].strip(), lines[i + 1:]
+            break
+    return title, "\n".join(line for line in lines if not TEMPLATE_LINE.match(line)).strip()
+
+
+def _quote(term):
+    return '"' + term.replace('"', '""') + '"'
+
+
+class EpisodeIndex:
+    def __init__(self, path=INDEX_PATH):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(self.path)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def _key(self, path):
+        return os.path.abspath(path)
+
+    def update_file(self, path, url=None, force=False):
+        """(Re)index one markdown file; unchanged files (same size and mtime) are skipped."""
+        key = self._key(path)
+        stat = os.stat(path)
+        row = self.db.execute("SELECT id, size, mtime, url FROM episodes WHERE path = ?", (key,)).fetchone()
+        if row and not force and row["size"] == stat.st_size and row["mtime"] == stat.st_mtime:
+            return False
+        with open(path, "r", encoding="utf-8") as f:
+            title, body = parse_markdown(f.read())
+        match = re.match(r"(\d{4}-\d{2}-\d{2})_", os.path.basename(path))
+        date = match.group(1) if match else None
+        url = url or (row["url"] if row else None)
+        with self.db:
+            if row:
+                self.db.execute("UPDATE episodes SET title = ?, date = ?, url = ?, size = ?, mtime = ? WHERE id = ?",
+                                (title, date, url, stat.st_size, stat.st_mtime, row["id"]))
+                self.db.execute("DELETE FROM episodes_fts WHERE rowid = ?", (row["id"],))
+                rowid = row["id"]
+            else:
+                rowid = self.db.execute(
+                    "INSERT INTO episodes (path, title, date, url, size, mtime) VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, title, date, url, stat.st_size, stat.st_mtime),
+                ).lastrowid
+            self.db.execute("INSERT INTO episodes_fts (rowid, title, body) VALUES (?, ?, ?)", (rowid, title, body))
+        return True
+
+    def remove(self, path):
+        key = self._key(path)
+        with self.db:
+            row = self.db.execute("SELECT id FROM episodes WHERE path = ?", (key,)).fetchone()
+            if row:
+                self.db.execute("DELETE FROM episodes_fts WHERE rowid = ?", (row["id"],))
+                self.db.execute("DELETE FROM episodes WHERE id = ?", (row["id"],))
+
+    def sync(self, directory=HISTORY_DIR):
+        """Index new/changed markdown files in directory and drop entries whose file is gone."""
+        stats = {"indexed": 0, "unchanged": 0, "removed": 0}
+        present = set()
+        for path in sorted(Path(directory).glob("*.md")):
+            present.add(self._key(path))
+            stats["indexed" if self.update_file(path) else "unchanged"] += 1
+        prefix = os.path.join(os.path.abspath(directory), "")
+        for row in self.db.execute("SELECT path FROM episodes").fetchall():
+            if row["path"].startswith(prefix) and row["path"] not in present:
+                self.remove(row["path"])
+                stats["removed"] += 1
+        return stats
+
+    def search(self, query, limit=10):
+        """
+        Ranked matches for query (whitespace-separated terms, all must match).
+
+        Returns [{path, title, date, url, snippet, score}], best first.
+        """
+        terms = query.split()
+        if not terms:
+            return []
+        long_terms = [t for t in terms if len(t) >= 3]
+        short_terms = [t for t in terms if len(t) < 3]
+        # Trigrams cannot match 1-2 character terms; those are filtered with LIKE instead
+        where, params = [], []
+        for term in short_terms:
+            where.append("(episodes_fts.title LIKE ? OR episodes_fts.body LIKE ?)")
+            params += [f"%{term}%"] * 2
+        if long_terms:
+            where.insert(0, "episodes_fts MATCH ?")
+            params.insert(0, " AND ".join(_quote(t) for t in long_terms))
+            snippet = f"snippet(episodes_fts, 1, '**', '**', '…', {SNIPPET_TOKENS})"
+            rank = f"bm25(episodes_fts, {TITLE_WEIGHT}, 1.0)"
+        else:
+            snippet, rank = "substr(episodes_fts.body, 1, 120)", "0"
+        sql = f"""
+            SELECT e.path, e.title, e.date, e.url, {snippet} AS snippet, {rank} AS score
+            FROM episodes_fts JOIN episodes e ON e.id = episodes_fts.rowid
+            WHERE {' AND '.join(where)}
+            ORDER BY score, e.date DESC
+            LIMIT ?
+        """
+        return [dict(row) for row in self.db.execute(sql, (*params, limit))]
+
+    def stats(self):
+        count, newest, oldest = self.db.execute("SELECT count(*), max(date), min(date) FROM episodes").fetchone()
+        return {
+            "episodes": count,
+            "oldest": oldest,
+            "newest": newest,
+            "bytes": self.path.stat().st_size if self.path.exists() else 0,
+        }
+
+
+_default = None
+
+
+def update(path, url=None):
+    """Index a just-written episode file in the default index (never fails the write)."""
+    global _default
+    try:
+        if _default is None:
+            _default = EpisodeIndex()
+        _default.update_file(path, url=url, force=True)
+    except (sqlite3.Error, OSError) as e:
+        print(f"Notice: Search index not updated for {path} ({e})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Full-text search over the Voicy episode history")
+    parser.add_argument("--index", default=INDEX_PATH, help=f"Index file (default: {INDEX_PATH})")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sync_parser = sub.add_parser("sync", help="Index new/changed markdown files")
+    sync_parser.add_argument("--dir", default=HISTORY_DIR, help=f"Episode directory (default: {HISTORY_DIR})")
+    search_parser = sub.add_parser("search", help="Ranked episode snippets")
+    search_parser.add_argument("query", help="Terms (all must match; 3+ characters use the index)")
+    search_parser.add_argument("-n", "--limit", type=int, default=10)
+    search_parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    sub.add_parser("stats", help="Episode count and date range")
+    args = parser.parse_args()
+
+    index = EpisodeIndex(args.index)
+    if args.command == "sync":
+        started = time.perf_counter()
+        stats = index.sync(args.dir)
+        print(f"Indexed {stats['indexed']}, unchanged {stats['unchanged']}, removed {stats['removed']} "
+              f"in {time.perf_counter() - started:.2f}s")
+    elif args.command == "search":
+        started = time.perf_counter()
+        results = index.search(args.query, args.limit)
+        elapsed = (time.perf_counter() - started) * 1000
+        if args.json:
+            print(json.dumps(results, ensure_ascii=False, indent=2))
+            return
+        for result in results:
+            print(f"{result['date']}  {result['title']}")
+            print(f"    {result['path']}")
+            print(f"    {' '.join(result['snippet'].split())}")
+        print(f"{len(results)} results in {elapsed:.1f} ms")
+    else:
+        stats = index.stats()
+        print(f"{index.path}: {stats['episodes']} episodes ({stats['oldest']} .. {stats['newest']}), "
+              f"{stats['bytes'] / 1024 / 1024:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,366 @@
+#!/usr/bin/env python3
+"""
+Consolidated, append-only store for the Voicy episode archive.
+
+Every saved episode is appended as one compressed record to a segment file, so bulk
+reads (re-indexing, generating over the whole history, exports) scan a few large files
+through mmap instead of opening thousands of small markdown files. The markdown in
+drafts/voicy_history is a generated view (save_episode() writes both; `views` rebuilds it).
+
+    <root>/segment-00001.bin     frames: <length:u32><crc32:u32><zlib(JSON record)>
+    <root>/index.jsonl           key -> segment, offset, length, sha256 (append-only, last line wins)
+
+Records: {key, url, title, date, body, transcript, sha256, saved_at}.
+key is the episode URL (or file:<markdown name> for episodes saved without one).
+A record whose content hash matches the current version is not appended again.
+index.jsonl can be rebuilt from the segments at any time (`reindex`).
+
+Store location: drafts/voicy_store (override with VOICY_STORE)
+
+Usage:
+    python episode_store.py import               # load existing drafts/voicy_history/*.md
+    python episode_store.py stats
+    python episode_store.py get https://voicy.jp/channel/3577/123456
+    python episode_store.py views                # regenerate the markdown from the store
+    python episode_store.py export episodes.jsonl
+    python episode_store.py compact              # drop superseded versions
+    python episode_store.py reindex
+"""
+
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import re
+import shutil
+import struct
+import time
+import zlib
+from datetime import datetime
+from pathlib import Path
+
+STORE_DIR = os.environ.get("VOICY_STORE", "drafts/voicy_store")
+HISTORY_DIR = "drafts/voicy_history"
+SEGMENT_BYTES = 64 * 1024 * 1024
+FRAME = struct.Struct("<II")
+CONTENT_FIELDS = ("url", "title", "date", "body", "transcript")
+
+
+def content_hash(record):
+    blob = json.dumps([record.get(field) for field in CONTENT_FIELDS], ensure_ascii=False)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+def record_key(record, markdown_name=None):
+    return record.get("url") or f"file:{markdown_name or record.get('title') or 'untitled'}"
+
+
+class CorruptRecord(Exception):
+    pass
+
+
+def _iter_frames(buffer):
+    """(offset, length, payload) for each frame in a segment buffer; stops at a torn tail."""
+    offset = 0
+    while offset + FRAME.size <= len(buffer):
+        length, crc = FRAME.unpack_from(buffer, offset)
+        start = offset + FRAME.size
+        if start + length > len(buffer):
+            break  # partially written last frame (interrupted append)
+        payload = buffer[start:start + length]
+        if zlib.crc32(payload) != crc:
+            raise CorruptRecord(f"CRC mismatch at offset {offset}")
+        yield offset, FRAME.size + length, payload
+        offset = start + length
+
+
+def _decode(payload):
+    return json.loads(zlib.decompress(payload))
+
+
+def _valid_end(segment):
+    """End offset of the last complete frame in segment (0 for an empty or missing file)."""
+    end = 0
+    if segment.exists():
+        for offset, length, _ in _mapped_frames(segment):
+            end = offset + length
+    return end
+
+
+def _mapped_frames(segment):
+    """_iter_frames over an mmapped segment file."""
+    with open(segment, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            yield from _iter_frames(buffer)
+
+
+class EpisodeStore:
+    def __init__(self, root=STORE_DIR):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.index_path = self.root / "index.jsonl"
+        self.index = {}
+        self._checked = set()  # segments whose tail was verified before appending
+        self._load_index()
+
+    # --- index ---
+
+    def _load_index(self):
+        if not self.index_path.exists():
+            if self.segments():
+                self.reindex()
+            return
+        with open(self.index_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # torn last line
+                self.index[entry["key"]] = entry
+        self._index_tail()
+
+    def _index_tail(self):
+        """Index frames written after the last index line (put() interrupted between the two writes)."""
+        segments = self.segments()
+        if not segments:
+            return
+        segment = segments[-1]
+        end = max((e["offset"] + e["length"] for e in self.index.values() if e["segment"] == segment.name),
+                  default=0)
+        if segment.stat().st_size <= end:
+            return
+        with open(segment, "rb") as f:
+            f.seek(end)
+            tail = f.read()
+        entries = []
+        for offset, length, payload in _iter_frames(tail):
+            record = _decode(payload)
+            entries.append({"key": record["key"], "segment": segment.name, "offset": end + offset,
+                            "length": length, "sha256": record["sha256"]})
+        if not entries:
+            return
+        with open(self.index_path, "a", encoding="utf-8") as f:
+            for entry in entries:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                self.index[entry["key"]] = entry
+        print(f"Notice: Indexed {len(entries)} records written after the last index line of {segment.name}")
+
+    def reindex(self):
+        """Rebuild index.jsonl from the segments (the segments are the source of truth)."""
+        self.index = {}
+        for segment in self.segments():
+            for offset, length, payload in _mapped_frames(segment):
+                record = _decode(payload)
+                self.index[record["key"]] = {"key": record["key"], "segment": segment.name, "offset": offset,
+                                             "length": length, "sha256": record["sha256"]}
+        tmp = self.index_path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            for entry in self.index.values():
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        tmp.replace(self.index_path)
+        return len(self.index)
+
+    # --- segments ---
+
+    def segments(self):
+        return sorted(self.root.glob("segment-*.bin"))
+
+    def _repair_tail(self):
+        """
+        Cut a torn last frame (interrupted append) off the newest segment.
+
+        Readers stop at a torn tail, but a frame appended after it would start inside the
+        torn bytes and every later scan would fail; checked once per segment per process.
+        """
+        segments = self.segments()
+        if not segments or segments[-1].name in self._checked:
+            return
+        segment = segments[-1]
+        end = _valid_end(segment)
+        size = segment.stat().st_size
+        if size > end:
+            with open(segment, "r+b") as f:
+                f.truncate(end)
+            print(f"Notice: Dropped {size - end} bytes of an interrupted write at the end of {segment.name}")
+        self._checked.add(segment.name)
+
+    def _active_segment(self, incoming):
+        segments = self.segments()
+        if segments and segments[-1].stat().st_size + incoming <= SEGMENT_BYTES:
+            return segments[-1]
+        number = int(segments[-1].stem.split("-")[1]) + 1 if segments else 1
+        return self.root / f"segment-{number:05d}.bin"
+
+    # --- records ---
+
+    def put(self, record, markdown_name=None):
+        """Append record unless its content is unchanged; returns the stored record."""
+        record = dict(record)
+        record["key"] = record.get("key") or record_key(record, markdown_name)
+        record["sha256"] = content_hash(record)
+        current = self.index.get(record["key"])
+        if current and current["sha256"] == record["sha256"]:
+            return None
+        record.setdefault("saved_at", datetime.now().isoformat(timespec="seconds"))
+        payload = zlib.compress(json.dumps(record, ensure_ascii=False).encode("utf-8"), 6)
+        frame = FRAME.pack(len(payload), zlib.crc32(payload)) + payload
+        self._repair_tail()
+        segment = self._active_segment(len(frame))
+        with open(segment, "ab") as f:
+            offset = f.tell()
+            f.write(frame)
+        entry = {"key": record["key"], "segment": segment.name, "offset": offset, "length": len(frame),
+                 "sha256": record["sha256"]}
+        with open(self.index_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self.index[record["key"]] = entry
+        return record
+
+    def get(self, key):
+        """Current version of an episode by URL (or file:<name> key), or None."""
+        entry = self.index.get(key)
+        if entry is None:
+            return None
+        with open(self.root / entry["segment"], "rb") as f:
+            f.seek(entry["offset"])
+            frame = f.read(entry["length"])
+        (_, _, payload), = _iter_frames(frame)
+        return _decode(payload)
+
+    def scan(self, all_versions=False):
+        """Sequential scan over mmapped segments; by default only the current version of each episode."""
+        for segment in self.segments():
+            for offset, _, payload in _mapped_frames(segment):
+                record = _decode(payload)
+                entry = self.index.get(record["key"])
+                if all_versions or (entry and entry["segment"] == segment.name and entry["offset"] == offset):
+                    yield record
+
+    def compact(self):
+        """
+        Rewrite the current versions into fresh segments and drop the old ones.
+
+        The new segments are numbered after the old ones and indexed before the old ones are
+        deleted, so an interrupted compact leaves superseded copies behind, never a gap.
+        """
+        old = self.segments()
+        tmp_root = self.root / "compact.tmp"
+        shutil.rmtree(tmp_root, ignore_errors=True)  # left over from an interrupted compact
+        tmp = EpisodeStore(tmp_root)
+        for record in self.scan():
+            tmp.put(record)
+        first = int(old[-1].stem.split("-")[1]) + 1 if old else 1
+        for number, segment in enumerate(tmp.segments(), first):
+            segment.replace(self.root / f"segment-{number:05d}.bin")
+        count = self.reindex()
+        for segment in old:
+            segment.unlink()
+        shutil.rmtree(tmp_root)
+        return count
+
+    def stats(self):
+        segments = self.segments()
+        return {
+            "episodes": len(self.index),
+            "segments": len(segments),
+            "bytes": sum(s.stat().st_size for s in segments),
+        }
+
+
+# ---------------------------------------------------------------------------
+# Markdown <-> record
+# ---------------------------------------------------------------------------
+
+
+def parse_markdown(text):
+    """Record fields from a markdown view written by fetch_voicy_all.save_episode()."""
+    title = re.search(r"^# (.*)$", text, re.MULTILINE)
+    date = re.search(r"^\(自動取得された日付: (.*)\)$", text, re.MULTILINE)
+    sections = dict(re.findall(r"^## (.+?)\n(.*?)(?=^## |\Z)", text, re.MULTILINE | re.DOTALL))
+    return {
+        "url": None,
+        "title": title.group(1).strip() if title else None,
+        "date": date.group(1) if date else "",
+        "body": sections.get("AI書き起こし", "").strip(),
+        "transcript": sections.get("音声書き起こし", "").strip() or None,
+    }
+
+
+_default = None
+
+
+def put(record, markdown_name=None):
+    """Append a just-saved episode to the default store (never fails the save)."""
+    global _default
+    try:
+        if _default is None:
+            _default = EpisodeStore()
+        _default.put(record, markdown_name)
+    except (OSError, CorruptRecord) as e:
+        print(f"Notice: Episode store not updated for {record.get('url') or markdown_name} ({e})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Consolidated Voicy episode store")
+    parser.add_argument("--store", default=STORE_DIR, help=f"Store directory (default: {STORE_DIR})")
+    sub = parser.add_subparsers(dest="command", required=True)
+    import_parser = sub.add_parser("import", help="Load existing markdown episodes into the store")
+    import_parser.add_argument("--dir", default=HISTORY_DIR)
+    sub.add_parser("stats", help="Episode/segment counts and size")
+    get_parser = sub.add_parser("get", help="Print one episode as JSON")
+    get_parser.add_argument("key", help="Episode URL (or file:<markdown name>)")
+    sub.add_parser("views", help="Regenerate the markdown views (and search index) from the store")
+    export_parser = sub.add_parser("export", help="Write the current episodes as JSONL")
+    export_parser.add_argument("output")
+    sub.add_parser("compact", help="Drop superseded versions")
+    sub.add_parser("reindex", help="Rebuild index.jsonl from the segments")
+    args = parser.parse_args()
+
+    store = EpisodeStore(args.store)
+    started = time.perf_counter()
+    if args.command == "import":
+        added = 0
+        for path in sorted(Path(args.dir).glob("*.md")):
+            with open(path, "r", encoding="utf-8") as f:
+                record = parse_markdown(f.read())
+            added += store.put(record, markdown_name=path.name) is not None
+        print(f"Imported {added} episodes ({len(store.index)} in store) in {time.perf_counter() - started:.2f}s")
+    elif args.command == "get":
+        record = store.get(args.key)
+        if record is None:
+            print(f"Not found: {args.key}")
+            raise SystemExit(1)
+        print(json.dumps(record, ensure_ascii=False, indent=2))
+    elif args.command == "views":
+        import episode_index
+        from fetch_voicy_all import write_markdown
+
+        count = 0
+        for record in store.scan():
+            episode_index.update(write_markdown(record, quiet=True), url=record.get("url"))
+            count += 1
+        print(f"Wrote {count} markdown views in {time.perf_counter() - started:.2f}s")
+    elif args.command == "export":
+        count = 0
+        with open(args.output, "w", encoding="utf-8") as f:
+            for record in store.scan():
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                count += 1
+        print(f"Exported {count} episodes to {args.output} in {time.perf_counter() - started:.2f}s")
+    elif args.command == "compact":
+        before = store.stats()["bytes"]
+        store.compact()
+        print(f"Compacted {before / 1024 / 1024:.1f} MB -> {store.stats()['bytes'] / 1024 / 1024:.1f} MB")
+    elif args.command == "reindex":
+        print(f"Indexed {store.reindex()} episodes")
+    else:
+        stats = store.stats()
+        print(f"{store.root}: {stats['episodes']} episodes in {stats['segments']} segments, "
+              f"{stats['bytes'] / 1024 / 1024:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,113 @@
+import argparse
 import asyncio
+import contextlib
+import fnmatch
 import os
 import re
+import time
 from datetime import datetime
-from playwright.async_api import async_playwright
+from playwright.async_api import async_playwright, TimeoutError as PlaywrightTimeoutError
 from bs4 import BeautifulSoup
 
+import episode_index
+import episode_store
+from browser_service import open_browser
+from audio_download import AUDIO_DIR, AudioDownloader, filename_for, transcribe_from_queue
+from http_archive import MODES as HTTP_CACHE_MODES, HttpArchive
+
 # Configuration
 CHANNEL_ID = "3577"
 BASE_URL = f"https://voicy.jp/channel/{CHANNEL_ID}"
 ALL_EPISODES_URL = f"{BASE_URL}/all"
 OUTPUT_DIR = "drafts/voicy_history"
 
+# Scraping profile: only the document, scripts and XHR are needed to read the episode text.
+# Blocked via CDP (Network.setBlockedURLs) rather than page.route(), because routing
+# disables the HTTP cache and the app bundles would be re-downloaded for every episode.
+BLOCKED_URL_PATTERNS = [
+    # images
+    "*.png*", "*.jpg*", "*.jpeg*", "*.gif*", "*.webp*", "*.avif*", "*.svg*", "*.ico*",
+    # fonts
+    "*.woff*", "*.ttf*", "*.otf*", "*.eot*",
+    # audio player / video
+    "*.mp3*", "*.m4a*", "*.aac*", "*.m3u8*", "*.mp4*", "*.webm*",
+    # stylesheets (text extraction does not depend on layout)
+    "*.css*", "*fonts.googleapis.com*",
+]
+TRACKER_HOSTS = [
+    "google-analytics.com", "googletagmanager.com", "googleadservices.com", "googlesyndication.com",
+    "doubleclick.net", "facebook.net", "facebook.com/tr", "connect.facebook.net",
+    "analytics.twitter.com", "static.ads-twitter.com", "bat.bing.com", "clarity.ms",
+    "hotjar.com", "sentry.io", "nr-data.net", "newrelic.com", "yjtag.jp", "criteo.com", "ladsp.com",
+]
+
+def blocked_patterns():
+    return BLOCKED_URL_PATTERNS + [f"*{host}*" for host in TRACKER_HOSTS]
+
+def is_blocked(url):
+    return any(fnmatch.fnmatch(url, pattern) for pattern in blocked_patterns())
+
+# Wait for the episode body instead of networkidle (trackers and the player keep the network busy)
+CONTENT_SELECTOR = "article"
+EPISODE_LINK_SELECTOR = "a.story-item-container"
+SHOW_MORE_TEXT = "もっと見る"
+# Episode media URL as it appears in <audio>/<source>, og:audio or the embedded app state.
+# Shared with the page script (RegExp), so keep it to syntax both engines accept.
+AUDIO_URL_PATTERN = r"https?://[^\s\"'<>\\]+?\.(?:mp3|m4a|aac)(?:\?[^\s\"'<>\\]*)?"
+
+# Runs in the page: expands "もっと見る", then returns {title, date, body, audio_url, expanded}.
+# body matches BeautifulSoup's get_text("\n", strip=True): stripped text nodes joined by newlines,
+# without <script>/<style>/<template> contents.
+EXTRACT_EPISODE_JS = """
+async ({showMoreText, audioPattern}) => {
+    const buttons = Array.from(document.querySelectorAll('button'))
+        .filter(b => b.textContent.includes(showMoreText) && b.getClientRects().length > 0);
+    for (const button of buttons) {
+        button.click();
+    }
+    if (buttons.length) {
+        await new Promise(resolve => setTimeout(resolve, 500));
+    }
+
+    // Trimmed text nodes of el without script/style, as BeautifulSoup's get_text(sep, strip=True) reads them,
+    // so titles (and the markdown file names) match extract_from_html
+    const strings = el => {
+        const parts = [];
+        const walker = document.createTreeWalker(el, NodeFilter.SHOW_TEXT, {
+            acceptNode: node => node.parentElement.closest('script, style, template, noscript')
+                ? NodeFilter.FILTER_REJECT : NodeFilter.FILTER_ACCEPT,
+        });
+        for (let node = walker.nextNode(); node; node = walker.nextNode()) {
+            const part = node.nodeValue.trim();
+            if (part) parts.push(part);
+        }
+        return parts;
+    };
+    const text = el => el ? strings(el).join('') : null;
+    const findAudioUrl = pattern => {
+        for (const el of document.querySelectorAll('audio[src], audio source[src]')) {
+            if (el.src) return el.src;
+        }
+        const meta = document.querySelector('meta[property="og:audio"], meta[property="og:audio:url"]');
+        if (meta && meta.content) return meta.content;
+        for (const script of document.querySelectorAll('script:not([src])')) {
+            const match = script.textContent.replace(/\\\\u002F|\\\\\//gi, '/').match(pattern);
+            if (match) return match[0];
+        }
+        return null;
+    };
+    const container = document.querySelector('article') || document.body;
+    return {
+        title: text(document.querySelector('h1')),
+        date: text(document.querySelector('time')),
+        body: container ? strings(container).join('\\n') : '',
+        audio_url: findAudioUrl(new RegExp(audioPattern)),
+        expanded: buttons.length,
+    };
+}
+"""
+CONTENT_TIMEOUT_MS = 15000
+
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
 async def auto_scroll(page):
@@ -30,60 +127,147 @@ async def auto_scroll(page):
         last_height = new_height
         print(f"Scrolled to height: {last_height}")
 
-async def process_episode(page, episode_url):
-    print(f"Processing: {episode_url}")
-    await page.goto(episode_url)
-    await page.wait_for_load_state("networkidle")
+async def new_scraping_context(session, block=True, archive=None):
+    """
+    Create one context + page that is reused for every episode.
 
-    # Expand transcription if available
-    try:
-        # Looking for "Show more" button. Selector might need adjustment based on actual site.
-        # Based on typical Voicy structure, there is often a button to expand text.
-        # We will try a generic approach or look for specific text.
-        show_more_buttons = await page.locator("button:has-text('もっと見る')").all()
-        for btn in show_more_buttons:
-            if await btn.is_visible():
-                await btn.click()
-                await page.wait_for_timeout(500)
-    except Exception as e:
-        print(f"Notice: Could not click 'Show more' (might not exist): {e}")
+    session is a browser_service.BrowserSession: the warm context of the browser service
+    when it is running, otherwise a fresh context with the saved cookies.
+    With block=True, images/fonts/media/stylesheets and tracker hosts are blocked.
+    With an HttpArchive, every request goes through it (record / replay / revalidate).
+    Returns (context, page, stats); stats counts transferred bytes and blocked requests.
+    """
+    context = await session.context(archive=archive)
+    if archive:
+        # Routed requests skip CDP blocking rules, so the archive aborts them itself
+        archive.skip = is_blocked if block else None
+        await archive.attach(context)
+    stats = {"bytes": 0, "requests": 0, "blocked": 0}
+    page = await new_scraping_page(session, context, stats, block=block)
+    return context, page, stats
+
+async def new_scraping_page(session, context, stats, block=True):
+    """Another page in a scraping context, with the same blocking rules and counted into stats."""
+    page = await session.new_page(context)
+    cdp = await context.new_cdp_session(page)
+    await cdp.send("Network.enable")
+    if block:
+        await cdp.send("Network.setBlockedURLs", {"urls": blocked_patterns()})
+
+    def on_finished(event):
+        stats["requests"] += 1
+        stats["bytes"] += event.get("encodedDataLength", 0)
+
+    def on_failed(event):
+        if event.get("blockedReason"):
+            stats["blocked"] += 1
+
+    cdp.on("Network.loadingFinished", on_finished)
+    cdp.on("Network.loadingFailed", on_failed)
+    return page
+
+async def scroll_episode_links(page, latest=False):
+    """
+    Yield new episode links from the list page as they appear, newest first.
 
-    content = await page.content()
-    soup = BeautifulSoup(content, 'html.parser')
+    Scrolls like auto_scroll, but hands each batch over immediately so episodes can be
+    processed while the rest of the list is still loading. latest=True yields only the newest.
+    """
+    print(f"Navigating to {ALL_EPISODES_URL}")
+    await page.goto(ALL_EPISODES_URL, wait_until="domcontentloaded")
+    await page.wait_for_selector(EPISODE_LINK_SELECTOR, timeout=CONTENT_TIMEOUT_MS)
+    seen = set()
+    last_height = None
+    while True:
+        links = await page.eval_on_selector_all(EPISODE_LINK_SELECTOR, "els => els.map(a => a.href)")
+        new = [l for l in dict.fromkeys(links) if f"/channel/{CHANNEL_ID}/" in l and l not in seen]
+        if latest:
+            yield new[:1]
+            return
+        seen.update(new)
+        if new:
+            yield new
+        height = await page.evaluate("document.body.scrollHeight")
+        if height == last_height:
+            # Try once more to be sure
+            await page.wait_for_timeout(2000)
+            if await page.evaluate("document.body.scrollHeight") == height:
+                return
+        last_height = height
+        await page.mouse.wheel(0, 5000)
+        await page.wait_for_timeout(2000)  # Wait for load
 
-    # Extract Metadata
+async def extract_episode(page, episode_url):
+    """Open an episode page and return its record ({title, date, body, audio_url, url})."""
+    print(f"Processing: {episode_url}")
+    await page.goto(episode_url, wait_until="domcontentloaded")
     try:
-        title = soup.select_one('h1').get_text(strip=True)
-    except:
-        title = "No Title"
+        await page.wait_for_selector(CONTENT_SELECTOR, timeout=CONTENT_TIMEOUT_MS)
+    except PlaywrightTimeoutError:
+        print(f"Notice: '{CONTENT_SELECTOR}' did not appear, extracting what is loaded")
 
+    # One round trip: expand, extract and return a compact record instead of the whole DOM
     try:
-        date_str = soup.select_one('time').get_text(strip=True)
-        # Convert date format if necessary. Voicy often uses "2023/12/30" or similar.
-        # Detailed parsing might be needed, but for now we keep the string or try simple normalization.
-        # Example format: 2023年12月30日 or 2023/12/30
-        date_match = re.search(r'(\d{4})[./年](\d{1,2})[./月](\d{1,2})', date_str)
-        if date_match:
-            date_obj = datetime(int(date_match.group(1)), int(date_match.group(2)), int(date_match.group(3)))
-            file_date = date_obj.strftime('%Y-%m-%d')
-        else:
-            file_date = datetime.now().strftime('%Y-%m-%d') # Fallback
-    except:
-        file_date = datetime.now().strftime('%Y-%m-%d')
-
-    # Extract Transcript/Summary
-    # This is highly dependent on DOM structure.
-    # Assuming 'article' class or similar container for main text.
-    main_text = ""
-    
+        record = await page.evaluate(EXTRACT_EPISODE_JS, {"showMoreText": SHOW_MORE_TEXT,
+                                                          "audioPattern": AUDIO_URL_PATTERN})
+    except Exception as e:
+        print(f"Notice: In-page extraction failed ({e}), parsing the HTML instead")
+        record = extract_from_html(await page.content())
+    if record.pop("expanded", 0):
+        print(f"Expanded {SHOW_MORE_TEXT}")
+    record["url"] = episode_url
+    return record
+
+async def process_episode(page, episode_url):
+    record = await extract_episode(page, episode_url)
+    return record, save_episode(record)
+
+def extract_from_html(html):
+    """Same extraction as EXTRACT_EPISODE_JS, for offline HTML files (and as a fallback)."""
+    soup = BeautifulSoup(html, 'html.parser')
+    title_el = soup.select_one('h1')
+    date_el = soup.select_one('time')
     # Strategy: Find the container that holds the text.
     # Often in Voicy: .story-comment or generic article body
     article_body = soup.select_one('article') or soup.body
-    if article_body:
-        main_text = article_body.get_text("\n", strip=True)
+    return {
+        "title": title_el.get_text(strip=True) if title_el else None,
+        "date": date_el.get_text(strip=True) if date_el else None,
+        "body": article_body.get_text("\n", strip=True) if article_body else "",
+        "audio_url": find_audio_url(soup),
+    }
+
+def find_audio_url(soup):
+    """Episode media URL: <audio>/<source>, og:audio, then the embedded app state."""
+    for el in soup.select('audio[src], audio source[src]'):
+        return el["src"]
+    meta = soup.select_one('meta[property="og:audio"], meta[property="og:audio:url"]')
+    if meta and meta.get("content"):
+        return meta["content"]
+    for script in soup.select('script:not([src])'):
+        text = re.sub(r'\\u002F|\\/', '/', script.string or "", flags=re.IGNORECASE)
+        match = re.search(AUDIO_URL_PATTERN, text)
+        if match:
+            return match.group(0)
+    return None
 
-    # Clean up text
-    # (Optional: specialized cleaning)
+def parse_date(date_str):
+    """Voicy dates look like 2023年12月30日 or 2023/12/30; falls back to today."""
+    date_match = re.search(r'(\d{4})[./年](\d{1,2})[./月](\d{1,2})', date_str or "")
+    if date_match:
+        date_obj = datetime(int(date_match.group(1)), int(date_match.group(2)), int(date_match.group(3)))
+        return date_obj.strftime('%Y-%m-%d')
+    return datetime.now().strftime('%Y-%m-%d')
+
+def markdown_path(record):
+    title = record.get("title") or "No Title"
+    safe_title = re.sub(r'[\\/*?:"<>|]', "", title).replace(" ", "_")
+    return f"{OUTPUT_DIR}/{parse_date(record.get('date'))}_{safe_title}.md"
+
+def write_markdown(record, quiet=False):
+    """Render one episode record ({title, date, body, url[, transcript]}) as its markdown view."""
+    title = record.get("title") or "No Title"
+    date_str = record.get("date") or ""
 
     # Format Markdown
     md_content = f"""# {title}
@@ -92,44 +276,146 @@ async def process_episode(page, episode_url):
 (自動取得された日付: {date_str})
 
 ## AI書き起こし
-{main_text}
+{record.get("body") or ""}
 """
-    
+    if record.get("transcript"):
+        md_content += f"""
+## 音声書き起こし
+{record["transcript"]}
+"""
+
     # Save File
-    safe_title = re.sub(r'[\\/*?:"<>|]', "", title).replace(" ", "_")
-    filename = f"{OUTPUT_DIR}/{file_date}_{safe_title}.md"
-    
+    filename = markdown_path(record)
     with open(filename, "w", encoding="utf-8") as f:
         f.write(md_content)
-    print(f"Saved: {filename}")
-
-async def main():
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=True)
-        context = await browser.new_context()
-        page = await context.new_page()
-
-        # 1. Fetch List
-        print(f"Navigating to {ALL_EPISODES_URL}")
-        await page.goto(ALL_EPISODES_URL)
-        await auto_scroll(page)
-
-        # Extract all episode links
-        episode_links = await page.evaluate("""
-            Array.from(document.querySelectorAll('a.story-item-container')).map(a => a.href)
-        """)
+    if not quiet:
+        print(f"Saved: {filename}")
+    return filename
+
+def save_episode(record):
+    """
+    Save one extracted episode record ({title, date, body, url[, transcript]}).
+
+    The record is appended to the consolidated store (episode_store.py), then the markdown
+    view is written and the search index updated.
+    """
+    filename = markdown_path(record)
+    episode_store.put(record, markdown_name=os.path.basename(filename))
+    write_markdown(record)
+    episode_index.update(filename, url=record.get("url"))
+    return filename
+
+async def main(latest=False, block=True, http_cache="off", audio_dir=None, transcribe=False):
+    archive = HttpArchive(mode=http_cache) if http_cache != "off" else None
+    # Audio downloads run alongside scraping; with transcribe, each file is transcribed as soon as it lands
+    audio_queue = asyncio.Queue() if transcribe else None
+    pending = {}  # audio path -> episode record, so each transcript is saved with its episode
+
+    def save_transcript(path, text):
+        record = pending.pop(path, None)
+        if record is not None:
+            save_episode({**record, "transcript": text})
+
+    transcriber = asyncio.create_task(transcribe_from_queue(audio_queue, save_transcript)) if transcribe else None
+    downloader = AudioDownloader(audio_dir, queue=audio_queue) if audio_dir else None
+    async with async_playwright() as p, (downloader or contextlib.nullcontext()):
+        async with open_browser(p) as session:
+            # The list page also warms the context (DNS/TLS, app bundles in the HTTP cache)
+            context, page, stats = await new_scraping_context(session, block=block, archive=archive)
+
+            # 1. Fetch List
+            print(f"Navigating to {ALL_EPISODES_URL}")
+            await page.goto(ALL_EPISODES_URL, wait_until="domcontentloaded")
+            await page.wait_for_selector(EPISODE_LINK_SELECTOR, timeout=CONTENT_TIMEOUT_MS)
+            if not latest:
+                await auto_scroll(page)
+
+            # Extract all episode links
+            episode_links = await page.eval_on_selector_all(EPISODE_LINK_SELECTOR, "els => els.map(a => a.href)")
         
-        # Filter for unique links and ensuring they match pattern
-        unique_links = sorted(list(set([l for l in episode_links if f"/channel/{CHANNEL_ID}/" in l])))
-        print(f"Found {len(unique_links)} episodes.")
+            # Filter for unique links and ensuring they match pattern
+            episode_links = [l for l in episode_links if f"/channel/{CHANNEL_ID}/" in l]
+            if latest:
+                # The list is newest first
+                unique_links = episode_links[:1]
+            else:
+                unique_links = sorted(list(set(episode_links)))
+            print(f"Found {len(unique_links)} episodes.")
+
+            # 2. Process Each Episode
+            list_bytes = stats["bytes"]
+            durations = []
+            for url in unique_links:
+                # Check if likely already processed (optional optimization could be added here)
+                started = time.perf_counter()
+                record, filename = await process_episode(page, url)
+                durations.append(time.perf_counter() - started)
+                if downloader:
+                    if record.get("audio_url"):
+                        name = os.path.splitext(os.path.basename(filename))[0]
+                        pending[downloader.out_dir / filename_for(record["audio_url"], name)] = record
+                        downloader.submit(record["audio_url"], name=name)
+                    else:
+                        print(f"Notice: No audio URL found for {url}")
+                if http_cache != "replay":
+                    await page.wait_for_timeout(1000) # Polite delay
+
+        if downloader:
+            await downloader.wait()
 
-        # 2. Process Each Episode
-        for url in unique_links:
-            # Check if likely already processed (optional optimization could be added here)
-            await process_episode(page, url)
-            await page.wait_for_timeout(1000) # Polite delay
+    if durations:
+        episode_bytes = stats["bytes"] - list_bytes
+        print(f"Episodes: {len(durations)}, avg {sum(durations) / len(durations):.2f}s, max {max(durations):.2f}s")
+        print(f"Transferred: {stats['bytes'] / 1024 / 1024:.1f} MB "
+              f"({episode_bytes / len(durations) / 1024:.0f} KB/episode), "
+              f"requests: {stats['requests']}, blocked: {stats['blocked']}")
+    if archive:
+        archive.print_stats()
+    if downloader:
+        downloader.print_stats()
+    if transcriber:
+        await audio_queue.put(None)
+        await transcriber
 
-        await browser.close()
+def extract_archived(pattern=f"{BASE_URL}/*"):
+    """Re-run the HTML extraction over every archived episode page, without a browser."""
+    archive = HttpArchive(mode="replay")
+    started = time.perf_counter()
+    count = 0
+    for entry in archive.entries(pattern):
+        if entry["url"].startswith(ALL_EPISODES_URL) or "text/html" not in entry["headers"].get("content-type", ""):
+            continue
+        html = archive.body(entry).decode("utf-8", errors="replace")
+        save_episode({**extract_from_html(html), "url": entry["url"]})
+        count += 1
+    elapsed = time.perf_counter() - started
+    print(f"Extracted {count} archived episodes in {elapsed:.2f}s")
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    parser = argparse.ArgumentParser(description="Fetch all Voicy episodes of the channel into markdown.")
+    parser.add_argument("--latest", action="store_true", help="Only process the newest episode (no infinite scroll)")
+    parser.add_argument("--no-block", action="store_true",
+                        help="Load images, fonts, media, stylesheets and trackers (for debugging selectors)")
+    parser.add_argument("--from-html", nargs="+", metavar="FILE",
+                        help="Extract saved episode HTML files without a browser")
+    parser.add_argument("--http-cache", choices=HTTP_CACHE_MODES, default=os.environ.get("VOICY_HTTP_CACHE", "off"),
+                        help="record: archive responses / replay: serve only from the archive (no network) / "
+                             "revalidate: conditional requests against the archive (see http_archive.py)")
+    parser.add_argument("--from-archive", action="store_true",
+                        help="Extract every archived episode page without a browser (parser regression runs)")
+    parser.add_argument("--audio", nargs="?", const=AUDIO_DIR, metavar="DIR",
+                        help=f"Also download each episode's audio (default dir: {AUDIO_DIR}, see audio_download.py)")
+    parser.add_argument("--transcribe", action="store_true",
+                        help="Transcribe downloaded audio while scraping continues and add it to the episode "
+                             "(implies --audio)")
+    args = parser.parse_args()
+    if args.from_html:
+        for path in args.from_html:
+            with open(path, "r", encoding="utf-8") as f:
+                save_episode({**extract_from_html(f.read()), "url": None})
+    elif args.from_archive:
+        extract_archived()
+    else:
+        audio_dir = args.audio or (AUDIO_DIR if args.transcribe else None)
+        asyncio.run(main(latest=args.latest, block=not args.no_block, http_cache=args.http_cache,
+                         audio_dir=audio_dir, transcribe=args.transcribe))
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+プロバイダのバッチジョブ（batchGenerateContent）による非同期一括生成
+
+全アイテムを1つのバッチジョブにまとめて投入し、完了までバックオフ付きでポーリングして、
+結果を1件ずつ出力先へ書き出す。数百件でも接続はポーリングの1本だけで済み、
+同期呼び出しより安価に処理される（完了までの時間は保証されない）。
+
+投入したジョブは manifest.json の batch_jobs に記録する。途中で止めても再実行すれば
+同じジョブの完了を待って回収し、二重投入はしない。
+inline リクエストの上限を超える場合はサイズで分割して複数ジョブにする。
+
+環境変数:
+    GEMINI_BATCH_POLL    最初のポーリング間隔秒 (default: 15、以後 1.5 倍ずつ最大 300 秒)
+"""
+
+import json
+import os
+import time
+from datetime import datetime
+
+from google.genai import types
+
+import preflight
+
+INLINE_LIMIT_BYTES = 16 * 1024 * 1024  # API の inline 上限 (20MB) に余裕を持たせる
+POLL_INITIAL = float(os.environ.get("GEMINI_BATCH_POLL", "15"))
+POLL_MAX = 300.0
+POLL_FACTOR = 1.5
+
+SUCCEEDED = "JOB_STATE_SUCCEEDED"
+TERMINAL_STATES = {SUCCEEDED, "JOB_STATE_FAILED", "JOB_STATE_CANCELLED", "JOB_STATE_EXPIRED"}
+
+
+def _state(job) -> str:
+    return getattr(job.state, "value", None) or str(job.state)
+
+
+def pack(requests: list[dict], limit: int = INLINE_LIMIT_BYTES) -> list[list[dict]]:
+    """inline 上限に収まるようにリクエストをジョブ単位に分割"""
+    chunks, current, current_size = [], [], 0
+    for request in requests:
+        size = preflight.payload_bytes(request["contents"])
+        if current and current_size + size > limit:
+            chunks.append(current)
+            current, current_size = [], 0
+        current.append(request)
+        current_size += size
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def submit(client, model: str, requests: list[dict], display_name: str):
+    """requests（id / contents / config）を1ジョブとして投入"""
+    src = [
+        types.InlinedRequest(contents=r["contents"], config=r["config"], metadata={"key": r["id"]})
+        for r in requests
+    ]
+    return client.batches.create(model=model, src=src, config={"display_name": display_name})
+
+
+def wait(client, name: str, initial: float = POLL_INITIAL, maximum: float = POLL_MAX):
+    """完了（成功・失敗・取消・期限切れ）までバックオフ付きでポーリング"""
+    started = time.monotonic()
+    interval = initial
+    last_state = None
+    while True:
+        job = client.batches.get(name=name)
+        state = _state(job)
+        if state != last_state:
+            print(f"⏳ {name}: {state} ({time.monotonic() - started:.0f}s)")
+            last_state = state
+        if state in TERMINAL_STATES:
+            return job
+        time.sleep(interval)
+        interval = min(maximum, interval * POLL_FACTOR)
+
+
+def iter_results(client, job):
+    """(key, response, error) を1件ずつ返す（inline / 結果ファイルの両方に対応）"""
+    dest = job.dest
+    if dest is None:
+        return
+    if dest.inlined_responses:
+        for item in dest.inlined_responses:
+            yield (item.metadata or {}).get("key"), item.response, item.error
+        return
+    if dest.file_name:
+        data = client.files.download(file=dest.file_name)
+        for line in data.decode("utf-8").splitlines():
+            if not line.strip():
+                continue
+            row = json.loads(line)
+            key = row.get("key") or (row.get("metadata") or {}).get("key")
+            response = None
+            if "response" in row:
+                response = types.GenerateContentResponse.model_validate_json(json.dumps(row["response"]))
+            yield key, response, row.get("error")
+
+
+def run_batch(
+    client,
+    manifest,
+    phase: str,
+    model: str,
+    requests: list[dict],
+    save_result,
+    display_name: str = "gemini-image",
+    poll_initial: float = POLL_INITIAL,
+) -> dict:
+    """
+    バッチジョブで生成して結果を保存する
+
+    Args:
+        manifest: draft_pipeline.BatchManifest（ジョブの記録先）
+        phase: ジョブの種別（draft / final / direct）。再開時の照合に使う
+        requests: {"id", "hash", "contents", "config"} のリスト
+        save_result: save_result(item_id, response) -> bool。画像の保存とマニフェスト更新を行う
+
+    Returns:
+        dict: rendered / failed / stale / jobs
+    """
+    stats = {"rendered": 0, "failed": 0, "stale": 0, "jobs": 0}
+    current = {r["id"]: r["hash"] for r in requests}
+    jobs = manifest.data.setdefault("batch_jobs", [])
+
+    # 未回収のジョブに含まれる（同じ内容の）アイテムは再投入しない
+    outstanding = [j for j in jobs if j["phase"] == phase and not j.get("collected")]
+    covered = {(item_id, h) for j in outstanding for item_id, h in j["items"].items()}
+    if outstanding:
+        print(f"🔁 Resuming {len(outstanding)} batch job(s) from manifest")
+
+    # 画像のエンコード・縮小と上限チェックは同期呼び出しと同じ preflight で行う
+    to_submit = []
+    for r in requests:
+        if (r["id"], r["hash"]) in covered:
+            continue
+        try:
+            contents, _ = client.models.preflight.check(model, r["contents"], r["config"])
+        except preflight.PreflightError as e:
+            print(f"❌ {r['id']}: {e}")
+            stats["failed"] += 1
+            continue
+        to_submit.append({**r, "contents": contents})
+    for chunk in pack(to_submit):
+        job = submit(client, model, chunk, f"{display_name}-{phase}")
+        record = {
+            "name": job.name,
+            "phase": phase,
+            "model": model,
+            "items": {r["id"]: r["hash"] for r in chunk},
+            "submitted_at": datetime.now().isoformat(timespec="seconds"),
+        }
+        jobs.append(record)
+        outstanding.append(record)
+        manifest.save()
+        print(f"📦 Submitted {job.name} ({len(chunk)} items, {model})")
+
+    for record in outstanding:
+        stats["jobs"] += 1
+        job = wait(client, record["name"], initial=poll_initial)
+        state = _state(job)
+        record["state"] = state
+        if state != SUCCEEDED:
+            print(f"❌ {record['name']} ended with {state}")
+            stats["failed"] += len(record["items"])
+            record["collected"] = True
+            manifest.save()
+            continue
+
+        seen = set()
+        for key, response, error in iter_results(client, job):
+            seen.add(key)
+            if current.get(key) != record["items"].get(key):
+                # 投入後にプロンプトが変わった・既に別の方法で生成済み
+                stats["stale"] += 1
+                continue
+            if error or response is None:
+                print(f"❌ {key}: {error}")
+                stats["failed"] += 1
+                continue
+            if save_result(key, response):
+                stats["rendered"] += 1
+            else:
+                print(f"⚠️ {key}: no image in response")
+                stats["failed"] += 1
+        stats["failed"] += len(set(record["items"]) - seen)
+        record["collected"] = True
+        record["collected_at"] = datetime.now().isoformat(timespec="seconds")
+        manifest.save()
+
+    return stats
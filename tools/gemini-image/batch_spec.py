@@ -0,0 +1,421 @@
+#!/usr/bin/env python3
+"""
+宣言的なバッチ仕様（spec YAML）からインフォグラフィックを一括生成
+
+スタイルは defaults → preset（extends で継承可）→ アイテムの順に解決する。
+model / aspect_ratio などの値は後の段が上書きし、style の行は後の段が追記する。
+プリセットは実行ごとに1回だけ解決し、参照画像も1回だけ読み込む。
+
+--dry-run では送信せずに計画だけを表示する。解決後に内容が同一のリクエストは
+1回だけ送り（結果は重複アイテムへコピー）、生成済みのアイテムはスキップする。
+
+spec 形式:
+    output_dir: output/images_pro      # 省略時は output/<spec名>
+    defaults:
+      model: gemini-3-pro-image-preview
+      aspect_ratio: "16:9"             # null なら image_config を送らない
+      image_size: 2K                   # image_size 対応モデルのみ
+      preset: cream-paper
+    presets:
+      cream-paper:
+        extends: notebook              # infographic.py の STYLE_PRESETS も使える
+        intro: Create a hand-drawn educational infographic.
+        style_header: "Visual Style Requirements (MUST FOLLOW EXACTLY):"
+        style:
+          - Cream/beige textured paper background
+    items:
+      - id: 01_ai_agent
+        title: AIエージェント全体像
+        style: [Split A/B comparison layout]   # preset の style に追記
+        prompt: |
+          Title at top: ...
+
+Usage:
+    python batch_spec.py specs/seminar_pro.yaml --dry-run
+    python batch_spec.py specs/seminar_pro.yaml [--batch] [--force] [--only ID ...]
+    python batch_spec.py specs/seminar_with_ref.yaml --ref reference.png
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+from pathlib import Path
+
+import yaml
+from dotenv import load_dotenv
+from google.genai import types
+from PIL import Image
+
+import credential_pool
+import draft_pipeline
+import preflight
+import scheduler
+from circuit_breaker import IMAGE_SIZE_MODELS
+from gemini_client import create_client
+from infographic import STYLE_PRESETS
+
+load_dotenv()
+
+BUILTIN_DEFAULTS = {
+    "model": "gemini-3-pro-image-preview",
+    "aspect_ratio": "16:9",
+    "image_size": "2K",
+    "style_header": "Style:",
+}
+SCALAR_KEYS = ("model", "aspect_ratio", "image_size", "reference", "intro", "style_header")
+REFERENCE_INTRO = "Use this image as a style reference. Match the exact visual style, colors, and hand-drawn aesthetic:"
+REFERENCE_OUTRO = "\nNow create a new infographic with the following content:\n"
+
+
+class SpecError(ValueError):
+    """spec の記述が不正"""
+
+
+def load_spec(path: str | Path) -> dict:
+    with open(path, "r", encoding="utf-8") as f:
+        spec = yaml.safe_load(f) or {}
+    if not spec.get("items"):
+        raise SpecError(f"{path}: items が空です")
+    return spec
+
+
+def _style_lines(value) -> list[str]:
+    """style は行のリストまたは "- " 区切りのブロック文字列"""
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = value.strip().splitlines()
+    return [line.strip().removeprefix("- ") for line in value if line.strip()]
+
+
+def builtin_presets() -> dict:
+    """infographic.py の STYLE_PRESETS を spec のプリセットとして使う"""
+    return {
+        name: {"style": [preset["aesthetic"], preset["texture"], preset["vibe"], preset["imperfection"]]}
+        for name, preset in STYLE_PRESETS.items()
+    }
+
+
+class PresetResolver:
+    """extends を辿ってプリセットを解決（結果はキャッシュ）"""
+
+    def __init__(self, presets: dict):
+        self.presets = {**builtin_presets(), **(presets or {})}
+        self._cache = {}
+
+    def resolve(self, name: str | None, chain: tuple = ()) -> dict:
+        if not name:
+            return {"style": []}
+        if name in self._cache:
+            return self._cache[name]
+        if name in chain:
+            raise SpecError(f"preset の extends が循環しています: {' -> '.join(chain + (name,))}")
+        if name not in self.presets:
+            raise SpecError(f"未定義の preset: {name}")
+
+        raw = self.presets[name]
+        base = self.resolve(raw.get("extends"), chain + (name,))
+        resolved = {**base, **{k: raw[k] for k in SCALAR_KEYS if k in raw}}
+        resolved["style"] = base["style"] + _style_lines(raw.get("style"))
+        self._cache[name] = resolved
+        return resolved
+
+
+def _file_digest(path: Path) -> str:
+    return hashlib.sha256(path.read_bytes()).hexdigest()[:16]
+
+
+def resolve_items(spec: dict, only: list[str] | None = None, reference: str | None = None) -> list[dict]:
+    """
+    全アイテムを defaults → preset → アイテムの順に解決する
+
+    Returns:
+        {"id", "title", "model", "aspect_ratio", "image_size", "reference", "prompt",
+         "preamble_bytes", "key"} のリスト
+    """
+    resolver = PresetResolver(spec.get("presets"))
+    defaults = {**BUILTIN_DEFAULTS, **(spec.get("defaults") or {})}
+    digests = {}
+    items = []
+    seen_ids = set()
+
+    for raw in spec["items"]:
+        item_id = raw.get("id")
+        if not item_id or not raw.get("prompt"):
+            raise SpecError(f"id と prompt は必須です: {raw}")
+        if item_id in seen_ids:
+            raise SpecError(f"id が重複しています: {item_id}")
+        seen_ids.add(item_id)
+        if only and item_id not in only:
+            continue
+
+        preset = resolver.resolve(raw.get("preset", defaults.get("preset")))
+        merged = {k: defaults.get(k) for k in SCALAR_KEYS}
+        merged.update({k: v for k, v in preset.items() if k != "style"})
+        merged.update({k: raw[k] for k in SCALAR_KEYS if k in raw})
+        if reference is not None:
+            merged["reference"] = reference
+        style = _style_lines(defaults.get("style")) + preset["style"] + _style_lines(raw.get("style"))
+
+        preamble = []
+        if merged["intro"]:
+            preamble.append(merged["intro"].strip())
+        if style:
+            preamble.append(merged["style_header"] + "\n" + "\n".join(f"- {line}" for line in style))
+        prompt = "\n\n".join(preamble + [raw["prompt"].strip()]) + "\n"
+
+        ref_path = Path(merged["reference"]).expanduser() if merged["reference"] else None
+        if ref_path and not ref_path.exists():
+            print(f"⚠️ Reference image not found, ignored: {ref_path}")
+            ref_path = None
+        if ref_path and ref_path not in digests:
+            digests[ref_path] = _file_digest(ref_path)
+
+        image_size = merged["image_size"] if merged["model"] in IMAGE_SIZE_MODELS else None
+        key_source = {
+            "model": merged["model"],
+            "aspect_ratio": merged["aspect_ratio"],
+            "image_size": image_size,
+            "reference": digests.get(ref_path),
+            "prompt": prompt,
+        }
+        items.append({
+            "id": item_id,
+            "title": raw.get("title", item_id),
+            "model": merged["model"],
+            "aspect_ratio": merged["aspect_ratio"],
+            "image_size": image_size,
+            "reference": ref_path,
+            "prompt": prompt,
+            "preamble_bytes": len("\n\n".join(preamble).encode("utf-8")),
+            "key": hashlib.sha256(json.dumps(key_source, ensure_ascii=False).encode("utf-8")).hexdigest()[:16],
+        })
+    return items
+
+
+def request_config(item: dict) -> types.GenerateContentConfig:
+    params = {"response_modalities": ["TEXT", "IMAGE"]}
+    if item["aspect_ratio"] or item["image_size"]:
+        params["image_config"] = types.ImageConfig(
+            aspect_ratio=item["aspect_ratio"],
+            image_size=item["image_size"],
+        )
+    return types.GenerateContentConfig(**params)
+
+
+def request_contents(item: dict, images: dict) -> list:
+    """contents を組み立てる（参照画像は images にキャッシュして使い回す）"""
+    if not item["reference"]:
+        return [item["prompt"]]
+    if item["reference"] not in images:
+        images[item["reference"]] = Image.open(item["reference"])
+    return [REFERENCE_INTRO, images[item["reference"]], REFERENCE_OUTRO, item["prompt"]]
+
+
+def payload_bytes(item: dict) -> int:
+    """1リクエストの送信サイズの概算（参照画像は base64 換算）"""
+    size = len(item["prompt"].encode("utf-8"))
+    if item["reference"]:
+        size += len(REFERENCE_INTRO) + len(REFERENCE_OUTRO)
+        size += (item["reference"].stat().st_size + 2) // 3 * 4
+    return size
+
+
+def estimated_tokens(item: dict, images: dict) -> int:
+    """入力＋出力画像のトークン数の見積もり（preflight と同じ計算）"""
+    contents = request_contents(item, images)
+    return preflight.estimate_input_tokens(item["model"], contents) + preflight.output_tokens(
+        item["model"], request_config(item)
+    )
+
+
+def plan(items: list[dict], output_dir: Path, force: bool = False) -> dict:
+    """
+    送信計画を立てる
+
+    Returns:
+        dict: send（送るアイテム）/ duplicates（重複 id → 代表 id）/ up_to_date（スキップする id）/
+              calls / payload_bytes / preamble_bytes / tokens
+    """
+    images = {}
+    for item in items:
+        item["tokens"] = estimated_tokens(item, images)
+    manifest = draft_pipeline.BatchManifest(Path(output_dir) / draft_pipeline.MANIFEST_NAME)
+    primary_by_key = {}
+    duplicates = {}
+    up_to_date = []
+    send = []
+
+    for item in items:
+        path = Path(output_dir) / f"{item['id']}.png"
+        fresh = not force and draft_pipeline.final_up_to_date(
+            manifest.item(item["id"]), item["key"], item["image_size"] or "default", path, item["model"]
+        )
+        if item["key"] in primary_by_key:
+            duplicates[item["id"]] = primary_by_key[item["key"]]["id"]
+            if fresh:
+                up_to_date.append(item["id"])
+            continue
+        primary_by_key[item["key"]] = item
+        if fresh:
+            up_to_date.append(item["id"])
+        else:
+            send.append(item)
+
+    return {
+        "items": items,
+        "send": send,
+        "duplicates": duplicates,
+        "up_to_date": up_to_date,
+        "calls": len(send),
+        "payload_bytes": sum(payload_bytes(item) for item in send),
+        "preamble_bytes": sum(item["preamble_bytes"] for item in send),
+        "tokens": sum(item["tokens"] for item in send),
+    }
+
+
+def _kb(n: int) -> str:
+    return f"{n / 1024:.1f} KB"
+
+
+def print_plan(result: dict):
+    items = result["items"]
+    print(f"{'ID':<30} {'model':<28} {'aspect':<7} {'size':<5} {'bytes':>9} {'tokens':>7}  action")
+    send_ids = {item["id"] for item in result["send"]}
+    for item in items:
+        if item["id"] in send_ids:
+            action = "send"
+        elif item["id"] in result["duplicates"]:
+            action = f"= {result['duplicates'][item['id']]}"
+        else:
+            action = "up to date"
+        print(f"{item['id']:<30} {item['model']:<28} {item['aspect_ratio'] or '-':<7} "
+              f"{item['image_size'] or '-':<5} {payload_bytes(item):>9} {item['tokens']:>7}  {action}")
+    print()
+    print(f"📋 {len(items)} items → {len(items) - len(result['duplicates'])} unique requests, "
+          f"{len(result['duplicates'])} duplicates, {len(result['up_to_date'])} up to date")
+    print(f"📤 {result['calls']} API calls, payload {_kb(result['payload_bytes'])} "
+          f"(style preamble {_kb(result['preamble_bytes'])}), ~{result['tokens']} tokens")
+
+
+def _copy_duplicates(output_dir: Path, duplicates: dict):
+    """重複アイテムに代表アイテムの結果をコピーしてマニフェストにも記録"""
+    manifest = draft_pipeline.BatchManifest(output_dir / draft_pipeline.MANIFEST_NAME)
+    for dup_id, primary_id in duplicates.items():
+        entry = manifest.item(primary_id)
+        src = output_dir / f"{primary_id}.png"
+        if not src.exists() or "final_hash" not in entry:
+            continue
+        dst = output_dir / f"{dup_id}.png"
+        shutil.copyfile(src, dst)
+        manifest.item(dup_id).update({
+            **{k: entry[k] for k in ("final_hash", "final_size", "final_model", "finalized_at") if k in entry},
+            "final_path": str(dst),
+        })
+    manifest.save()
+
+
+def run(client, result: dict, output_dir: Path, batch: bool = False, display_name: str = "gemini-image") -> dict:
+    """計画どおりに生成（モデルごとに同期 or バッチジョブ）。スキップ判定は plan で済んでいる"""
+    images = {}
+    stats = {"rendered": 0, "skipped": len(result["up_to_date"]), "failed": 0}
+    by_model = {}
+    for item in result["send"]:
+        by_model.setdefault(item["model"], []).append({
+            "id": item["id"],
+            "title": item["title"],
+            "hash": item["key"],
+            "size": item["image_size"] or "default",
+            "contents": request_contents(item, images),
+            "config": request_config(item),
+        })
+
+    for model, requests in by_model.items():
+        if batch:
+            model_stats = draft_pipeline.run_direct_batch(
+                client, model, requests, output_dir, force=True, display_name=display_name
+            )
+        else:
+            model_stats = draft_pipeline.run_direct(client, model, requests, output_dir, force=True)
+        stats["rendered"] += model_stats["rendered"]
+        stats["failed"] += model_stats["failed"]
+
+    if result["duplicates"]:
+        _copy_duplicates(output_dir, result["duplicates"])
+    return stats
+
+
+def main(argv: list[str] | None = None, default_spec: Path | None = None, description: str | None = None):
+    parser = argparse.ArgumentParser(description=description or "spec YAML からインフォグラフィックを一括生成")
+    parser.add_argument("spec", nargs="?" if default_spec else None, default=default_spec, help="spec YAML")
+    parser.add_argument("--dry-run", action="store_true", help="送信せずに呼び出し回数・送信量を表示")
+    parser.add_argument("--batch", action="store_true", help="バッチジョブで投入して完了までポーリング")
+    parser.add_argument("--force", action="store_true", help="生成済みでも作り直す")
+    parser.add_argument("--only", nargs="+", metavar="ID", help="指定アイテムだけ生成")
+    parser.add_argument("--ref", help="参照画像（spec の reference を上書き）")
+    parser.add_argument("--output-dir", help="出力先（spec の output_dir を上書き）")
+    args = parser.parse_args(argv)
+
+    spec_path = Path(args.spec)
+    try:
+        spec = load_spec(spec_path)
+        items = resolve_items(spec, only=args.only, reference=args.ref)
+    except SpecError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+
+    output_dir = Path(
+        args.output_dir
+        or os.environ.get("GEMINI_IMAGE_OUTPUT_DIR")
+        or spec.get("output_dir")
+        or Path("output") / spec_path.stem
+    ).expanduser()
+
+    print("=" * 60)
+    print(f"📊 {spec.get('title', spec_path.stem)}")
+    print("=" * 60)
+    print(f"出力先: {output_dir}")
+    print(f"生成数: {len(items)}枚")
+    print()
+
+    result = plan(items, output_dir, force=args.force)
+    print_plan(result)
+    if args.dry_run:
+        return
+
+    api_key = os.environ.get("GEMINI_API_KEY") or os.environ.get("GOOGLE_API_KEY")
+    if not api_key and not credential_pool.configured():
+        print("❌ GEMINI_API_KEY または GOOGLE_API_KEY が設定されていません")
+        print("   export GEMINI_API_KEY=your_key")
+        sys.exit(1)
+
+    # 大量レンダリングは対話的な呼び出しに順番を譲る
+    scheduler.set_default("bulk")
+    client = create_client(api_key=api_key)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    stats = run(client, result, output_dir, batch=args.batch, display_name=spec_path.stem)
+
+    print("\n" + "=" * 60)
+    print("📋 生成結果")
+    print("=" * 60)
+    print(f"成功: {stats['rendered']}, スキップ: {stats['skipped']}, 失敗: {stats['failed']}")
+
+    manifest = draft_pipeline.BatchManifest(output_dir / draft_pipeline.MANIFEST_NAME)
+    for item in items:
+        entry = manifest.item(item["id"])
+        ok = entry.get("final_hash") == item["key"] and (output_dir / f"{item['id']}.png").exists()
+        model = f" ({entry.get('final_model')})" if ok and entry.get("final_model") else ""
+        print(f"  {'✅' if ok else '❌'} {item['title']}{model}")
+
+    if client.pool:
+        print()
+        client.pool.print_stats()
+
+    print("\n完了！")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""
+gemini-image ツールのベンチマーク
+
+mock_server.py をローカルで起動し、各ツールのバッチ経路をバッチサイズごとに
+別プロセスで実行して、スループット・p50/p95/p99 レイテンシ・ピーク RSS を計測する。
+--baseline で前回の結果と比較し、劣化があれば終了コード 1 を返す。
+
+Usage:
+    python bench.py                                   # 全ツール、バッチ 1/10/50
+    python bench.py --tools chat --batch-sizes 5 20
+    python bench.py --latency lognormal --latency-ms 500 --rate-429 0.05
+    python bench.py --json bench.json                 # 結果を保存
+    python bench.py --baseline bench.json             # 劣化検知
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from mock_server import MockGeminiServer, add_mock_arguments, config_from_args
+
+HERE = Path(__file__).resolve().parent
+
+
+def percentile(values: list[float], pct: float) -> float | None:
+    """nearest-rank 法のパーセンタイル"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, min(len(ordered), round(pct / 100 * len(ordered) + 0.5)))
+    return ordered[rank - 1]
+
+
+def peak_rss_mb() -> float:
+    import resource
+
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux は KB、macOS は bytes
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+# --- ワーカー（サブプロセス内で実行） ---
+
+
+def _timed(fn) -> tuple[float, bool]:
+    """
+    fn の所要時間と成否
+
+    API / HTTP のエラーだけをリクエストの失敗として数える。それ以外の例外
+    （AttributeError など経路自体が壊れている場合）はそのまま送出してベンチを止める。
+    """
+    import httpx
+    from google.genai import errors
+
+    from circuit_breaker import CircuitOpenError
+
+    started = time.perf_counter()
+    try:
+        ok = bool(fn())
+    except (errors.APIError, httpx.HTTPError, CircuitOpenError):
+        ok = False
+    return time.perf_counter() - started, ok
+
+
+def _run_generate_from_yaml(n: int, out_dir: Path) -> list:
+    import generate_from_yaml
+    from gemini_client import create_client
+
+    client = create_client()
+    return [
+        _timed(lambda i=i: generate_from_yaml.generate_image(
+            client, f"bench prompt {i}", str(out_dir / f"yaml_{i:04d}.png"), "16:9", "2K"
+        ))
+        for i in range(n)
+    ]
+
+
+def _run_generate_all(n: int, out_dir: Path) -> list:
+    import batch_spec
+    import generate_all
+    from gemini_client import create_client
+
+    # generate_all.py と同じ spec（defaults・presets）で、アイテムだけベンチ用に差し替える
+    spec = batch_spec.load_spec(generate_all.SPEC)
+    spec["items"] = [{"id": f"bench_{i:04d}", "title": f"bench {i}", "prompt": f"bench prompt {i}"} for i in range(n)]
+    items = batch_spec.resolve_items(spec)
+    client = create_client()
+
+    def render(item: dict) -> bool:
+        result = batch_spec.plan([item], out_dir, force=True)
+        return batch_spec.run(client, result, out_dir)["rendered"] == 1
+
+    return [_timed(lambda item=item: render(item)) for item in items]
+
+
+def _run_chat(n: int, out_dir: Path) -> list:
+    import chat
+
+    os.chdir(out_dir)
+    session = chat.ImageChat()
+    return [_timed(lambda i=i: session.send(f"bench turn {i}")["image_path"]) for i in range(n)]
+
+
+TOOLS = {
+    "generate_from_yaml": _run_generate_from_yaml,
+    "generate_all": _run_generate_all,
+    "chat": _run_chat,
+}
+
+
+def run_worker(tool: str, n: int) -> dict:
+    sys.path.insert(0, str(HERE))
+    with tempfile.TemporaryDirectory() as tmp:
+        started = time.perf_counter()
+        # ツールの進捗表示は計測の邪魔なので捨てる
+        with contextlib.redirect_stdout(io.StringIO()):
+            samples = TOOLS[tool](n, Path(tmp))
+        elapsed = time.perf_counter() - started
+    return {
+        "latencies": [lat for lat, ok in samples if ok],
+        "errors": sum(1 for _, ok in samples if not ok),
+        "elapsed": elapsed,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+# --- 親プロセス ---
+
+
+def bench_one(tool: str, n: int, base_url: str) -> dict:
+    env = {**os.environ, "GOOGLE_GEMINI_BASE_URL": base_url, "GEMINI_API_KEY": "mock"}
+    # 単一のモックキーで計測する（クレデンシャルプールの設定は無効化）
+    env["GEMINI_CREDENTIALS_FILE"] = os.devnull
+    for name in ("GOOGLE_API_KEY", "GEMINI_API_KEYS"):
+        env.pop(name, None)
+    proc = subprocess.run(
+        [sys.executable, str(HERE / "bench.py"), "--worker", tool, "--batch", str(n)],
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"{tool} (batch {n}) failed:\n{proc.stderr[-2000:]}")
+    raw = json.loads(proc.stdout.strip().splitlines()[-1])
+    lat = raw["latencies"]
+    return {
+        "tool": tool,
+        "batch": n,
+        "ok": len(lat),
+        "errors": raw["errors"],
+        "elapsed_s": round(raw["elapsed"], 3),
+        "throughput": round(len(lat) / raw["elapsed"], 3) if raw["elapsed"] else 0.0,
+        "p50_ms": _ms(percentile(lat, 50)),
+        "p95_ms": _ms(percentile(lat, 95)),
+        "p99_ms": _ms(percentile(lat, 99)),
+        "peak_rss_mb": round(raw["peak_rss_mb"], 1),
+    }
+
+
+def _ms(seconds: float | None) -> float | None:
+    return None if seconds is None else round(seconds * 1000, 1)
+
+
+def print_table(rows: list[dict]):
+    print(f"\n{'tool':<20} {'batch':>5} {'ok':>4} {'err':>4} {'items/s':>8} "
+          f"{'p50ms':>8} {'p95ms':>8} {'p99ms':>8} {'rssMB':>7}")
+    for r in rows:
+        print(f"{r['tool']:<20} {r['batch']:>5} {r['ok']:>4} {r['errors']:>4} {r['throughput']:>8} "
+              f"{str(r['p50_ms']):>8} {str(r['p95_ms']):>8} {str(r['p99_ms']):>8} {r['peak_rss_mb']:>7}")
+
+
+def compare(rows: list[dict], baseline: list[dict], tolerance: float) -> list[str]:
+    """スループット低下・p95 悪化・RSS 増加が tolerance を超えたものを列挙"""
+    base = {(r["tool"], r["batch"]): r for r in baseline}
+    regressions = []
+    for r in rows:
+        b = base.get((r["tool"], r["batch"]))
+        if not b:
+            continue
+        key = f"{r['tool']}[{r['batch']}]"
+        if b["throughput"] and r["throughput"] < b["throughput"] * (1 - tolerance):
+            regressions.append(f"{key} throughput {b['throughput']} -> {r['throughput']}")
+        if b["p95_ms"] and r["p95_ms"] and r["p95_ms"] > b["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{key} p95 {b['p95_ms']}ms -> {r['p95_ms']}ms")
+        if r["peak_rss_mb"] > b["peak_rss_mb"] * (1 + tolerance):
+            regressions.append(f"{key} peak RSS {b['peak_rss_mb']}MB -> {r['peak_rss_mb']}MB")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark gemini-image tools against the local mock API")
+    parser.add_argument("--tools", nargs="+", default=list(TOOLS), choices=list(TOOLS))
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=[1, 10, 50])
+    parser.add_argument("--base-url", help="既に起動しているモックサーバーを使う")
+    parser.add_argument("--json", help="結果を JSON で保存")
+    parser.add_argument("--baseline", help="比較対象の JSON")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="劣化とみなす割合 (default: 0.2)")
+    parser.add_argument("--worker", choices=list(TOOLS), help=argparse.SUPPRESS)
+    parser.add_argument("--batch", type=int, help=argparse.SUPPRESS)
+    add_mock_arguments(parser)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_worker(args.worker, args.batch)))
+        return
+
+    server = None
+    base_url = args.base_url
+    if not base_url:
+        server = MockGeminiServer(config_from_args(args)).start()
+        base_url = server.base_url
+
+    print(f"🧪 Benchmarking against {base_url}")
+    rows = []
+    try:
+        for tool in args.tools:
+            for n in args.batch_sizes:
+                print(f"   ⏱️  {tool} x{n}...", flush=True)
+                rows.append(bench_one(tool, n, base_url))
+    finally:
+        if server:
+            server.stop()
+
+    print_table(rows)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=2)
+        print(f"\n💾 Saved to {args.json}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare(rows, json.load(f), args.tolerance)
+        if regressions:
+            print("\n❌ Regressions:")
+            for line in regressions:
+                print(f"   {line}")
+            sys.exit(1)
+        print("\n✅ No regressions against baseline")
+
+
+if __name__ == "__main__":
+    main()
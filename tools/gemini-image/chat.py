@@ -11,13 +11,17 @@ Usage:
 import argparse
 import os
 import readline
+import time
 from pathlib import Path
 
 from dotenv import load_dotenv
-from google import genai
 from google.genai import types
 from PIL import Image
 
+from gemini_client import create_client, served_model
+from streaming import consume_stream
+from tracing import decode_image, save_image
+
 load_dotenv()
 
 
@@ -28,12 +32,16 @@ class ImageChat:
         aspect_ratio: str = "1:1",
         image_size: str = "2K",
         use_search: bool = False,
+        stream: bool = False,
+        hedge: bool = False,
     ):
-        self.client = genai.Client()
+        # hedge=False のときは環境変数 GEMINI_HEDGE に従う
+        self.client = create_client(hedge=hedge or None)
         self.model = model
         self.aspect_ratio = aspect_ratio
         self.image_size = image_size
         self.use_search = use_search
+        self.stream = stream
         self.image_counter = 0
 
         model_id = (
@@ -42,47 +50,93 @@ class ImageChat:
             else "gemini-2.5-flash-image"
         )
 
+        self.chat = self.client.chats.create(
+            model=model_id,
+            config=self._build_config(),
+        )
+
+    def _build_config(
+        self,
+        aspect_ratio: str | None = None,
+        image_size: str | None = None,
+    ) -> types.GenerateContentConfig:
+        """現在の設定（＋このターンだけの上書き）から GenerateContentConfig を構築"""
+        aspect_ratio = aspect_ratio or self.aspect_ratio
+        image_size = image_size or self.image_size
+
         config_params = {
             "response_modalities": ["TEXT", "IMAGE"],
         }
 
-        if model == "pro":
+        if self.model == "pro":
             config_params["image_config"] = types.ImageConfig(
                 aspect_ratio=aspect_ratio,
                 image_size=image_size,
             )
-            if use_search:
+            if self.use_search:
                 config_params["tools"] = [{"google_search": {}}]
+        else:
+            # Flashモデルは image_size 非対応
+            config_params["image_config"] = types.ImageConfig(aspect_ratio=aspect_ratio)
 
-        self.chat = self.client.chats.create(
-            model=model_id,
-            config=types.GenerateContentConfig(**config_params),
-        )
+        return types.GenerateContentConfig(**config_params)
 
-    def send(self, message: str, image_path: str | None = None) -> dict:
-        """メッセージを送信"""
+    def send(
+        self,
+        message: str,
+        image_path: str | None = None,
+        aspect_ratio: str | None = None,
+        image_size: str | None = None,
+    ) -> dict:
+        """
+        メッセージを送信
+
+        設定はターンごとに送るため、update_config の変更は次のターンから即座に反映される。
+        aspect_ratio / image_size を渡すとこのターンだけ上書きする（履歴は維持）。
+        """
         contents = [message]
         if image_path:
             contents.append(Image.open(image_path))
 
-        response = self.chat.send_message(contents)
+        config = self._build_config(aspect_ratio=aspect_ratio, image_size=image_size)
+
+        if self.stream:
+            return self._send_stream(contents, config)
+
+        response = self.chat.send_message(contents, config=config)
 
-        result = {"text": None, "image_path": None}
+        result = {"text": None, "image_path": None, "model": served_model()}
 
         for part in response.parts:
             if not (hasattr(part, "thought") and part.thought):
                 if part.text:
                     result["text"] = part.text
-                elif image := part.as_image():
-                    self.image_counter += 1
-                    output_path = f"chat_output_{self.image_counter:03d}.png"
-                    image.save(output_path)
+                elif image := decode_image(part):
+                    output_path = self._next_output_path()
+                    save_image(image, output_path)
                     result["image_path"] = output_path
 
         return result
 
+    def _send_stream(self, contents: list, config: types.GenerateContentConfig) -> dict:
+        """ストリーミングで送信し、パート到着ごとに出力"""
+        started_at = time.perf_counter()
+        chunks = self.chat.send_message_stream(contents, config=config)
+        result = consume_stream(
+            chunks,
+            final_path=self._next_output_path,
+            thinking_path=lambda i: f"chat_thinking_{self.image_counter + 1:03d}_{i}.png",
+            started_at=started_at,
+        )
+        result["model"] = served_model()
+        return result
+
+    def _next_output_path(self) -> str:
+        self.image_counter += 1
+        return f"chat_output_{self.image_counter:03d}.png"
+
     def update_config(self, aspect_ratio: str = None, image_size: str = None):
-        """設定を更新"""
+        """設定を更新（セッション・履歴はそのまま、次のターンから反映）"""
         if aspect_ratio:
             self.aspect_ratio = aspect_ratio
         if image_size:
@@ -95,8 +149,12 @@ def main():
     parser.add_argument("-a", "--aspect", default="1:1", help="アスペクト比")
     parser.add_argument("-s", "--size", default="2K", choices=["1K", "2K", "4K"])
     parser.add_argument("--search", action="store_true", help="Google検索有効化")
+    parser.add_argument("--stream", action="store_true", help="ストリーミング出力")
+    parser.add_argument("--hedge", action="store_true", help="遅い応答に複製リクエストを重ねる（非ストリームのみ）")
 
     args = parser.parse_args()
+    if args.hedge and args.stream:
+        parser.error("--hedge cannot be combined with --stream")
 
     print("🎨 Gemini Image Chat")
     print(f"   Model: {args.model}, Aspect: {args.aspect}, Size: {args.size}")
@@ -105,6 +163,7 @@ def main():
     print("  /aspect <ratio> - アスペクト比変更 (e.g., /aspect 16:9)")
     print("  /size <size>    - 解像度変更 (e.g., /size 4K)")
     print("  /image <path>   - 画像を添付して送信")
+    print("  /once <size> <message> - このターンだけ解像度を変えて送信 (e.g., /once 4K 仕上げて)")
     print("-" * 50)
 
     chat = ImageChat(
@@ -112,6 +171,8 @@ def main():
         aspect_ratio=args.aspect,
         image_size=args.size,
         use_search=args.search,
+        stream=args.stream,
+        hedge=args.hedge,
     )
 
     while True:
@@ -139,10 +200,22 @@ def main():
             if new_size in ["1K", "2K", "4K"]:
                 chat.update_config(image_size=new_size)
                 print(f"✅ Image size set to: {new_size}")
+                if chat.model != "pro":
+                    print("   (Flashモデルは解像度指定に非対応のため無視されます)")
             else:
                 print("❌ Invalid size. Use 1K, 2K, or 4K")
             continue
 
+        image_size = None
+        if user_input.startswith("/once "):
+            parts = user_input.split(" ", 2)
+            if len(parts) >= 3 and parts[1].upper() in ["1K", "2K", "4K"]:
+                image_size = parts[1].upper()
+                user_input = parts[2]
+            else:
+                print("❌ Usage: /once <1K|2K|4K> <message>")
+                continue
+
         image_path = None
         if user_input.startswith("/image "):
             parts = user_input.split(" ", 2)
@@ -154,7 +227,16 @@ def main():
                 continue
 
         print("🔄 Generating...")
-        result = chat.send(user_input, image_path)
+        if chat.stream:
+            print("\n🤖 Gemini: ", end="", flush=True)
+            result = chat.send(user_input, image_path, image_size=image_size)
+            if result["ttfb"] is not None:
+                print(f"⏱️  TTFB: {result['ttfb']:.2f}s, Total: {result['elapsed']:.2f}s")
+            if result["model"] != chat.chat.model:
+                print(f"↪️  Served by fallback model: {result['model']}")
+            continue
+
+        result = chat.send(user_input, image_path, image_size=image_size)
 
         if result["text"]:
             print(f"\n🤖 Gemini: {result['text']}")
@@ -162,6 +244,9 @@ def main():
         if result["image_path"]:
             print(f"🖼️  Image saved: {result['image_path']}")
 
+        if result["model"] != chat.chat.model:
+            print(f"↪️  Served by fallback model: {result['model']}")
+
 
 if __name__ == "__main__":
     main()
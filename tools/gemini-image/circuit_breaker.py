@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""
+モデル別サーキットブレーカーとフォールバックポリシー
+
+各モデルの直近の呼び出し（件数・時間の両方で窓を切る）からエラー率と p95 レイテンシを
+追跡し、閾値を超えたらブレーカーを開いてそのモデルへの送信を止める。
+クールダウン後は1件だけ試行（half-open）し、成功すれば閉じる。
+
+フォールバックを有効にすると、ブレーカーが開いている・または呼び出しが失敗した場合に
+FALLBACKS の順で代替モデルへ（image_size を落として）切り替える。
+
+環境変数:
+    GEMINI_FALLBACK=1            フォールバックを有効化（create_client(fallback=True) と同じ）
+    GEMINI_BREAKER_ERROR_RATE    ブレーカーを開くエラー率 (default: 0.5)
+    GEMINI_BREAKER_P95           ブレーカーを開く p95 レイテンシ秒 (default: 120)
+    GEMINI_BREAKER_COOLDOWN      開いてから half-open までの秒数 (default: 60)
+"""
+
+import contextvars
+import os
+import threading
+import time
+from collections import deque
+
+import httpx
+from google.genai import errors, types
+
+# モデル → [(代替モデル, 代替時の image_size)]。image_size 非対応モデルでは無視される
+FALLBACKS = {
+    "gemini-3-pro-image-preview": [("gemini-2.5-flash-image", "1K")],
+    "gemini-2.0-flash-exp": [("gemini-2.5-flash-image", "1K")],
+}
+
+# image_size / Google検索グラウンディングに対応するモデル
+IMAGE_SIZE_MODELS = {"gemini-3-pro-image-preview"}
+
+
+class CircuitOpenError(RuntimeError):
+    """ブレーカーが開いていて、代替モデルも無い"""
+
+    def __init__(self, model: str):
+        super().__init__(f"Circuit open for {model}")
+        self.model = model
+
+
+def is_retryable(error: BaseException) -> bool:
+    """ブレーカーの失敗として数え、代替モデルに回すべきエラーか"""
+    if isinstance(error, errors.ServerError):
+        return True
+    if isinstance(error, errors.ClientError):
+        return error.code == 429
+    return isinstance(error, (httpx.TimeoutException, httpx.TransportError))
+
+
+class CircuitBreaker:
+    """1モデル分のブレーカー（closed → open → half_open → closed）"""
+
+    def __init__(
+        self,
+        model: str,
+        error_rate: float = 0.5,
+        p95_seconds: float | None = 120.0,
+        min_calls: int = 5,
+        window: int = 20,
+        window_seconds: float = 300.0,
+        cooldown: float = 60.0,
+    ):
+        self.model = model
+        self.error_rate = error_rate
+        self.p95_seconds = p95_seconds
+        self.min_calls = min_calls
+        self.window_seconds = window_seconds
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self._events = deque(maxlen=window)  # (timestamp, ok, latency)
+        self._lock = threading.Lock()
+
+    def _recent(self) -> list:
+        cutoff = time.monotonic() - self.window_seconds
+        return [e for e in self._events if e[0] >= cutoff]
+
+    def stats(self) -> dict:
+        with self._lock:
+            recent = self._recent()
+        latencies = sorted(lat for _, ok, lat in recent if ok)
+        p95 = latencies[max(0, int(round(0.95 * len(latencies))) - 1)] if latencies else None
+        failures = sum(1 for _, ok, _ in recent if not ok)
+        return {
+            "state": self.state,
+            "calls": len(recent),
+            "error_rate": failures / len(recent) if recent else 0.0,
+            "p95": p95,
+        }
+
+    def allow(self) -> bool:
+        """このモデルに送ってよいか（half-open では1件だけ通す）"""
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.cooldown:
+                self.state = "half_open"
+            if self.state == "half_open" and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def record(self, ok: bool, latency: float):
+        with self._lock:
+            if self.state == "half_open":
+                self._probe_in_flight = False
+                if ok:
+                    self.state = "closed"
+                    self._events.clear()
+                else:
+                    self._trip()
+                    return
+            self._events.append((time.monotonic(), ok, latency))
+            if self.state != "closed":
+                return
+            recent = self._recent()
+            if len(recent) < self.min_calls:
+                return
+            failures = sum(1 for _, success, _ in recent if not success)
+            if failures / len(recent) >= self.error_rate:
+                self._trip()
+                return
+            latencies = sorted(lat for _, success, lat in recent if success)
+            if self.p95_seconds and len(latencies) >= self.min_calls:
+                p95 = latencies[max(0, int(round(0.95 * len(latencies))) - 1)]
+                if p95 >= self.p95_seconds:
+                    self._trip()
+
+    def record_error(self, error: Exception, latency: float):
+        """
+        失敗した呼び出しを記録
+
+        400/403 などリトライしても変わらないエラーはリクエスト側の問題でモデルの状態とは
+        無関係なので、失敗にも成功にも数えない（half-open の試行枠だけ返す）。
+        """
+        if is_retryable(error):
+            self.record(False, latency)
+            return
+        with self._lock:
+            self._probe_in_flight = False
+
+    def _trip(self):
+        self.state = "open"
+        self.opened_at = time.monotonic()
+        self._probe_in_flight = False
+        print(f"🔌 Circuit opened for {self.model}")
+
+
+_breakers: dict[str, CircuitBreaker] = {}
+_registry_lock = threading.Lock()
+
+
+def breaker_for(model: str) -> CircuitBreaker:
+    with _registry_lock:
+        if model not in _breakers:
+            p95 = os.environ.get("GEMINI_BREAKER_P95", "120")
+            _breakers[model] = CircuitBreaker(
+                model,
+                error_rate=float(os.environ.get("GEMINI_BREAKER_ERROR_RATE", "0.5")),
+                p95_seconds=float(p95) if p95 else None,
+                cooldown=float(os.environ.get("GEMINI_BREAKER_COOLDOWN", "60")),
+            )
+        return _breakers[model]
+
+
+def fallback_enabled() -> bool:
+    return os.environ.get("GEMINI_FALLBACK", "").lower() in ("1", "true", "yes", "on")
+
+
+def downgrade_config(config, model: str, image_size: str | None):
+    """代替モデル向けに config を調整（非対応の image_size・検索ツールを外す）"""
+    if config is None:
+        return None
+    if isinstance(config, dict):
+        config = types.GenerateContentConfig(**config)
+    update = {}
+    if config.image_config is not None:
+        if model in IMAGE_SIZE_MODELS:
+            update["image_config"] = config.image_config.model_copy(update={"image_size": image_size})
+        else:
+            update["image_config"] = config.image_config.model_copy(update={"image_size": None})
+    if config.tools and model not in IMAGE_SIZE_MODELS:
+        update["tools"] = None
+    return config.model_copy(update=update)
+
+
+def wants_image(config) -> bool:
+    """画像生成の呼び出しか（フォールバック先は画像モデルなので、それ以外には適用しない）"""
+    if config is None:
+        return False
+    if isinstance(config, dict):
+        config = types.GenerateContentConfig(**config)
+    return config.image_config is not None or "IMAGE" in (config.response_modalities or [])
+
+
+def plan(model: str, config, fallback: bool) -> list[tuple[str, object]]:
+    """試行する (モデル, config) の順序（フォールバックは画像生成の呼び出しのみ）"""
+    attempts = [(model, config)]
+    if fallback and wants_image(config):
+        for alt_model, alt_size in FALLBACKS.get(model, []):
+            attempts.append((alt_model, downgrade_config(config, alt_model, alt_size)))
+    return attempts
+
+
+_sent_at = contextvars.ContextVar("breaker_sent_at", default=None)
+
+
+def mark_sent():
+    """
+    call_with_breaker の call の中で、ローカルの順番待ち（スケジューラのスロット・キーの空き）を
+    終えて送信する直前に呼ぶ。ブレーカーのレイテンシはここから数える（送り直した場合は最後の送信から）
+    """
+    if (sent := _sent_at.get()) is not None:
+        sent[0] = time.perf_counter()
+
+
+def call_with_breaker(call, model: str, config, fallback: bool):
+    """
+    ブレーカーとフォールバックを適用して call(model, config) を実行
+
+    Returns:
+        (結果, 実際に応答したモデル)
+    """
+    attempts = plan(model, config, fallback)
+    last_error = None
+    for i, (attempt_model, attempt_config) in enumerate(attempts):
+        breaker = breaker_for(attempt_model)
+        is_last = i == len(attempts) - 1
+        if not breaker.allow():
+            if is_last:
+                raise last_error or CircuitOpenError(attempt_model)
+            print(f"⏭️  {attempt_model} circuit open, falling back to {attempts[i + 1][0]}")
+            continue
+
+        # mark_sent() が呼ばれなければ call 全体の時間
+        sent = [time.perf_counter()]
+        token = _sent_at.set(sent)
+        try:
+            result = call(attempt_model, attempt_config)
+        except Exception as e:
+            breaker.record_error(e, time.perf_counter() - sent[0])
+            if is_last or not is_retryable(e):
+                raise
+            last_error = e
+            print(f"⚠️ {attempt_model} failed ({type(e).__name__}), falling back to {attempts[i + 1][0]}")
+            continue
+        finally:
+            _sent_at.reset(token)
+        breaker.record(True, time.perf_counter() - sent[0])
+        return result, attempt_model
+
+    raise last_error or CircuitOpenError(model)
@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+"""
+複数 API キー（プロジェクト）のクレデンシャルプール
+
+1プロジェクトのクォータで頭打ちになるバッチ処理のために、複数のキーへ
+呼び出しを振り分ける。キーごとに直近60秒のリクエスト数・トークン数と実行中の数を追跡し、
+最も空いているキーを選ぶ。トークン数は送信時に見積もりで予約し、完了時に実際の使用量へ置き換える
+（同時に送ったリクエストも tpm に数える）。429 を返したキーは Retry-After（無ければ既定値）まで外し、
+同じリクエストを別のキーで送り直す。
+クォータ待ちになった呼び出しは scheduler の優先度（WFQ）の順にキーを割り当てる。
+
+キーの指定（上から優先）:
+    GEMINI_CREDENTIALS_FILE（既定: ~/.gemini-image/credentials.yaml）
+        credentials:
+          - name: project-a
+            api_key_env: GEMINI_KEY_A    # または api_key: ...
+            rpm: 10                      # 省略時は無制限（429 のみで判断）
+            tpm: 1000000
+    GEMINI_API_KEYS=key1,key2,...        （GEMINI_KEY_RPM / GEMINI_KEY_TPM で共通の上限）
+
+Usage:
+    python credential_pool.py            # 読み込んだキーの一覧
+"""
+
+import os
+import re
+import threading
+import time
+from collections import deque
+from pathlib import Path
+
+import yaml
+from google.genai import errors
+
+import scheduler
+
+CREDENTIALS_FILE = Path(
+    os.environ.get("GEMINI_CREDENTIALS_FILE", "~/.gemini-image/credentials.yaml")
+).expanduser()
+WINDOW_SECONDS = 60.0
+DEFAULT_THROTTLE_SECONDS = 30.0
+
+
+class NoCredentialAvailable(RuntimeError):
+    """待ち時間の上限内に使えるキーが無い"""
+
+
+class Credential:
+    """1キー分の利用状況"""
+
+    def __init__(self, name: str, api_key: str, rpm: int | None = None, tpm: int | None = None):
+        self.name = name
+        self.api_key = api_key
+        self.rpm = rpm
+        self.tpm = tpm
+        self.client = None  # create_client が genai.Client を設定する
+        self.new_client = None  # 同じキーで新しい genai.Client を作る関数（ヘッジ用）
+        self.in_flight = 0
+        self.throttled_until = 0.0
+        self.totals = {"requests": 0, "tokens": 0, "throttled": 0}
+        self._requests = deque()  # timestamp
+        self._tokens = deque()  # [timestamp, tokens, reserved]
+
+    def _expire(self, now: float):
+        while self._requests and self._requests[0] <= now - WINDOW_SECONDS:
+            self._requests.popleft()
+        while self._tokens and self._tokens[0][0] <= now - WINDOW_SECONDS:
+            self._tokens.popleft()
+
+    def window_tokens(self) -> int:
+        return sum(entry[1] for entry in self._tokens)
+
+    def settle(self, now: float, estimated_tokens: int, tokens: int):
+        """acquire で予約した見積もりを実際の使用量に置き換える（tokens=0 なら予約を取り消す）"""
+        entry = None
+        if estimated_tokens:
+            entry = next((e for e in self._tokens if e[2] and e[1] == estimated_tokens), None)
+        if entry is None:
+            if tokens:
+                self._tokens.append([now, tokens, False])
+        elif tokens:
+            entry[1], entry[2] = tokens, False
+        else:
+            self._tokens.remove(entry)
+
+    def load(self, now: float) -> float:
+        """クォータに対する使用率（上限未設定のキーは実行中の数で比べる）"""
+        self._expire(now)
+        ratios = [0.0]
+        if self.rpm:
+            ratios.append(len(self._requests) / self.rpm)
+        if self.tpm:
+            ratios.append(self.window_tokens() / self.tpm)
+        return max(ratios)
+
+    def ready_at(self, now: float, estimated_tokens: int = 0) -> float:
+        """このキーに送れるようになる時刻（今すぐなら now）"""
+        self._expire(now)
+        ready = max(now, self.throttled_until)
+        if self.rpm and len(self._requests) >= self.rpm:
+            ready = max(ready, self._requests[0] + WINDOW_SECONDS)
+        window = self.window_tokens()
+        # 窓が空なら 1件で tpm を超えるリクエストも通す（待っても空きは増えない）
+        if self.tpm and window and window + estimated_tokens > self.tpm:
+            ready = max(ready, self._tokens[0][0] + WINDOW_SECONDS)
+        return ready
+
+
+def _retry_after(error: errors.APIError) -> float:
+    """429 の RetryInfo（"12s" 形式）から待ち時間を取り出す"""
+    body = error.details if isinstance(error.details, dict) else {}
+    for detail in body.get("error", body).get("details") or []:
+        if isinstance(detail, dict) and (delay := detail.get("retryDelay")):
+            if match := re.match(r"([\d.]+)s", str(delay)):
+                return float(match.group(1))
+    return DEFAULT_THROTTLE_SECONDS
+
+
+def _usage_tokens(response) -> int:
+    usage = getattr(response, "usage_metadata", None)
+    return getattr(usage, "total_token_count", None) or 0
+
+
+class CredentialPool:
+    """最も空いているキーへ振り分け、429 のキーを避けて送り直す"""
+
+    def __init__(self, credentials: list[Credential], max_wait: float = 300.0):
+        if not credentials:
+            raise ValueError("Credential pool needs at least one API key")
+        self.credentials = credentials
+        self.max_wait = max_wait
+        self._cond = threading.Condition()
+        self.queue = scheduler.FairQueue()
+
+    @classmethod
+    def from_env(cls) -> "CredentialPool | None":
+        """設定ファイル・GEMINI_API_KEYS からプールを作る。どちらも無ければ None"""
+        if CREDENTIALS_FILE.exists():
+            with open(CREDENTIALS_FILE, "r", encoding="utf-8") as f:
+                entries = (yaml.safe_load(f) or {}).get("credentials", [])
+            credentials = []
+            for i, entry in enumerate(entries):
+                key = entry.get("api_key") or os.environ.get(entry.get("api_key_env", ""))
+                if not key:
+                    print(f"⚠️ Credential {entry.get('name', i)}: API key not found, skipped")
+                    continue
+                credentials.append(Credential(entry.get("name", f"key{i}"), key, entry.get("rpm"), entry.get("tpm")))
+            if credentials:
+                return cls(credentials)
+
+        keys = [k.strip() for k in os.environ.get("GEMINI_API_KEYS", "").split(",") if k.strip()]
+        if keys:
+            rpm = os.environ.get("GEMINI_KEY_RPM")
+            tpm = os.environ.get("GEMINI_KEY_TPM")
+            return cls([
+                Credential(f"key{i}", key, int(rpm) if rpm else None, int(tpm) if tpm else None)
+                for i, key in enumerate(keys)
+            ])
+        return None
+
+    def acquire(self, estimated_tokens: int = 0, exclude: set[str] = frozenset()) -> Credential | None:
+        """
+        最も空いているキーを確保する
+
+        全キーがクォータ上限・スロットル中なら空くまで待つ（max_wait まで）。
+        待っている呼び出しが複数あれば、空いたキーは優先度（WFQ）の順に割り当てる。
+        exclude 以外にキーが無ければ None。
+        """
+        deadline = time.monotonic() + self.max_wait
+        with self._cond:
+            ticket = self.queue.enqueue(
+                scheduler.current_priority(),
+                scheduler.request_cost(estimated_tokens),
+                data=(estimated_tokens, exclude),
+            )
+            try:
+                while True:
+                    now = time.monotonic()
+                    candidates = [c for c in self.credentials if c.name not in exclude]
+                    if not candidates:
+                        return None
+                    ready = [c for c in candidates if c.ready_at(now, estimated_tokens) <= now]
+                    if ready and self.queue.head(lambda t: self._has_ready(t, now)) is ticket:
+                        self.queue.dispatch(ticket)
+                        cred = min(ready, key=lambda c: (c.load(now), c.in_flight))
+                        cred.in_flight += 1
+                        cred._requests.append(now)
+                        if estimated_tokens:
+                            cred._tokens.append([now, estimated_tokens, True])
+                        self._cond.notify_all()
+                        return cred
+                    wake = min(c.ready_at(now, estimated_tokens) for c in candidates)
+                    if wake > deadline:
+                        return None
+                    self._cond.wait(timeout=max(0.05, wake - now))
+            finally:
+                self.queue.cancel(ticket)
+
+    def _has_ready(self, ticket: scheduler.Ticket, now: float) -> bool:
+        estimated_tokens, exclude = ticket.data
+        return any(
+            c.ready_at(now, estimated_tokens) <= now for c in self.credentials if c.name not in exclude
+        )
+
+    def release(self, cred: Credential, tokens: int = 0, throttle: float | None = None, estimated_tokens: int = 0):
+        """acquire したキーを返す。estimated_tokens は acquire に渡した見積もり（予約の精算に使う）"""
+        with self._cond:
+            now = time.monotonic()
+            cred.in_flight -= 1
+            cred.totals["requests"] += 1
+            cred.settle(now, estimated_tokens, tokens)
+            if tokens:
+                cred.totals["tokens"] += tokens
+            if throttle is not None:
+                cred.throttled_until = now + throttle
+                cred.totals["throttled"] += 1
+            self._cond.notify_all()
+
+    def run(self, fn, estimated_tokens: int = 0):
+        """
+        fn(credential) を空いているキーで実行する
+
+        429 ならそのキーをスロットルして別のキーで送り直す。全キーが 429 なら最後のエラーを送出。
+        """
+        tried = set()
+        last_error = None
+        while True:
+            cred = self.acquire(estimated_tokens, exclude=tried)
+            if cred is None:
+                if last_error:
+                    raise last_error
+                raise NoCredentialAvailable("No API key became available within the wait limit")
+            try:
+                result = fn(cred)
+            except errors.ClientError as e:
+                if e.code != 429:
+                    self.release(cred, estimated_tokens=estimated_tokens)
+                    raise
+                delay = _retry_after(e)
+                self.release(cred, throttle=delay, estimated_tokens=estimated_tokens)
+                tried.add(cred.name)
+                last_error = e
+                if len(tried) < len(self.credentials):
+                    print(f"🔑 {cred.name} throttled for {delay:.0f}s, switching key")
+                continue
+            except BaseException:
+                self.release(cred, estimated_tokens=estimated_tokens)
+                raise
+            self.release(cred, tokens=_usage_tokens(result), estimated_tokens=estimated_tokens)
+            return result
+
+    def stream(self, fn, estimated_tokens: int = 0):
+        """
+        fn(credential) が返すストリームを空いているキーで消費する
+
+        チャンクを返し始めた後は送り直せないため、429 はスロットルの記録だけ行って送出する。
+        """
+        cred = self.acquire(estimated_tokens)
+        if cred is None:
+            raise NoCredentialAvailable("No API key became available within the wait limit")
+        last = None
+        throttle = None
+        try:
+            for chunk in fn(cred):
+                last = chunk
+                yield chunk
+        except errors.ClientError as e:
+            if e.code == 429:
+                throttle = _retry_after(e)
+            raise
+        finally:
+            self.release(cred, tokens=_usage_tokens(last) if last is not None else 0, throttle=throttle,
+                         estimated_tokens=estimated_tokens)
+
+    def stats(self) -> list[dict]:
+        now = time.monotonic()
+        with self._cond:
+            return [
+                {
+                    "name": c.name,
+                    "in_flight": c.in_flight,
+                    "load": round(c.load(now), 3),
+                    "throttled_for": round(max(0.0, c.throttled_until - now), 1),
+                    **c.totals,
+                }
+                for c in self.credentials
+            ]
+
+    def print_stats(self):
+        print(f"{'key':<20} {'requests':>9} {'tokens':>10} {'429':>5} {'load':>6}")
+        for s in self.stats():
+            print(f"{s['name']:<20} {s['requests']:>9} {s['tokens']:>10} {s['throttled']:>5} {s['load']:>6.2f}")
+
+
+def configured() -> bool:
+    """プール用のキー設定があるか（単一キーの存在チェックの代わりに使う）"""
+    return CREDENTIALS_FILE.exists() or bool(os.environ.get("GEMINI_API_KEYS", "").strip())
+
+
+def main():
+    pool = CredentialPool.from_env()
+    if pool is None:
+        print("ℹ️  No credential pool configured (GEMINI_API_KEYS / credentials.yaml)")
+        return
+    for c in pool.credentials:
+        print(f"🔑 {c.name:<20} ...{c.api_key[-4:]}  rpm={c.rpm or '-'} tpm={c.tpm or '-'}")
+
+
+if __name__ == "__main__":
+    main()
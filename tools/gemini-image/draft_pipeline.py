@@ -0,0 +1,448 @@
+#!/usr/bin/env python3
+"""
+Draft → Final 二段階レンダリングパイプライン
+
+Phase 1 (draft): 全アイテムを Flash モデル・1K で高速・低コストに下書き生成
+Phase 2 (final): 承認済みアイテムだけを Pro モデル・2K/4K で本番生成
+                 （下書き画像を構図の参照として渡す）
+
+承認状態と各画像がどのプロンプト・どのモデルから生成されたかは manifest.json に記録する。
+プロンプトが変わったアイテムは下書きが作り直され、承認も取り消される。
+フォールバックで代替モデルが応答した本番画像は、次回の final で Pro から作り直す。
+どのフェーズも batch=True でプロバイダのバッチジョブ（batch_jobs）として投入できる。
+
+Usage:
+    python generate_from_yaml.py images.yaml --phase draft
+    python generate_from_yaml.py images.yaml --approve 01_intro 03_summary
+    python generate_from_yaml.py images.yaml --phase final
+"""
+
+import hashlib
+import json
+from datetime import datetime
+from pathlib import Path
+
+from google.genai import types
+from PIL import Image
+
+import batch_jobs
+from gemini_client import GeminiClient, served_model
+from tracing import decode_image, save_image
+
+DRAFT_MODEL = "gemini-2.5-flash-image"
+FINAL_MODEL = "gemini-3-pro-image-preview"
+
+MANIFEST_NAME = "manifest.json"
+
+REFERENCE_INSTRUCTION = (
+    "The attached image is an approved low-resolution draft. "
+    "Re-render it at high quality, keeping its composition, layout, "
+    "characters and text placement, while following the prompt below exactly."
+)
+
+
+def prompt_hash(prompt: str, aspect_ratio: str) -> str:
+    """アイテムの内容ハッシュ（プロンプト＋アスペクト比）"""
+    return hashlib.sha256(f"{aspect_ratio}\n{prompt}".encode("utf-8")).hexdigest()[:16]
+
+
+class BatchManifest:
+    """バッチ生成の状態（下書き・承認・本番）を保持する manifest.json"""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        if self.path.exists():
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.data = json.load(f)
+        else:
+            self.data = {"items": {}}
+
+    def item(self, item_id: str) -> dict:
+        return self.data["items"].setdefault(item_id, {})
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.data, f, ensure_ascii=False, indent=2)
+        tmp.replace(self.path)
+
+    def is_approved(self, item_id: str, current_hash: str) -> bool:
+        """承認がその時点のプロンプトに対するものかどうか"""
+        entry = self.data["items"].get(item_id, {})
+        return bool(entry.get("approved")) and entry.get("approved_hash") == current_hash
+
+    def approve(self, item_ids: list[str], approved: bool = True) -> list[str]:
+        """下書きを承認（または取り消し）。下書きが無いIDは無視して返す"""
+        missing = []
+        for item_id in item_ids:
+            entry = self.data["items"].get(item_id)
+            if not entry or not entry.get("draft_hash"):
+                missing.append(item_id)
+                continue
+            entry["approved"] = approved
+            entry["approved_hash"] = entry["draft_hash"] if approved else None
+            entry["approved_at"] = datetime.now().isoformat(timespec="seconds") if approved else None
+        self.save()
+        return missing
+
+
+def _save_first_image(response, output_path: Path) -> bool:
+    for part in response.parts or []:
+        if hasattr(part, "thought") and part.thought:
+            continue
+        if image := decode_image(part):
+            save_image(image, str(output_path))
+            return True
+    return False
+
+
+def draft_request(prompt: str, aspect_ratio: str) -> tuple[list, types.GenerateContentConfig]:
+    """下書き用の contents と config（Flash は 1K 固定）"""
+    return [prompt], types.GenerateContentConfig(
+        response_modalities=["TEXT", "IMAGE"],
+        image_config=types.ImageConfig(aspect_ratio=aspect_ratio),
+    )
+
+
+def final_request(
+    prompt: str,
+    draft_path: Path | None,
+    aspect_ratio: str,
+    image_size: str,
+) -> tuple[list, types.GenerateContentConfig]:
+    """本番用の contents（下書きがあれば参照画像として添付）と config"""
+    contents = [prompt]
+    if draft_path and Path(draft_path).exists():
+        contents = [REFERENCE_INSTRUCTION, Image.open(draft_path), prompt]
+    return contents, types.GenerateContentConfig(
+        response_modalities=["TEXT", "IMAGE"],
+        image_config=types.ImageConfig(
+            aspect_ratio=aspect_ratio,
+            image_size=image_size,
+        ),
+    )
+
+
+def render_draft(client: GeminiClient, prompt: str, output_path: Path, aspect_ratio: str) -> bool:
+    """Flash モデルで下書きを生成"""
+    contents, config = draft_request(prompt, aspect_ratio)
+    response = client.models.generate_content(model=DRAFT_MODEL, contents=contents, config=config)
+    return _save_first_image(response, output_path)
+
+
+def render_final(
+    client: GeminiClient,
+    prompt: str,
+    draft_path: Path,
+    output_path: Path,
+    aspect_ratio: str,
+    image_size: str,
+) -> bool:
+    """Pro モデルで下書きを参照しつつ高解像度で本番生成"""
+    contents, config = final_request(prompt, draft_path, aspect_ratio, image_size)
+    response = client.models.generate_content(model=FINAL_MODEL, contents=contents, config=config)
+    return _save_first_image(response, output_path)
+
+
+def _record_draft(manifest: BatchManifest, item_id: str, current: str, draft_path: Path, model: str | None):
+    entry = manifest.item(item_id)
+    if entry.get("draft_hash") != current:
+        # プロンプトが変わった場合、以前の承認は無効
+        entry["approved"] = False
+        entry["approved_hash"] = None
+    entry.update({
+        "prompt_hash": current,
+        "draft_hash": current,
+        "draft_path": str(draft_path),
+        "draft_model": model,
+        "drafted_at": datetime.now().isoformat(timespec="seconds"),
+    })
+    manifest.save()
+
+
+def _record_final(manifest: BatchManifest, item_id: str, current: str, size: str, final_path: Path, model: str | None):
+    manifest.item(item_id).update({
+        "final_hash": current,
+        "final_size": size,
+        "final_path": str(final_path),
+        "final_model": model,
+        "finalized_at": datetime.now().isoformat(timespec="seconds"),
+    })
+    manifest.save()
+
+
+def final_up_to_date(entry: dict, current: str, size: str, final_path: Path, model: str = FINAL_MODEL) -> bool:
+    return (
+        entry.get("final_hash") == current
+        and entry.get("final_size") == size
+        and entry.get("final_model", model) == model
+        and final_path.exists()
+    )
+
+
+def _batch_saver(paths: dict, model: str, record):
+    """batch_jobs.run_batch 用の保存コールバック（画像保存＋マニフェスト更新）"""
+
+    def save(item_id: str, response) -> bool:
+        path = paths[item_id]
+        if not _save_first_image(response, path):
+            return False
+        record(item_id, path, response.model_version or model)
+        return True
+
+    return save
+
+
+def run_drafts(
+    client: GeminiClient,
+    items: list[dict],
+    output_dir: Path,
+    force: bool = False,
+    batch: bool = False,
+) -> dict:
+    """
+    Phase 1: 下書き生成
+
+    items は {"id", "prompt", "aspect_ratio"} を持つ dict のリスト。
+    既に同じプロンプトの下書きがあるアイテムはスキップする。
+    """
+    output_dir = Path(output_dir)
+    draft_dir = output_dir / "drafts"
+    draft_dir.mkdir(parents=True, exist_ok=True)
+    manifest = BatchManifest(output_dir / MANIFEST_NAME)
+    stats = {"rendered": 0, "skipped": 0, "failed": 0}
+
+    todo = []
+    for item in items:
+        item_id = item["id"]
+        aspect = item.get("aspect_ratio", "16:9")
+        current = prompt_hash(item["prompt"], aspect)
+        entry = manifest.item(item_id)
+        draft_path = draft_dir / f"{item_id}.png"
+
+        if not force and entry.get("draft_hash") == current and draft_path.exists():
+            print(f"⏭️  Draft up to date: {item_id}")
+            stats["skipped"] += 1
+            continue
+        todo.append((item, aspect, current, draft_path))
+
+    if batch:
+        requests, hashes, paths = [], {}, {}
+        for item, aspect, current, draft_path in todo:
+            contents, config = draft_request(item["prompt"], aspect)
+            requests.append({"id": item["id"], "hash": current, "contents": contents, "config": config})
+            hashes[item["id"]], paths[item["id"]] = current, draft_path
+        save = _batch_saver(
+            paths, DRAFT_MODEL, lambda item_id, path, model: _record_draft(manifest, item_id, hashes[item_id], path, model)
+        )
+        result = batch_jobs.run_batch(client, manifest, "draft", DRAFT_MODEL, requests, save)
+        stats["rendered"] += result["rendered"]
+        stats["failed"] += result["failed"]
+        return stats
+
+    for item, aspect, current, draft_path in todo:
+        item_id = item["id"]
+        print(f"✏️  Drafting {item_id} ({DRAFT_MODEL}, 1K)...")
+        try:
+            ok = render_draft(client, item["prompt"], draft_path, aspect)
+        except Exception as e:
+            print(f"❌ Error drafting {item_id}: {e}")
+            ok = False
+
+        if not ok:
+            stats["failed"] += 1
+            continue
+
+        _record_draft(manifest, item_id, current, draft_path, served_model())
+        stats["rendered"] += 1
+        print(f"✅ Draft saved to {draft_path}")
+
+    return stats
+
+
+def run_finals(
+    client: GeminiClient,
+    items: list[dict],
+    output_dir: Path,
+    force: bool = False,
+    batch: bool = False,
+) -> dict:
+    """
+    Phase 2: 本番生成
+
+    承認済み、かつ本番画像が未生成・プロンプト変更・解像度変更のアイテムだけを生成する。
+    """
+    output_dir = Path(output_dir)
+    manifest = BatchManifest(output_dir / MANIFEST_NAME)
+    stats = {"rendered": 0, "skipped": 0, "unapproved": 0, "failed": 0}
+
+    todo = []
+    for item in items:
+        item_id = item["id"]
+        aspect = item.get("aspect_ratio", "16:9")
+        size = item.get("image_size", "2K")
+        current = prompt_hash(item["prompt"], aspect)
+        entry = manifest.item(item_id)
+        final_path = output_dir / f"{item_id}.png"
+
+        if not manifest.is_approved(item_id, current):
+            stats["unapproved"] += 1
+            continue
+
+        if not force and final_up_to_date(entry, current, size, final_path):
+            print(f"⏭️  Final up to date: {item_id}")
+            stats["skipped"] += 1
+            continue
+        todo.append((item, aspect, size, current, final_path, entry.get("draft_path")))
+
+    if batch:
+        requests, meta, paths = [], {}, {}
+        for item, aspect, size, current, final_path, draft_path in todo:
+            contents, config = final_request(item["prompt"], draft_path, aspect, size)
+            # 解像度もジョブの照合対象に含める
+            requests.append({"id": item["id"], "hash": f"{current}:{size}", "contents": contents, "config": config})
+            meta[item["id"]], paths[item["id"]] = (current, size), final_path
+        save = _batch_saver(
+            paths, FINAL_MODEL, lambda item_id, path, model: _record_final(manifest, item_id, *meta[item_id], path, model)
+        )
+        result = batch_jobs.run_batch(client, manifest, "final", FINAL_MODEL, requests, save)
+        stats["rendered"] += result["rendered"]
+        stats["failed"] += result["failed"]
+        return stats
+
+    for item, aspect, size, current, final_path, draft_path in todo:
+        item_id = item["id"]
+        print(f"🎨 Rendering final {item_id} ({FINAL_MODEL}, {size})...")
+        try:
+            ok = render_final(client, item["prompt"], draft_path, final_path, aspect, size)
+        except Exception as e:
+            print(f"❌ Error rendering {item_id}: {e}")
+            ok = False
+
+        if not ok:
+            stats["failed"] += 1
+            continue
+
+        _record_final(manifest, item_id, current, size, final_path, served_model())
+        stats["rendered"] += 1
+        print(f"✅ Final saved to {final_path} ({served_model()})")
+
+    return stats
+
+
+def run_direct(
+    client: GeminiClient,
+    model: str,
+    items: list[dict],
+    output_dir: Path,
+    force: bool = False,
+) -> dict:
+    """
+    run_direct_batch の同期版（1件ずつ generate_content）
+
+    items の形式・スキップ条件・マニフェストへの記録は run_direct_batch と同じ。
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    manifest = BatchManifest(output_dir / MANIFEST_NAME)
+    stats = {"rendered": 0, "skipped": 0, "failed": 0}
+
+    for item in items:
+        item_id = item["id"]
+        final_path = output_dir / f"{item_id}.png"
+        if not force and final_up_to_date(manifest.item(item_id), item["hash"], item["size"], final_path, model):
+            print(f"⏭️  Up to date: {item_id}")
+            stats["skipped"] += 1
+            continue
+
+        print(f"\n🎨 Generating: {item.get('title', item_id)}...")
+        try:
+            response = client.models.generate_content(model=model, contents=item["contents"], config=item["config"])
+            ok = _save_first_image(response, final_path)
+        except Exception as e:
+            print(f"   ❌ Error: {e}")
+            stats["failed"] += 1
+            continue
+
+        if not ok:
+            print("   ⚠️ No image generated")
+            stats["failed"] += 1
+            continue
+
+        _record_final(manifest, item_id, item["hash"], item["size"], final_path, served_model())
+        stats["rendered"] += 1
+        print(f"   ✅ Saved: {final_path} ({served_model()})")
+
+    return stats
+
+
+def run_direct_batch(
+    client: GeminiClient,
+    model: str,
+    items: list[dict],
+    output_dir: Path,
+    force: bool = False,
+    display_name: str = "gemini-image",
+) -> dict:
+    """
+    承認を挟まずに本番画像をバッチジョブで生成（generate_from_yaml の direct / generate_all など）
+
+    items は {"id", "hash", "size", "contents", "config"} を持つ dict のリスト。
+    結果は本番画像として output_dir/<id>.png とマニフェストの final_* に記録し、
+    同じ内容で生成済みのアイテムはスキップする。
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    manifest = BatchManifest(output_dir / MANIFEST_NAME)
+    stats = {"rendered": 0, "skipped": 0, "failed": 0}
+
+    requests, meta, paths = [], {}, {}
+    for item in items:
+        item_id = item["id"]
+        final_path = output_dir / f"{item_id}.png"
+        if not force and final_up_to_date(manifest.item(item_id), item["hash"], item["size"], final_path, model):
+            print(f"⏭️  Up to date: {item_id}")
+            stats["skipped"] += 1
+            continue
+        requests.append({
+            "id": item_id,
+            "hash": f"{item['hash']}:{item['size']}",
+            "contents": item["contents"],
+            "config": item["config"],
+        })
+        meta[item_id], paths[item_id] = (item["hash"], item["size"]), final_path
+
+    if not requests:
+        return stats
+
+    save = _batch_saver(
+        paths, model, lambda item_id, path, served: _record_final(manifest, item_id, *meta[item_id], path, served)
+    )
+    result = batch_jobs.run_batch(client, manifest, "direct", model, requests, save, display_name=display_name)
+    stats["rendered"] += result["rendered"]
+    stats["failed"] += result["failed"]
+    return stats
+
+
+def print_status(items: list[dict], output_dir: Path):
+    """マニフェストの状態一覧を表示"""
+    manifest = BatchManifest(Path(output_dir) / MANIFEST_NAME)
+    print(f"{'ID':<30} {'draft':<8} {'approved':<9} {'final':<8}")
+    for item in items:
+        item_id = item["id"]
+        current = prompt_hash(item["prompt"], item.get("aspect_ratio", "16:9"))
+        entry = manifest.data["items"].get(item_id, {})
+        draft = "✅" if entry.get("draft_hash") == current else ("stale" if entry.get("draft_hash") else "-")
+        approved = "✅" if manifest.is_approved(item_id, current) else "-"
+        if (
+            entry.get("final_hash") == current
+            and entry.get("final_size") == item.get("image_size", "2K")
+            and entry.get("final_model", FINAL_MODEL) == FINAL_MODEL
+        ):
+            final = "✅"
+        elif entry.get("final_model", FINAL_MODEL) != FINAL_MODEL:
+            final = "fallback"
+        else:
+            final = "stale" if entry.get("final_hash") else "-"
+        print(f"{item_id:<30} {draft:<8} {approved:<9} {final:<8}")
@@ -18,10 +18,13 @@ import os
 from pathlib import Path
 
 from dotenv import load_dotenv
-from google import genai
 from google.genai import types
 from PIL import Image
 
+import image_daemon
+from gemini_client import GeminiClient, create_client, served_model
+from tracing import decode_image, save_image
+
 load_dotenv()
 
 
@@ -33,6 +36,7 @@ def edit_image(
     image_size: str = "2K",
     model: str = "pro",
     additional_images: list[str] | None = None,
+    client: GeminiClient | None = None,
 ) -> dict:
     """
     既存画像を編集
@@ -45,11 +49,12 @@ def edit_image(
         image_size: 解像度 (1K, 2K, 4K)
         model: モデル選択 (flash or pro)
         additional_images: 追加の参照画像パスリスト
+        client: 使い回すクライアント（省略時は作成）
 
     Returns:
         dict: 編集結果
     """
-    client = genai.Client()
+    client = client or create_client()
 
     model_id = (
         "gemini-3-pro-image-preview"
@@ -89,14 +94,14 @@ def edit_image(
         config=types.GenerateContentConfig(**config_params),
     )
 
-    result = {"text": None, "image_path": None}
+    result = {"text": None, "image_path": None, "model": served_model()}
 
     for part in response.parts:
         if not (hasattr(part, "thought") and part.thought):
             if part.text:
                 result["text"] = part.text
-            elif image := part.as_image():
-                image.save(output_path)
+            elif image := decode_image(part):
+                save_image(image, output_path)
                 result["image_path"] = output_path
 
     return result
@@ -118,7 +123,9 @@ def main():
     print(f"   Input: {args.input}")
     print(f"   Prompt: {args.prompt[:50]}...")
 
-    result = edit_image(
+    result = image_daemon.call_or_run(
+        "edit",
+        edit_image,
         prompt=args.prompt,
         input_path=args.input,
         output_path=args.output,
@@ -132,7 +139,7 @@ def main():
         print(f"\n📝 Text response:\n{result['text']}")
 
     if result["image_path"]:
-        print(f"\n✅ Edited image saved to: {result['image_path']}")
+        print(f"\n✅ Edited image saved to: {result['image_path']} ({result['model']})")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,489 @@
+#!/usr/bin/env python3
+"""
+gemini-image ツール共通の Gemini クライアント
+
+genai.Client を包み、generate_content / generate_content_stream /
+chats.create().send_message(_stream) / files.upload / batches の全呼び出しを
+tracing.TRACER で計測する。それ以外の属性は元のクライアントへそのまま委譲する。
+
+生成呼び出しは circuit_breaker のモデル別ブレーカーを通り、フォールバックが有効なら
+Pro が不調なときに Flash へ切り替わる。実際に応答したモデルは served_model() で取れる。
+ヘッジを有効にすると、非ストリームの generate_content / send_message は hedging で
+遅い呼び出しに複製リクエストを重ねる。
+credential_pool の設定（GEMINI_API_KEYS / credentials.yaml）があれば、models の呼び出しは
+最も空いているキーへ振り分けられ、429 のキーを避けて送り直される。
+models の呼び出しは送信前に preflight でサイズ・トークン数を検査し、見積もったトークン数で
+プールの tpm を予算化する。
+生成・チャットの呼び出しは scheduler の優先度（interactive / daily / bulk）に従って順番を待つ。
+待った時間はトレースの queue_wait スパンに記録される。
+
+Usage:
+    from gemini_client import create_client
+
+    client = create_client()
+    response = client.models.generate_content(model=..., contents=[...], config=...)
+"""
+
+import contextvars
+import functools
+import time
+
+from google import genai
+from google.genai import types
+
+import circuit_breaker
+import credential_pool
+import hedging
+import preflight
+import scheduler
+import tracing
+
+_served = contextvars.ContextVar("gemini_served_model", default=None)
+
+
+def served_model() -> str | None:
+    """直近の生成呼び出しに実際に応答したモデル（フォールバック後のモデルを含む）"""
+    return _served.get()
+
+
+def _http_options(http_options: types.HttpOptions | dict | None) -> types.HttpOptions:
+    """計測用の httpx イベントフックを追加した HttpOptions（同期・非同期クライアントの両方）"""
+    if isinstance(http_options, dict):
+        http_options = types.HttpOptions(**http_options)
+    http_options = http_options or types.HttpOptions()
+
+    def with_hooks(args, extra):
+        args = dict(args or {})
+        hooks = {k: list(v) for k, v in (args.get("event_hooks") or {}).items()}
+        for event, fns in extra.items():
+            hooks.setdefault(event, []).extend(fns)
+        args["event_hooks"] = hooks
+        return args
+
+    return http_options.model_copy(update={
+        "client_args": with_hooks(http_options.client_args, tracing.httpx_event_hooks()),
+        # ヘッジは new_client().aio を使うため、非同期側にも入れないと送信バイト数・リトライが記録されない
+        "async_client_args": with_hooks(http_options.async_client_args, tracing.httpx_async_event_hooks()),
+    })
+
+
+def _scheduled_stream(open_stream, estimated_tokens: int = 0):
+    """スケジューラのスロットを確保してからストリームを開き、消費し終えるまで保持する"""
+    with scheduler.SCHEDULER.slot(estimated_tokens):
+        tracing.TRACER.mark_dispatched()
+        yield from open_stream()
+
+
+def _request_latency(record, started: float) -> float:
+    """ブレーカーに記録するレイテンシ（スロット・キーの空き待ちを除く）"""
+    dispatched = record.dispatched_at if record is not None else None
+    return time.perf_counter() - (dispatched or started)
+
+
+class _TracedStream:
+    """
+    ストリームを包み、消費し終えた時点で記録を確定する
+
+    最初のチャンクが届く前に失敗した場合だけ、次のモデルへフォールバックする。
+    """
+
+    def __init__(self, open_stream, op: str, model: str, config=None, fallback: bool = False, on_served=None):
+        self._open_stream = open_stream  # (model, config) -> iterator
+        self._op = op
+        self._model = model
+        self._config = config
+        self._fallback = fallback
+        self._on_served = on_served
+
+    def __iter__(self):
+        attempts = circuit_breaker.plan(self._model, self._config, self._fallback)
+        for i, (model, config) in enumerate(attempts):
+            breaker = circuit_breaker.breaker_for(model)
+            is_last = i == len(attempts) - 1
+            if not breaker.allow():
+                if is_last:
+                    raise circuit_breaker.CircuitOpenError(model)
+                print(f"⏭️  {model} circuit open, falling back to {attempts[i + 1][0]}")
+                continue
+
+            started = time.perf_counter()
+            record = None
+            yielded = False
+            try:
+                with tracing.TRACER.call(
+                    self._op,
+                    model,
+                    stream=True,
+                    requested_model=self._model,
+                    priority=scheduler.current_priority(),
+                ) as record:
+                    last = None
+                    for chunk in self._open_stream(model, config):
+                        if "ttfb" not in record.spans:
+                            record.spans["ttfb"] = time.perf_counter() - record.started
+                            _served.set(model)
+                        last = chunk
+                        if not record.attrs.get("_measured_rx"):
+                            record.bytes_received += tracing._estimate_payload(chunk)
+                        yielded = True
+                        yield chunk
+                    if last is not None:
+                        record.attrs["_measured_rx"] = True
+                        record.observe_response(last)
+            except GeneratorExit:
+                breaker.record(True, _request_latency(record, started))
+                raise
+            except Exception as e:
+                retryable = circuit_breaker.is_retryable(e)
+                breaker.record_error(e, _request_latency(record, started))
+                if yielded or is_last or not retryable:
+                    raise
+                print(f"⚠️ {model} failed ({type(e).__name__}), falling back to {attempts[i + 1][0]}")
+                continue
+
+            breaker.record(True, _request_latency(record, started))
+            _served.set(model)
+            if self._on_served:
+                self._on_served(model)
+            return
+
+
+class TracedModels:
+    def __init__(self, models, lanes, fallback: bool = False, hedge: hedging.HedgePolicy | None = None):
+        self._models = models
+        self._lanes = lanes
+        self.fallback = fallback
+        self.hedge = hedge
+        self.preflight = preflight.Preflight.from_env(
+            count_fn=lambda m, c: self.count_tokens(model=m, contents=c).total_tokens
+        )
+
+    def count_tokens(self, *, model: str, contents, config=None):
+        with tracing.TRACER.call("count_tokens", model) as record:
+            response = self._models.count_tokens(model=model, contents=contents, config=config)
+            record.attrs["counted_tokens"] = response.total_tokens
+            return response
+
+    def generate_content(self, *, model: str, contents, config=None):
+        contents, tokens = self.preflight.check(model, contents, config)
+        waiting_since = [0.0]
+
+        def send(cred, attempt_model, attempt_config):
+            queue_wait = time.perf_counter() - waiting_since[0]
+            circuit_breaker.mark_sent()
+            try:
+                if self.hedge:
+                    return hedging.hedged_generate_content(
+                        cred.new_client, attempt_model, contents, attempt_config, self.hedge
+                    )
+                with tracing.TRACER.call(
+                    "generate_content",
+                    attempt_model,
+                    requested_model=model,
+                    estimated_tokens=tokens,
+                    priority=scheduler.current_priority(),
+                    **_credential_attrs(cred),
+                ) as record:
+                    record.spans["queue_wait"] = queue_wait
+                    response = cred.client.models.generate_content(
+                        model=attempt_model, contents=contents, config=attempt_config
+                    )
+                    record.observe_response(response)
+                    return response
+            finally:
+                # 429 で別のキーへ送り直す場合、次の待ちはここから数える
+                waiting_since[0] = time.perf_counter()
+
+        def call(attempt_model, attempt_config):
+            waiting_since[0] = time.perf_counter()
+            with scheduler.SCHEDULER.slot(tokens):
+                return self._lanes.run(lambda cred: send(cred, attempt_model, attempt_config), tokens)
+
+        response, served = circuit_breaker.call_with_breaker(call, model, config, self.fallback)
+        _served.set(served)
+        return response
+
+    def generate_content_stream(self, *, model: str, contents, config=None):
+        contents, tokens = self.preflight.check(model, contents, config)
+
+        def send(cred, attempt_model, attempt_config):
+            tracing.TRACER.mark_dispatched()
+            return cred.client.models.generate_content_stream(
+                model=attempt_model, contents=contents, config=attempt_config
+            )
+
+        return _TracedStream(
+            lambda m, c: _scheduled_stream(
+                lambda: self._lanes.stream(lambda cred: send(cred, m, c), tokens), tokens
+            ),
+            "generate_content_stream",
+            model,
+            config=config,
+            fallback=self.fallback,
+        )
+
+    def __getattr__(self, name):
+        return getattr(self._models, name)
+
+
+class TracedChat:
+    """
+    チャットセッション
+
+    フォールバックしたターンは代替モデルのチャット（同じ履歴）で送信し、
+    その結果を含む履歴で元モデルのチャットを作り直す。次のターンは元モデルから試す。
+    ヘッジ時は履歴＋メッセージを generate_content で送り、採用した応答を履歴に足して作り直す。
+    """
+
+    def __init__(
+        self,
+        chats,
+        model: str,
+        config=None,
+        history=None,
+        fallback: bool = False,
+        hedge: hedging.HedgePolicy | None = None,
+        new_client=None,
+    ):
+        self._chats = chats
+        self._config = config
+        self._chat = chats.create(model=model, config=config, history=history)
+        self.model = model
+        self.fallback = fallback
+        self.hedge = hedge
+        self._new_client = new_client
+
+    def _config_for(self, model: str):
+        if model == self.model:
+            return self._config
+        return next(c for m, c in circuit_breaker.plan(self.model, self._config, True) if m == model)
+
+    def _chat_for(self, model: str):
+        if model == self.model:
+            return self._chat
+        return self._chats.create(model=model, config=self._config_for(model), history=self._chat.get_history())
+
+    def _resync(self, chat):
+        """代替モデルで進んだ履歴で元モデルのチャットを作り直す"""
+        if chat is not self._chat:
+            self._chat = self._chats.create(model=self.model, config=self._config, history=chat.get_history())
+
+    def _send_hedged(self, model: str, message, config):
+        contents, _ = hedging.chat_turn_contents(self._chat.get_history(), message)
+        response = hedging.hedged_generate_content(
+            self._new_client,
+            model,
+            contents,
+            config if config is not None else self._config_for(model),
+            self.hedge,
+            op="chat.send_message",
+        )
+        reply = response.candidates[0].content if response.candidates else None
+        history = [*contents, reply] if reply else self._chat.get_history()
+        return response, self._chats.create(model=model, config=self._config_for(model), history=history)
+
+    def send_message(self, message, config=None):
+        used = {}
+
+        def call(attempt_model, attempt_config):
+            enqueued = time.perf_counter()
+            with scheduler.SCHEDULER.slot():
+                circuit_breaker.mark_sent()
+                if self.hedge:
+                    response, used[attempt_model] = self._send_hedged(attempt_model, message, attempt_config)
+                    return response
+                chat = used[attempt_model] = self._chat_for(attempt_model)
+                with tracing.TRACER.call(
+                    "chat.send_message",
+                    attempt_model,
+                    requested_model=self.model,
+                    priority=scheduler.current_priority(),
+                ) as record:
+                    record.spans["queue_wait"] = record.started - enqueued
+                    response = chat.send_message(message, config=attempt_config)
+                    record.observe_response(response)
+                    return response
+
+        response, served = circuit_breaker.call_with_breaker(call, self.model, config, self.fallback)
+        _served.set(served)
+        if served == self.model:
+            self._chat = used[served]
+        else:
+            self._resync(used[served])
+        return response
+
+    def send_message_stream(self, message, config=None):
+        used = {}
+
+        def open_stream(attempt_model, attempt_config):
+            chat = used[attempt_model] = self._chat_for(attempt_model)
+            return _scheduled_stream(lambda: chat.send_message_stream(message, config=attempt_config))
+
+        return _TracedStream(
+            open_stream,
+            "chat.send_message_stream",
+            self.model,
+            config=config,
+            fallback=self.fallback,
+            on_served=lambda served: self._resync(used[served]),
+        )
+
+    def __getattr__(self, name):
+        return getattr(self._chat, name)
+
+
+class TracedChats:
+    def __init__(self, chats, fallback: bool = False, hedge: hedging.HedgePolicy | None = None, new_client=None):
+        self._chats = chats
+        self.fallback = fallback
+        self.hedge = hedge
+        self._new_client = new_client
+
+    def create(self, *, model: str, config=None, history=None):
+        return TracedChat(
+            self._chats,
+            model,
+            config=config,
+            history=history,
+            fallback=self.fallback,
+            hedge=self.hedge,
+            new_client=self._new_client,
+        )
+
+    def __getattr__(self, name):
+        return getattr(self._chats, name)
+
+
+class TracedFiles:
+    def __init__(self, files):
+        self._files = files
+
+    def upload(self, *, file, config=None):
+        with tracing.TRACER.call("files.upload", "files") as record:
+            uploaded = self._files.upload(file=file, config=config)
+            record.attrs["size_bytes"] = getattr(uploaded, "size_bytes", None)
+            return uploaded
+
+    def __getattr__(self, name):
+        return getattr(self._files, name)
+
+
+def _credential_attrs(cred) -> dict:
+    return {"credential": cred.name} if cred.name else {}
+
+
+class _SingleKey:
+    """プール未設定時の振り分け先（キー1つ、追跡なし）"""
+
+    def __init__(self, client: genai.Client, new_client):
+        self.credential = credential_pool.Credential(None, None)
+        self.credential.client = client
+        self.credential.new_client = new_client
+
+    def run(self, fn, estimated_tokens: int = 0):
+        return fn(self.credential)
+
+    def stream(self, fn, estimated_tokens: int = 0):
+        return fn(self.credential)
+
+
+class TracedBatches:
+    def __init__(self, batches):
+        self._batches = batches
+
+    def create(self, *, model: str, src, config=None):
+        with tracing.TRACER.call("batches.create", model, requests=len(src)):
+            return self._batches.create(model=model, src=src, config=config)
+
+    def get(self, *, name: str, config=None):
+        with tracing.TRACER.call("batches.get", "batches") as record:
+            job = self._batches.get(name=name, config=config)
+            record.attrs["state"] = getattr(job.state, "value", None)
+            return job
+
+    def __getattr__(self, name):
+        return getattr(self._batches, name)
+
+
+class GeminiClient:
+    """
+    計測付きの genai.Client ラッパー
+
+    プール使用時、チャット・ファイル・バッチジョブは先頭のキー（raw）に固定される。
+    アップロードしたファイルはそのキーのプロジェクトからしか参照できないため、
+    プールで振り分ける生成呼び出しには inline データを使うこと。
+    """
+
+    def __init__(
+        self,
+        client: genai.Client,
+        fallback: bool = False,
+        hedge: hedging.HedgePolicy | None = None,
+        new_client=None,
+        pool: credential_pool.CredentialPool | None = None,
+    ):
+        self.raw = client
+        self.fallback = fallback
+        self.hedge = hedge
+        self.pool = pool
+        lanes = pool or _SingleKey(client, new_client)
+        self.models = TracedModels(client.models, lanes, fallback, hedge)
+        self.chats = TracedChats(client.chats, fallback, hedge, new_client)
+        self.files = TracedFiles(client.files)
+        self.batches = TracedBatches(client.batches)
+
+    def __getattr__(self, name):
+        return getattr(self.raw, name)
+
+
+def create_client(
+    api_key: str | None = None,
+    http_options=None,
+    fallback: bool | None = None,
+    hedge: bool | hedging.HedgePolicy | None = None,
+    pool: bool | credential_pool.CredentialPool | None = None,
+    **kwargs,
+) -> GeminiClient:
+    """
+    計測付きクライアントを作成
+
+    クレデンシャルプールが設定されていればそれを使い（pool=False で無効）、
+    無ければ api_key、省略時は SDK の既定（GEMINI_API_KEY / GOOGLE_API_KEY）に従う。
+    fallback / hedge を省略した場合は環境変数 GEMINI_FALLBACK / GEMINI_HEDGE に従う。
+    hedge には True（環境変数の設定を使う）か HedgePolicy を渡す。
+    """
+    if pool is None or pool is True:
+        pool = credential_pool.CredentialPool.from_env()
+    http_options = _http_options(http_options)
+    if pool:
+        for cred in pool.credentials:
+            cred.client = genai.Client(api_key=cred.api_key, http_options=http_options, **kwargs)
+            cred.new_client = functools.partial(
+                genai.Client, api_key=cred.api_key, http_options=http_options, **kwargs
+            )
+        first = pool.credentials[0]
+        return GeminiClient(
+            first.client, _resolve_fallback(fallback), _resolve_hedge(hedge), first.new_client, pool
+        )
+
+    if api_key:
+        kwargs["api_key"] = api_key
+    client = genai.Client(http_options=http_options, **kwargs)
+    return GeminiClient(
+        client,
+        _resolve_fallback(fallback),
+        _resolve_hedge(hedge),
+        new_client=lambda: genai.Client(http_options=http_options, **kwargs),
+    )
+
+
+def _resolve_fallback(fallback: bool | None) -> bool:
+    return circuit_breaker.fallback_enabled() if fallback is None else fallback
+
+
+def _resolve_hedge(hedge) -> hedging.HedgePolicy | None:
+    if hedge is None:
+        hedge = hedging.hedge_enabled()
+    if hedge is True:
+        hedge = hedging.HedgePolicy.from_env()
+    return hedge or None
@@ -11,17 +11,25 @@ Options:
     --size, -s       解像度 1K/2K/4K (default: 2K)
     --model, -m      モデル flash/pro (default: pro)
     --search         Google検索グラウンディング有効化
+    --stream         ストリーミング出力（テキスト逐次表示・画像即時保存）
+    --variants       N バリアントを生成し、ローカルスコアで最良を選択
 """
 
 import argparse
 import os
 import sys
+import time
 from pathlib import Path
 
 from dotenv import load_dotenv
-from google import genai
 from google.genai import types
 
+import image_daemon
+from gemini_client import GeminiClient, create_client, served_model
+from streaming import consume_stream
+from tracing import decode_image, save_image
+from variants import generate_variants
+
 load_dotenv()
 
 
@@ -32,6 +40,10 @@ def generate_image(
     image_size: str = "2K",
     model: str = "pro",
     use_search: bool = False,
+    stream: bool = False,
+    variants: int = 1,
+    hedge: bool = False,
+    client: GeminiClient | None = None,
 ) -> dict:
     """
     Gemini APIで画像を生成
@@ -43,11 +55,17 @@ def generate_image(
         image_size: 解像度 (1K, 2K, 4K) - Proモデルのみ
         model: モデル選択 (flash or pro)
         use_search: Google検索グラウンディング使用
+        stream: ストリーミングで受信し、到着したパートから順に出力
+        variants: 2以上なら N バリアントを生成し最良を output_path に保存
+        hedge: 直近レイテンシの p90 を過ぎたら複製リクエストを投げ、先に返った方を採用
+               （False のときは環境変数 GEMINI_HEDGE に従う）
+        client: 使い回すクライアント（省略時は作成。hedge は作成時のみ有効）
 
     Returns:
-        dict: 生成結果 (text, image_path, thinking)
+        dict: 生成結果 (text, image_path, thinking, model)。stream時は ttfb, elapsed も含む
+              model は実際に応答したモデル（フォールバック時は代替モデル）
     """
-    client = genai.Client()
+    client = client or create_client(hedge=hedge or None)
 
     model_id = (
         "gemini-3-pro-image-preview"
@@ -71,29 +89,55 @@ def generate_image(
     if use_search and model == "pro":
         config_params["tools"] = [{"google_search": {}}]
 
+    config = types.GenerateContentConfig(**config_params)
+
+    # 思考画像は出力ファイルと同じディレクトリへ（デーモン経由でも呼び出し側の場所に残る）
+    def thinking_path(i: int) -> str:
+        return str(Path(output_path).with_name(f"thinking_{i}.png"))
+
+    if variants > 1:
+        result = generate_variants(client, model_id, [prompt], config, variants, output_path)
+        return {"text": None, "thinking": [], **result}
+
+    if stream:
+        started_at = time.perf_counter()
+        chunks = client.models.generate_content_stream(
+            model=model_id,
+            contents=[prompt],
+            config=config,
+        )
+        result = consume_stream(
+            chunks,
+            final_path=lambda: output_path,
+            thinking_path=thinking_path,
+            started_at=started_at,
+        )
+        result["model"] = served_model()
+        return result
+
     response = client.models.generate_content(
         model=model_id,
         contents=[prompt],
-        config=types.GenerateContentConfig(**config_params),
+        config=config,
     )
 
-    result = {"text": None, "image_path": None, "thinking": []}
+    result = {"text": None, "image_path": None, "thinking": [], "model": served_model()}
 
     for part in response.parts:
         if hasattr(part, "thought") and part.thought:
             # 思考プロセス（中間画像）
             if part.text:
                 result["thinking"].append({"type": "text", "content": part.text})
-            elif image := part.as_image():
-                thinking_path = f"thinking_{len(result['thinking'])}.png"
-                image.save(thinking_path)
-                result["thinking"].append({"type": "image", "path": thinking_path})
+            elif image := decode_image(part):
+                path = thinking_path(len(result["thinking"]))
+                save_image(image, path)
+                result["thinking"].append({"type": "image", "path": path})
         else:
             # 最終出力
             if part.text:
                 result["text"] = part.text
-            elif image := part.as_image():
-                image.save(output_path)
+            elif image := decode_image(part):
+                save_image(image, output_path)
                 result["image_path"] = output_path
 
     return result
@@ -107,27 +151,56 @@ def main():
     parser.add_argument("-s", "--size", default="2K", choices=["1K", "2K", "4K"], help="解像度")
     parser.add_argument("-m", "--model", default="pro", choices=["flash", "pro"], help="モデル")
     parser.add_argument("--search", action="store_true", help="Google検索グラウンディング")
+    parser.add_argument("--stream", action="store_true", help="ストリーミング出力")
+    parser.add_argument("--variants", type=int, default=1, help="生成するバリアント数 (best-of-N)")
+    parser.add_argument("--hedge", action="store_true", help="遅い応答に複製リクエストを重ねる（非ストリームのみ）")
 
     args = parser.parse_args()
+    if args.variants > 1 and args.stream:
+        parser.error("--variants cannot be combined with --stream")
+    if args.hedge and args.stream:
+        parser.error("--hedge cannot be combined with --stream")
 
     print(f"🎨 Generating image with {args.model} model...")
     print(f"   Prompt: {args.prompt[:50]}...")
     print(f"   Aspect: {args.aspect}, Size: {args.size}")
 
-    result = generate_image(
+    params = dict(
         prompt=args.prompt,
         output_path=args.output,
         aspect_ratio=args.aspect,
         image_size=args.size,
         model=args.model,
         use_search=args.search,
+        variants=args.variants,
+        hedge=args.hedge,
     )
+    if args.stream:
+        # ストリーミングは逐次出力のため常にこのプロセスで実行
+        result = generate_image(stream=True, **params)
+    else:
+        result = image_daemon.call_or_run("generate", generate_image, **params)
+
+    if args.stream:
+        # テキスト・画像はストリーム中に出力済み
+        if result["image_path"]:
+            print(f"\n✅ Image saved to: {result['image_path']} ({result['model']})")
+        if result["thinking"]:
+            print(f"🧠 Thinking process: {len(result['thinking'])} steps")
+        if result["ttfb"] is not None:
+            print(f"⏱️  TTFB: {result['ttfb']:.2f}s, Total: {result['elapsed']:.2f}s")
+        return
 
     if result["text"]:
         print(f"\n📝 Text response:\n{result['text']}")
 
     if result["image_path"]:
-        print(f"\n✅ Image saved to: {result['image_path']}")
+        print(f"\n✅ Image saved to: {result['image_path']} ({result['model']})")
+
+    if result.get("variants"):
+        print(f"\n🎲 {len(result['variants'])} variants ({result['mode']}):")
+        for v in result["variants"]:
+            print(f"   {v['score']:.2f}  {v['path']}")
 
     if result["thinking"]:
         print(f"\n🧠 Thinking process: {len(result['thinking'])} steps")
@@ -1,45 +1,65 @@
 #!/usr/bin/env python3
 """
 Generate infographic images from YAML configuration.
+
+Usage:
+    python generate_from_yaml.py images.yaml                  # direct (final quality)
+    python generate_from_yaml.py images.yaml --phase draft    # fast flash drafts
+    python generate_from_yaml.py images.yaml --approve ID ... # approve drafts
+    python generate_from_yaml.py images.yaml --phase final    # upscale approved items
+    python generate_from_yaml.py images.yaml --status
+    python generate_from_yaml.py images.yaml --batch          # submit as a provider batch job (any phase)
 """
 
 import argparse
 import os
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 import yaml
 from dotenv import load_dotenv
-from google import genai
 from google.genai import types
 
+import credential_pool
+import draft_pipeline
+import scheduler
+from gemini_client import GeminiClient, create_client, served_model
+from tracing import decode_image, save_image
+
 load_dotenv()
 
 def load_yaml(path: str) -> dict:
     with open(path, "r", encoding="utf-8") as f:
         return yaml.safe_load(f)
 
-def generate_image(client: genai.Client, prompt: str, output_path: str, aspect_ratio: str = "16:9", image_size: str = "2K"):
+MODEL = "gemini-3-pro-image-preview"
+
+def image_config(aspect_ratio: str, image_size: str) -> types.GenerateContentConfig:
+    return types.GenerateContentConfig(
+        response_modalities=["TEXT", "IMAGE"],
+        image_config=types.ImageConfig(
+            aspect_ratio=aspect_ratio,
+            image_size=image_size,
+        ),
+    )
+
+def generate_image(client: GeminiClient, prompt: str, output_path: str, aspect_ratio: str = "16:9", image_size: str = "2K"):
     print(f"🎨 Generating image for: {output_path}...")
     try:
         response = client.models.generate_content(
-            model="gemini-3-pro-image-preview",
+            model=MODEL,
             contents=[prompt],
-            config=types.GenerateContentConfig(
-                response_modalities=["TEXT", "IMAGE"],
-                image_config=types.ImageConfig(
-                    aspect_ratio=aspect_ratio,
-                ),
-            ),
+            config=image_config(aspect_ratio, image_size),
         )
 
         for part in response.parts:
             if hasattr(part, "inline_data") and part.inline_data:
                  pass # wait, 3-preview might return differently? infographic.py uses part.as_image().
             
-            if image := part.as_image():
-                image.save(output_path)
-                print(f"✅ Saved to {output_path}")
+            if image := decode_image(part):
+                save_image(image, output_path)
+                print(f"✅ Saved to {output_path} ({served_model()})")
                 return True
         
         print(f"⚠️ No image generated for {output_path}")
@@ -49,48 +69,107 @@ def generate_image(client: genai.Client, prompt: str, output_path: str, aspect_r
         print(f"❌ Error generating {output_path}: {e}")
         return False
 
+def load_items(config: dict) -> list[dict]:
+    """YAMLの images から有効なアイテムだけを取り出す"""
+    items = []
+    for img_conf in config.get("images", []):
+        img_id = img_conf.get("id")
+        prompt = img_conf.get("prompt")
+        if not img_id or not prompt:
+            print(f"Skipping invalid config: {img_conf}")
+            continue
+        items.append({
+            "id": img_id,
+            "prompt": prompt,
+            "aspect_ratio": img_conf.get("aspect_ratio", "16:9"),
+            "image_size": img_conf.get("image_size", "2K"),
+        })
+    return items
+
 def main():
     parser = argparse.ArgumentParser(description="Generate images from YAML")
     parser.add_argument("yaml_file", help="Path to YAML file")
+    parser.add_argument("--phase", default="direct", choices=["direct", "draft", "final"],
+                        help="direct: render at final quality / draft: flash 1K drafts / final: upscale approved drafts")
+    parser.add_argument("--approve", nargs="+", metavar="ID", help="Approve drafts for the final phase")
+    parser.add_argument("--unapprove", nargs="+", metavar="ID", help="Withdraw approval")
+    parser.add_argument("--status", action="store_true", help="Show draft/approval/final status")
+    parser.add_argument("--force", action="store_true", help="Re-render even if up to date")
+    parser.add_argument("-j", "--jobs", type=int,
+                        help="Parallel requests in direct phase (default: 1, or one per key with a credential pool)")
+    parser.add_argument("--batch", action="store_true",
+                        help="Submit as a provider batch job and poll until done (cheaper, no latency guarantee; resumable)")
     args = parser.parse_args()
+    # 大量レンダリングは対話的な呼び出しに順番を譲る
+    scheduler.set_default("bulk")
 
     config = load_yaml(args.yaml_file)
-    
+    output_base = Path(config.get("output_dir", "output/images"))
+    items = load_items(config)
+
+    if args.approve or args.unapprove:
+        manifest = draft_pipeline.BatchManifest(output_base / draft_pipeline.MANIFEST_NAME)
+        missing = manifest.approve(args.approve or [], True) + manifest.approve(args.unapprove or [], False)
+        for item_id in missing:
+            print(f"⚠️ No draft for {item_id}, run --phase draft first")
+        draft_pipeline.print_status(items, output_base)
+        return
+
+    if args.status:
+        draft_pipeline.print_status(items, output_base)
+        return
+
     api_key = os.environ.get("GEMINI_API_KEY") or os.environ.get("GOOGLE_API_KEY")
-    if not api_key:
+    if not api_key and not credential_pool.configured():
         print("❌ GEMINI_API_KEY or GOOGLE_API_KEY not found in environment.")
-        print("Please set it via: export GEMINI_API_KEY='your_key'")
+        print("Please set it via: export GEMINI_API_KEY='your_key' (or GEMINI_API_KEYS for a key pool)")
         return
 
-    client = genai.Client(api_key=api_key)
+    client = create_client(api_key=api_key)
 
-    output_base = Path("output/images")
     output_base.mkdir(parents=True, exist_ok=True)
 
-    images = config.get("images", [])
-    total = len(images)
-    success = 0
-
+    total = len(items)
     print(f"Found {total} images to generate.")
 
-    for img_conf in images:
-        img_id = img_conf.get("id")
-        prompt = img_conf.get("prompt")
-        aspect = img_conf.get("aspect_ratio", "16:9")
-        size = img_conf.get("image_size", "2K") # Note: Yaml has '2K', API might expect something else or string is fine? infographic.py uses string "2K".
+    if args.phase == "draft":
+        stats = draft_pipeline.run_drafts(client, items, output_base, force=args.force, batch=args.batch)
+        print(f"\nFinished drafts. {stats}")
+        return
 
-        if not img_id or not prompt:
-            print(f"Skipping invalid config: {img_conf}")
-            continue
+    if args.phase == "final":
+        stats = draft_pipeline.run_finals(client, items, output_base, force=args.force, batch=args.batch)
+        print(f"\nFinished finals. {stats}")
+        return
 
-        output_path = output_base / f"{img_id}.png"
-        
-        # Check if exists? Maybe overwrite is better.
-        
-        if generate_image(client, prompt, str(output_path), aspect, size):
-            success += 1
+    if args.batch:
+        batch_items = [
+            {
+                "id": item["id"],
+                "hash": draft_pipeline.prompt_hash(item["prompt"], item["aspect_ratio"]),
+                "size": item["image_size"],
+                "contents": [item["prompt"]],
+                "config": image_config(item["aspect_ratio"], item["image_size"]),
+            }
+            for item in items
+        ]
+        stats = draft_pipeline.run_direct_batch(
+            client, MODEL, batch_items, output_base, force=args.force, display_name=Path(args.yaml_file).stem
+        )
+        print(f"\nFinished batch. {stats}")
+        return
+
+    def render(item):
+        output_path = output_base / f"{item['id']}.png"
+        return generate_image(client, item["prompt"], str(output_path), item["aspect_ratio"], item["image_size"])
+
+    jobs = args.jobs or (len(client.pool.credentials) if client.pool else 1)
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        success = sum(pool.map(render, items))
 
     print(f"\nFinished. Success: {success}/{total}")
+    if client.pool:
+        client.pool.print_stats()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+ヘッジリクエスト（対話的な生成のテールレイテンシ対策）
+
+リクエストが直近レイテンシの指定パーセンタイル（既定 p90）を過ぎても返らなければ、
+同じリクエストをもう1本投げ、先に返った方を採用して残りをキャンセルする。
+追加コストは「ヘッジを撃った呼び出しの割合」の上限で抑える（既定 20%）。
+
+レイテンシ履歴と発火・勝利回数はワンショット CLI 間で共有するため
+~/.gemini-image/hedge.json に保存する。
+
+Usage:
+    python generate.py "..." --hedge
+    GEMINI_HEDGE=1 python chat.py
+    python hedging.py stats
+"""
+
+import argparse
+import asyncio
+import contextvars
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from google.genai import types
+
+import tracing
+
+STATE_FILE = Path(os.environ.get("GEMINI_HEDGE_STATE", "~/.gemini-image/hedge.json")).expanduser()
+HISTORY_SIZE = 200
+
+
+def hedge_enabled() -> bool:
+    return os.environ.get("GEMINI_HEDGE", "").lower() in ("1", "true", "yes", "on")
+
+
+class HedgePolicy:
+    """
+    ヘッジの発火タイミングと追加コスト上限
+
+    Args:
+        percentile: この割合のレイテンシを過ぎたらヘッジを撃つ (0-1)
+        max_extra: 直近の呼び出しのうちヘッジを撃ってよい割合の上限
+        min_samples: 履歴がこれ未満のモデルは default_delay を使う
+        default_delay: 履歴不足時の待ち秒数。None なら履歴が貯まるまでヘッジしない
+    """
+
+    def __init__(
+        self,
+        percentile: float = 0.9,
+        max_extra: float = 0.2,
+        min_samples: int = 10,
+        default_delay: float | None = None,
+        state_file: Path = STATE_FILE,
+    ):
+        self.percentile = percentile
+        self.max_extra = max_extra
+        self.min_samples = min_samples
+        self.default_delay = default_delay
+        self.state_file = Path(state_file)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "HedgePolicy":
+        delay = os.environ.get("GEMINI_HEDGE_DELAY")
+        return cls(
+            percentile=float(os.environ.get("GEMINI_HEDGE_PERCENTILE", "0.9")),
+            max_extra=float(os.environ.get("GEMINI_HEDGE_MAX_EXTRA", "0.2")),
+            default_delay=float(delay) if delay else None,
+        )
+
+    def _load(self) -> dict:
+        if not self.state_file.exists():
+            return {}
+        try:
+            with open(self.state_file, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return {}
+
+    def _save(self, state: dict):
+        self.state_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.state_file.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        tmp.replace(self.state_file)
+
+    def delay(self, model: str) -> float | None:
+        """ヘッジを撃つまでの秒数。上限到達・履歴不足なら None"""
+        with self._lock:
+            entry = self._load().get(model, {})
+        recent = entry.get("recent", [])
+        if recent and sum(1 for r in recent if r["hedged"]) / len(recent) >= self.max_extra:
+            return None
+        if len(recent) < self.min_samples:
+            return self.default_delay
+        latencies = sorted(r["latency"] for r in recent)
+        return latencies[min(len(latencies) - 1, int(self.percentile * len(latencies)))]
+
+    def record(self, model: str, latency: float, hedged: bool, won: bool):
+        with self._lock:
+            state = self._load()
+            entry = state.setdefault(model, {"recent": [], "calls": 0, "fired": 0, "won": 0})
+            entry["recent"] = (entry["recent"] + [
+                {"latency": round(latency, 3), "hedged": hedged}
+            ])[-HISTORY_SIZE:]
+            entry["calls"] += 1
+            entry["fired"] += hedged
+            entry["won"] += won
+            self._save(state)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return self._load()
+
+
+async def _attempt(aclient, model, contents, config, role, op):
+    with tracing.TRACER.call(op, model, hedge=role) as record:
+        response = await aclient.models.generate_content(model=model, contents=contents, config=config)
+        record.observe_response(response)
+        return response
+
+
+async def _race(aclient, model, contents, config, delay, op):
+    """(response, hedged, hedge_won)。先に成功した方を採用し、もう一方はキャンセル"""
+    primary = asyncio.create_task(_attempt(aclient, model, contents, config, "primary", op))
+    done, _ = await asyncio.wait({primary}, timeout=delay)
+    if done or delay is None:
+        return await primary, False, False
+
+    print(f"🏁 No response after {delay:.1f}s, sending hedge request")
+    hedge = asyncio.create_task(_attempt(aclient, model, contents, config, "hedge", op))
+    pending = {primary, hedge}
+    errors = {}
+    while pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            if task.exception() is not None:
+                errors[task] = task.exception()
+                continue
+            for loser in pending:
+                loser.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+            return task.result(), True, task is hedge
+    raise errors.get(primary) or errors[hedge]
+
+
+def hedged_generate_content(new_client, model: str, contents, config, policy: HedgePolicy, op: str = "generate_content"):
+    """
+    generate_content をヘッジ付きで実行
+
+    Args:
+        new_client: genai.Client を新しく作る関数（イベントループごとに非同期クライアントを分けるため）
+    """
+    delay = policy.delay(model)
+
+    async def run():
+        aclient = new_client().aio
+        try:
+            return await _race(aclient, model, contents, config, delay, op)
+        finally:
+            await aclient.aclose()
+
+    started = time.perf_counter()
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        response, hedged, won = asyncio.run(run())
+    else:
+        # 呼び出し元がイベントループ上（voicy_pipeline など）: 別スレッドの新しいループで実行する
+        # （トレース・優先度の contextvar を引き継ぐ）
+        context = contextvars.copy_context()
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            response, hedged, won = pool.submit(context.run, asyncio.run, run()).result()
+    latency = time.perf_counter() - started
+    policy.record(model, latency, hedged, won)
+    if hedged:
+        print(f"🏁 {'Hedge' if won else 'Primary'} request won ({latency:.1f}s)")
+    return response
+
+
+def chat_turn_contents(history: list, message) -> tuple[list, types.Content]:
+    """チャットの履歴と新しいメッセージから generate_content 用の contents を作る"""
+    parts = message if isinstance(message, list) else [message]
+    user_content = types.UserContent(parts=parts)
+    return [*history, user_content], user_content
+
+
+def print_stats(policy: HedgePolicy):
+    state = policy.stats()
+    print(f"{'model':<32} {'calls':>6} {'fired':>6} {'fire%':>6} {'won':>5} {'win%':>6} {'delay':>7}")
+    for model, entry in sorted(state.items()):
+        calls, fired, won = entry["calls"], entry["fired"], entry["won"]
+        delay = policy.delay(model)
+        print(f"{model:<32} {calls:>6} {fired:>6} {100 * fired / max(calls, 1):>6.1f} "
+              f"{won:>5} {100 * won / max(fired, 1):>6.1f} "
+              f"{(f'{delay:.1f}s' if delay is not None else '-'):>7}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hedged request statistics")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("stats", help="モデル別のヘッジ発火率・勝率・現在の待ち時間")
+    sub.add_parser("reset", help="レイテンシ履歴と統計を消去")
+    args = parser.parse_args()
+
+    policy = HedgePolicy.from_env()
+    if args.command == "reset":
+        policy.state_file.unlink(missing_ok=True)
+        print(f"🗑️  Removed {policy.state_file}")
+        return
+    print_stats(policy)
+
+
+if __name__ == "__main__":
+    main()
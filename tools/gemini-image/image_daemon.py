@@ -0,0 +1,393 @@
+#!/usr/bin/env python3
+"""
+ローカル画像生成デーモン
+
+generate / edit / infographic を常駐プロセスで実行する localhost HTTP サーバー。
+各 CLI は起動中のデーモンがあればリクエストを送るだけの薄いクライアントになり、
+無ければ従来どおり自分のプロセスで生成する。
+
+- クライアント（SDK・接続プール・クレデンシャルプール・ブレーカー・レイテンシ履歴）を
+  プロセス内で使い回すため、CLI ごとのコールドスタートが無く、同時に動くツール同士が
+  別々にクォータを奪い合わない
+- 同じ内容のリクエストが処理中なら新たに送らず、その結果を待って共有する（singleflight）。
+  出力パスが違う場合は生成された画像をコピーする
+
+呼び出し側の優先度（scheduler.py）をヘッダーで渡し、デーモン内でも同じ優先度で順番を待つ。
+既定ではスロットを4つ持ち、1つを interactive 用に空けておく（--slots / --reserved）。
+
+パスはクライアント側で絶対パスにして渡すため、デーモンと CLI は同じマシン上で動かす。
+ブラウザ上のページから送られたリクエスト（Origin ヘッダー付き、または Content-Type が
+application/json 以外）は拒否する。
+ストリーミング（--stream）、チャット、YAML/Markdown のバッチは従来どおり各プロセスで実行する。
+
+Usage:
+    python image_daemon.py                       # http://127.0.0.1:8790 で起動
+    python image_daemon.py --port 8791
+    python image_daemon.py status                # 稼働状況と集計
+
+    export GEMINI_DAEMON_URL=http://127.0.0.1:8791   # CLI 側の接続先
+    export GEMINI_DAEMON=off                         # デーモンを使わない
+"""
+
+import argparse
+import hashlib
+import importlib
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import urlparse
+
+import scheduler
+
+DEFAULT_URL = "http://127.0.0.1:8790"
+DEFAULT_SLOTS = 4
+PRIORITY_HEADER = "X-Gemini-Priority"
+# 操作名 -> (モジュール, 関数)
+OPERATIONS = {
+    "generate": ("generate", "generate_image"),
+    "edit": ("edit", "edit_image"),
+    "infographic": ("infographic", "generate_infographic"),
+}
+PATH_FIELDS = ("output_path", "input_path")
+PATH_LIST_FIELDS = ("additional_images",)
+# 内容に影響しないため singleflight のキーから除くパラメータ
+NON_KEY_FIELDS = ("output_path", "hedge")
+
+
+class DaemonError(RuntimeError):
+    """デーモン側で生成に失敗した"""
+
+
+def daemon_url() -> str | None:
+    """接続先 URL（GEMINI_DAEMON=off なら None）"""
+    if os.environ.get("GEMINI_DAEMON", "").lower() in ("0", "off", "false", "no"):
+        return None
+    return os.environ.get("GEMINI_DAEMON_URL", DEFAULT_URL).rstrip("/")
+
+
+# ---------------------------------------------------------------------------
+# クライアント側
+# ---------------------------------------------------------------------------
+
+
+def _absolute_paths(params: dict) -> dict:
+    params = dict(params)
+    for key in PATH_FIELDS:
+        if params.get(key):
+            params[key] = str(Path(params[key]).resolve())
+    for key in PATH_LIST_FIELDS:
+        if params.get(key):
+            params[key] = [str(Path(p).resolve()) for p in params[key]]
+    return params
+
+
+def _request(method: str, path: str, payload: dict | None = None, timeout: float | None = None) -> dict | None:
+    """デーモンへ送る。起動していなければ None"""
+    url = daemon_url()
+    if url is None:
+        return None
+    data = json.dumps(payload).encode() if payload is not None else None
+    request = urllib.request.Request(
+        url + path,
+        data=data,
+        method=method,
+        headers={"Content-Type": "application/json", PRIORITY_HEADER: scheduler.current_priority()},
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        try:
+            error = json.loads(e.read()).get("error", {})
+        except ValueError:
+            error = {}
+        raise DaemonError(f"{error.get('type', e.code)}: {error.get('message', e.reason)}") from None
+    except (urllib.error.URLError, ConnectionError):
+        return None
+
+
+def call(op: str, **params) -> dict | None:
+    """
+    デーモンで op を実行して結果を返す
+
+    デーモンが無い・無効なら None。デーモン側のエラーは DaemonError。
+    """
+    response = _request("POST", f"/v1/{op}", _absolute_paths(params))
+    if response is None:
+        return None
+    note = " (coalesced)" if response.get("coalesced") else ""
+    print(f"🛰️  Served by image daemon{note}")
+    return response["result"]
+
+
+def call_or_run(op: str, fn, **params) -> dict:
+    """デーモンがあれば送り、無ければ fn(**params) をこのプロセスで実行"""
+    result = call(op, **params)
+    if result is None:
+        result = fn(**params)
+    return result
+
+
+# ---------------------------------------------------------------------------
+# サーバー側
+# ---------------------------------------------------------------------------
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """同じキーの処理が実行中なら、それを待って同じ結果を返す"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: dict[str, _Call] = {}
+
+    def do(self, key: str, fn) -> tuple[object, bool]:
+        """(結果, 他の呼び出しの結果を共有したか)"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+
+def _file_digest(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def request_key(op: str, params: dict) -> str:
+    """出力先を除いた内容のハッシュ（入力画像はパスではなく中身で比べる）"""
+    keyed = {k: v for k, v in params.items() if k not in NON_KEY_FIELDS}
+    if keyed.get("input_path"):
+        keyed["input_path"] = _file_digest(keyed["input_path"])
+    for key in PATH_LIST_FIELDS:
+        if keyed.get(key):
+            keyed[key] = [_file_digest(p) for p in keyed[key]]
+    blob = json.dumps({"op": op, **keyed}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+def _share_result(result: dict, output_path: str | None) -> dict:
+    """共有した結果の画像を、この呼び出しの出力パスにもコピー"""
+    source = result.get("image_path")
+    if not (source and output_path) or Path(source).resolve() == Path(output_path).resolve():
+        return result
+    Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+    shutil.copyfile(source, output_path)
+    return {**result, "image_path": output_path}
+
+
+class ImageDaemon:
+    """常駐クライアントと singleflight を持つ生成サービス"""
+
+    def __init__(self):
+        self.started = time.time()
+        self.flight = SingleFlight()
+        self._clients = {}
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "coalesced": 0, "errors": 0, "by_op": {op: 0 for op in OPERATIONS}}
+
+    def client(self, hedge: bool = False):
+        """ヘッジ設定ごとに1つのクライアントを使い回す"""
+        from gemini_client import create_client
+
+        with self._lock:
+            if hedge not in self._clients:
+                self._clients[hedge] = create_client(hedge=hedge or None)
+            return self._clients[hedge]
+
+    def warm(self):
+        """SDK と各ツールを読み込み、既定のクライアントを作っておく"""
+        for module, _ in OPERATIONS.values():
+            importlib.import_module(module)
+        self.client()
+
+    def count(self, key: str, op: str | None = None):
+        with self._lock:
+            self.stats[key] += 1
+            if op:
+                self.stats["by_op"][op] += 1
+
+    def _run(self, op: str, params: dict) -> dict:
+        params = dict(params)
+        hedge = bool(params.pop("hedge", False))
+        module, name = OPERATIONS[op]
+        fn = getattr(importlib.import_module(module), name)
+        return fn(client=self.client(hedge), **params)
+
+    def handle(self, op: str, params: dict) -> dict:
+        self.count("requests", op)
+        key = request_key(op, params)
+        try:
+            result, shared = self.flight.do(key, lambda: self._run(op, params))
+        except Exception:
+            self.count("errors")
+            raise
+        if shared:
+            self.count("coalesced")
+            result = _share_result(result, params.get("output_path"))
+        return {"result": result, "coalesced": shared}
+
+    def status(self) -> dict:
+        with self._lock:
+            stats = json.loads(json.dumps(self.stats))
+        return {
+            "pid": os.getpid(),
+            "uptime": round(time.time() - self.started, 1),
+            "in_flight": self.flight.in_flight(),
+            **stats,
+            "scheduler": scheduler.SCHEDULER.stats(),
+        }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    daemon: ImageDaemon = None
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, payload: dict):
+        data = json.dumps(payload, ensure_ascii=False).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_error(self, status: int, error_type: str, message: str):
+        self._send_json(status, {"error": {"type": error_type, "message": message}})
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path in ("/health", "/stats"):
+            self._send_json(200, self.daemon.status())
+            return
+        self._send_error(404, "NotFound", f"Unknown path {path}")
+
+    def _reject_browser_request(self) -> bool:
+        """
+        ブラウザからの POST を拒否する（拒否したら True）
+
+        認証の無い localhost なので、開いている任意のページから text/plain の POST で
+        クォータを使われ、任意のファイルを PNG で上書きされうる。ブラウザの POST は必ず Origin を付け、
+        application/json はプリフライト（このサーバーは応答しない）無しには送れない。
+        """
+        if self.headers.get("Origin") is not None:
+            status, error_type, message = 403, "Forbidden", "Requests from browsers are not accepted"
+        elif self.headers.get_content_type() != "application/json":
+            status, error_type, message = 415, "UnsupportedMediaType", "Content-Type must be application/json"
+        else:
+            return False
+        self.close_connection = True  # 本文は読まずに切る
+        self._send_error(status, error_type, message)
+        return True
+
+    def do_POST(self):
+        if self._reject_browser_request():
+            return
+        path = urlparse(self.path).path
+        op = path.removeprefix("/v1/")
+        length = int(self.headers.get("Content-Length") or 0)
+        params = json.loads(self.rfile.read(length) or b"{}")
+        if op not in OPERATIONS:
+            self._send_error(404, "NotFound", f"Unknown operation {op}")
+            return
+        started = time.perf_counter()
+        try:
+            with scheduler.priority(self.headers.get(PRIORITY_HEADER) or "interactive"):
+                response = self.daemon.handle(op, params)
+        except (TypeError, ValueError) as e:
+            self._send_error(400, type(e).__name__, str(e))
+            return
+        except Exception as e:
+            print(f"❌ {op}: {type(e).__name__}: {e}")
+            self._send_error(500, type(e).__name__, str(e))
+            return
+        note = " (coalesced)" if response["coalesced"] else ""
+        print(f"✅ {op} {time.perf_counter() - started:.2f}s{note}")
+        self._send_json(200, response)
+
+
+def serve(host: str, port: int, slots: int | None = DEFAULT_SLOTS, reserved: int = 1):
+    scheduler.SCHEDULER.configure(slots, reserved)
+    daemon = ImageDaemon()
+    print("🔥 Warming up client...")
+    daemon.warm()
+    handler = type("Handler", (_Handler,), {"daemon": daemon})
+    httpd = ThreadingHTTPServer((host, port), handler)
+    httpd.daemon_threads = True
+    print(f"🛰️  Image daemon at http://{host}:{port}")
+    print(f"   export GEMINI_DAEMON_URL=http://{host}:{port}")
+    print(f"   slots: {slots or 'unlimited'} (reserved for interactive: {scheduler.SCHEDULER.reserved})")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        print("\n👋 Bye!")
+    finally:
+        httpd.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local image generation daemon")
+    parser.add_argument("command", nargs="?", default="serve", choices=["serve", "status"])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=urlparse(DEFAULT_URL).port)
+    parser.add_argument("--slots", type=int, default=int(os.environ.get("GEMINI_SCHED_SLOTS") or DEFAULT_SLOTS),
+                        help="同時実行数 (0=無制限)")
+    parser.add_argument("--reserved", type=int, default=int(os.environ.get("GEMINI_SCHED_RESERVED", "1")),
+                        help="interactive 専用に空けておくスロット数")
+    args = parser.parse_args()
+
+    if args.command == "status":
+        status = _request("GET", "/stats", timeout=5)
+        if status is None:
+            print(f"💤 No daemon at {daemon_url()}")
+            sys.exit(1)
+        print(json.dumps(status, ensure_ascii=False, indent=2))
+        return
+
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    serve(args.host, args.port, args.slots or None, args.reserved)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,24 +5,42 @@ Gemini 3 Pro Image Preview - 手書き風インフォグラフィック生成
 Usage:
     python infographic.py "概念" [options]
     python infographic.py --yaml config.yaml
+    python infographic.py --input note_draft.md --style whiteboard --count 3
+    python infographic.py --yaml batch.yaml --phase draft      # Flash 1K で全件下書き
+    python infographic.py --yaml batch.yaml --approve docker   # 下書きを承認
+    python infographic.py --yaml batch.yaml --phase final      # 承認分だけ Pro で本番生成
 
 Options:
     --output, -o     出力ファイルパス (default: infographic.png)
     --aspect, -a     アスペクト比 (default: 16:9)
     --size, -s       解像度 (default: 2K)
     --yaml, -y       YAML設定ファイルパス
+    --input, -i      Markdown下書き ([--IMAGE--] マーカーごとに生成して書き戻す)
+    --count, -n      --input 時に処理するマーカー数の上限
     --style          スタイル preset (notebook/whiteboard/minimal)
+    --variants       N バリアントを生成し、ローカルスコアで最良を選択
+    --phase          draft / final（二段階パイプライン、draft_pipeline.py 参照）
 """
 
 import argparse
+import contextvars
+import hashlib
 import os
+import re
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 
 import yaml
 from dotenv import load_dotenv
-from google import genai
 from google.genai import types
 
+import draft_pipeline
+import image_daemon
+import scheduler
+from gemini_client import GeminiClient, create_client, served_model
+from tracing import decode_image, save_image
+from variants import generate_variants
+
 load_dotenv()
 
 # スタイルプリセット
@@ -119,9 +137,11 @@ def generate_infographic(
     labels: list[dict] | None = None,
     annotation: str | None = None,
     custom_elements: str | None = None,
+    client: GeminiClient | None = None,
+    variants: int = 1,
 ) -> dict:
-    """インフォグラフィックを生成"""
-    client = genai.Client()
+    """インフォグラフィックを生成（variants >= 2 なら best-of-N）"""
+    client = client or create_client()
 
     prompt = build_infographic_prompt(
         concept=concept,
@@ -131,37 +151,290 @@ def generate_infographic(
         custom_elements=custom_elements,
     )
 
+    config = types.GenerateContentConfig(
+        response_modalities=["TEXT", "IMAGE"],
+        image_config=types.ImageConfig(
+            aspect_ratio=aspect_ratio,
+            image_size=image_size,
+        ),
+    )
+
+    if variants > 1:
+        result = generate_variants(
+            client, "gemini-3-pro-image-preview", [prompt], config, variants, output_path
+        )
+        return {"text": None, "prompt": prompt, **result}
+
     response = client.models.generate_content(
         model="gemini-3-pro-image-preview",
         contents=[prompt],
-        config=types.GenerateContentConfig(
-            response_modalities=["TEXT", "IMAGE"],
-            image_config=types.ImageConfig(
-                aspect_ratio=aspect_ratio,
-                image_size=image_size,
-            ),
-        ),
+        config=config,
     )
 
-    result = {"text": None, "image_path": None, "prompt": prompt}
+    result = {"text": None, "image_path": None, "prompt": prompt, "model": served_model()}
 
     for part in response.parts:
         if not (hasattr(part, "thought") and part.thought):
             if part.text:
                 result["text"] = part.text
-            elif image := part.as_image():
-                image.save(output_path)
+            elif image := decode_image(part):
+                save_image(image, output_path)
                 result["image_path"] = output_path
 
     return result
 
 
+IMAGE_MARKER = "[--IMAGE--]"
+HEADING_RE = re.compile(r"^(#{1,6})\s+(.+?)\s*#*\s*$")
+SECTION_TEXT_LIMIT = 800
+
+
+def extract_image_sections(markdown: str) -> list[dict]:
+    """
+    Markdown から [--IMAGE--] マーカーと、それを含む H2/H3 セクションを抽出
+
+    Returns:
+        list[dict]: マーカー出現順に {heading, title, body}
+    """
+    lines = markdown.splitlines()
+    title = None
+    # (開始行, 見出しレベル, 見出しテキスト)
+    headings = []
+    for i, line in enumerate(lines):
+        if m := HEADING_RE.match(line):
+            level, text = len(m.group(1)), m.group(2)
+            if level == 1 and title is None:
+                title = text
+            headings.append((i, level, text))
+
+    sections = []
+    for i, line in enumerate(lines):
+        for _ in range(line.count(IMAGE_MARKER)):
+            # 直前の H2/H3 見出し（無ければ記事タイトル）
+            owner = None
+            for start, level, text in headings:
+                if start > i:
+                    break
+                if level in (2, 3):
+                    owner = (start, level, text)
+            if owner:
+                start, level, heading = owner
+                end = next(
+                    (s for s, lv, _ in headings if s > start and lv <= level),
+                    len(lines),
+                )
+            else:
+                start, heading, end = -1, title or "", len(lines)
+
+            body = "\n".join(
+                l for l in lines[start + 1:end]
+                if l.strip() and IMAGE_MARKER not in l and not HEADING_RE.match(l)
+            )
+            sections.append({
+                "heading": heading,
+                "title": title,
+                "body": body[:SECTION_TEXT_LIMIT],
+            })
+    return sections
+
+
+def fill_image_markers(markdown: str, images: list[tuple[str, str] | None]) -> str:
+    """
+    [--IMAGE--] マーカーを出現順に画像リンクへ置換
+
+    images の要素が None（未生成・生成失敗）のマーカーはそのまま残す。
+    """
+    counter = iter(range(markdown.count(IMAGE_MARKER)))
+
+    def replace(_match):
+        index = next(counter)
+        if index < len(images) and images[index]:
+            alt, path = images[index]
+            return f"![{alt}]({path})"
+        return IMAGE_MARKER
+
+    return re.sub(re.escape(IMAGE_MARKER), replace, markdown)
+
+
+def image_path_for(out_dir: Path, stem: str, section: dict, style: str, reserved: set) -> Path:
+    """
+    マーカーの画像ファイル名（セクション内容のハッシュ）
+
+    再実行で残りのマーカーだけを生成しても番号がずれず、既存のファイルは上書きしない
+    （同名があれば _2, _3 ... を付ける）。
+    """
+    digest = hashlib.sha256(
+        f"{section['heading']}\n{section['body']}\n{style}".encode("utf-8")
+    ).hexdigest()[:8]
+    path = out_dir / f"{stem}_{digest}.png"
+    n = 1
+    while path in reserved or path.exists():
+        n += 1
+        path = out_dir / f"{stem}_{digest}_{n}.png"
+    reserved.add(path)
+    return path
+
+
+def generate_from_markdown(
+    input_path: str,
+    output_dir: str = "assets/images",
+    style: str = "notebook",
+    count: int | None = None,
+    aspect_ratio: str = "16:9",
+    image_size: str = "2K",
+    max_workers: int = 4,
+    variants: int = 1,
+) -> list[dict]:
+    """
+    Markdown下書きの [--IMAGE--] ごとにインフォグラフィックを並列生成し、
+    画像パスを埋め込んだ下書きを書き戻す
+    """
+    source = Path(input_path)
+    markdown = source.read_text(encoding="utf-8")
+    sections = extract_image_sections(markdown)
+    if count is not None:
+        sections = sections[:count]
+
+    out_dir = Path(output_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    client = create_client()
+
+    jobs = []
+    reserved = set()
+    for i, section in enumerate(sections, start=1):
+        concept = section["heading"]
+        if section["title"] and section["title"] != concept:
+            concept = f"{concept}（記事「{section['title']}」より）"
+        custom_elements = None
+        if section["body"]:
+            custom_elements = f"Content to visualize (from the article section):\n{section['body']}"
+        jobs.append({
+            "index": i - 1,
+            "heading": section["heading"],
+            "output_path": str(image_path_for(out_dir, source.stem, section, style, reserved)),
+            "kwargs": {
+                "concept": concept,
+                "style": style,
+                "aspect_ratio": aspect_ratio,
+                "image_size": image_size,
+                "custom_elements": custom_elements,
+                "variants": variants,
+            },
+        })
+
+    print(f"📊 {len(jobs)} image marker(s) in {source}, generating concurrently...")
+    results: list[dict | None] = [None] * len(jobs)
+    # 呼び出し元の contextvars（scheduler の優先度・トレース）をワーカースレッドへ引き継ぐ
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(jobs) or 1))) as pool:
+        futures = {
+            pool.submit(
+                contextvars.copy_context().run,
+                generate_infographic,
+                output_path=job["output_path"],
+                client=client,
+                **job["kwargs"],
+            ): job
+            for job in jobs
+        }
+        for future in as_completed(futures):
+            job = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                print(f"   ❌ {job['heading']}: {e}")
+                continue
+            results[job["index"]] = result
+            if result["image_path"]:
+                print(f"   ✅ {job['heading']}: {result['image_path']} ({result['model']})")
+            else:
+                print(f"   ⚠️ {job['heading']}: no image generated")
+
+    images = []
+    for job, result in zip(jobs, results):
+        if result and result["image_path"]:
+            rel = os.path.relpath(result["image_path"], source.parent)
+            images.append((job["heading"], Path(rel).as_posix()))
+        else:
+            images.append(None)
+
+    source.write_text(fill_image_markers(markdown, images), encoding="utf-8")
+    print(f"📝 Updated draft: {source}")
+    return [r for r in results if r]
+
+
 def load_yaml_config(yaml_path: str) -> dict:
     """YAML設定ファイルを読み込み"""
     with open(yaml_path, "r", encoding="utf-8") as f:
         return yaml.safe_load(f)
 
 
+def load_batch_items(config: dict, defaults: dict) -> list[dict]:
+    """
+    YAML設定からバッチアイテムを構築
+
+    `items:` があれば各要素をトップレベル設定の上書きとして扱う。
+    無ければ設定全体を1アイテムとみなす。
+    """
+    entries = config.get("items") or [{}]
+    base = {k: v for k, v in config.items() if k != "items"}
+    items = []
+    for i, entry in enumerate(entries, start=1):
+        merged = {**defaults, **base, **entry}
+        if not merged.get("concept"):
+            print(f"Skipping item without concept: {entry}")
+            continue
+        item_id = merged.get("id") or Path(merged["output"]).stem
+        if len(entries) > 1 and not merged.get("id") and "output" not in entry:
+            item_id = f"{item_id}_{i:02d}"
+        items.append({
+            "id": item_id,
+            "prompt": build_infographic_prompt(
+                concept=merged["concept"],
+                labels=merged.get("labels"),
+                annotation=merged.get("annotation"),
+                style=merged.get("style", "notebook"),
+                custom_elements=merged.get("custom_elements"),
+            ),
+            "aspect_ratio": merged.get("aspect_ratio", "16:9"),
+            "image_size": merged.get("image_size", "2K"),
+        })
+    return items
+
+
+def run_phase(args, config: dict) -> None:
+    """二段階パイプライン（draft / approve / final / status）"""
+    defaults = {
+        "concept": args.concept,
+        "annotation": args.annotation,
+        "style": args.style,
+        "aspect_ratio": args.aspect,
+        "image_size": args.size,
+        "output": args.output,
+    }
+    items = load_batch_items(config, defaults)
+    output_dir = Path(config.get("output_dir", args.output_dir))
+
+    if args.approve or args.unapprove:
+        manifest = draft_pipeline.BatchManifest(output_dir / draft_pipeline.MANIFEST_NAME)
+        missing = manifest.approve(args.approve or [], True) + manifest.approve(args.unapprove or [], False)
+        for item_id in missing:
+            print(f"⚠️ No draft for {item_id}, run --phase draft first")
+        draft_pipeline.print_status(items, output_dir)
+        return
+
+    if args.status:
+        draft_pipeline.print_status(items, output_dir)
+        return
+
+    client = create_client()
+    print(f"📊 {len(items)} infographic(s), phase: {args.phase}")
+    if args.phase == "draft":
+        stats = draft_pipeline.run_drafts(client, items, output_dir, force=args.force)
+    else:
+        stats = draft_pipeline.run_finals(client, items, output_dir, force=args.force)
+    print(f"\n📋 {stats}")
+
+
 def main():
     parser = argparse.ArgumentParser(description="Gemini Hand-drawn Infographic Generator")
     parser.add_argument("concept", nargs="?", help="説明する概念")
@@ -170,11 +443,45 @@ def main():
     parser.add_argument("-s", "--size", default="2K", choices=["1K", "2K", "4K"], help="解像度")
     parser.add_argument("--style", default="notebook", choices=["notebook", "whiteboard", "minimal"])
     parser.add_argument("-y", "--yaml", help="YAML設定ファイルパス")
+    parser.add_argument("-i", "--input", help="Markdown下書き（[--IMAGE--] マーカーごとに生成）")
+    parser.add_argument("-n", "--count", type=int, help="--input 時に処理するマーカー数の上限")
+    parser.add_argument("--image-dir", default="assets/images", help="--input 時の画像出力ディレクトリ")
+    parser.add_argument("-j", "--jobs", type=int, default=4, help="--input 時の並列数")
     parser.add_argument("--annotation", help="要約アノテーション（日本語）")
     parser.add_argument("--show-prompt", action="store_true", help="生成プロンプトを表示")
+    parser.add_argument("--variants", type=int, default=1, help="生成するバリアント数 (best-of-N)")
+    parser.add_argument("--phase", choices=["draft", "final"], help="二段階パイプライン: draft=Flash 1K下書き / final=承認分をProで本番生成")
+    parser.add_argument("--approve", nargs="+", metavar="ID", help="下書きを承認")
+    parser.add_argument("--unapprove", nargs="+", metavar="ID", help="承認を取り消し")
+    parser.add_argument("--status", action="store_true", help="下書き・承認・本番の状態を表示")
+    parser.add_argument("--output-dir", default="infographics", help="二段階パイプラインの出力ディレクトリ")
+    parser.add_argument("--force", action="store_true", help="最新でも再生成")
 
     args = parser.parse_args()
 
+    if args.input:
+        # daily-ops の creator ステージ（下書きの [--IMAGE--] から生成）
+        scheduler.set_default("daily")
+        generate_from_markdown(
+            input_path=args.input,
+            output_dir=args.image_dir,
+            style=args.style,
+            count=args.count,
+            aspect_ratio=args.aspect,
+            image_size=args.size,
+            max_workers=args.jobs,
+            variants=args.variants,
+        )
+        return
+
+    if args.phase or args.approve or args.unapprove or args.status:
+        config = load_yaml_config(args.yaml) if args.yaml else {}
+        if not args.yaml and not args.concept and not (args.approve or args.unapprove or args.status):
+            parser.error("concept is required unless using --yaml")
+        scheduler.set_default("bulk")
+        run_phase(args, config)
+        return
+
     # YAML設定ファイルからの読み込み
     if args.yaml:
         config = load_yaml_config(args.yaml)
@@ -202,7 +509,9 @@ def main():
     print(f"   Concept: {concept}")
     print(f"   Style: {style}, Aspect: {aspect_ratio}, Size: {image_size}")
 
-    result = generate_infographic(
+    result = image_daemon.call_or_run(
+        "infographic",
+        generate_infographic,
         concept=concept,
         output_path=output_path,
         aspect_ratio=aspect_ratio,
@@ -211,6 +520,7 @@ def main():
         labels=labels,
         annotation=annotation,
         custom_elements=custom_elements,
+        variants=args.variants,
     )
 
     if args.show_prompt:
@@ -220,7 +530,12 @@ def main():
         print(f"\n💬 Response:\n{result['text']}")
 
     if result["image_path"]:
-        print(f"\n✅ Infographic saved to: {result['image_path']}")
+        print(f"\n✅ Infographic saved to: {result['image_path']} ({result['model']})")
+
+    if result.get("variants"):
+        print(f"\n🎲 {len(result['variants'])} variants ({result['mode']}):")
+        for v in result["variants"]:
+            print(f"   {v['score']:.2f}  {v['path']}")
 
 
 if __name__ == "__main__":
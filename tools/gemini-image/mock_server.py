@@ -0,0 +1,478 @@
+#!/usr/bin/env python3
+"""
+Gemini API ローカルモックサーバー
+
+gemini-image ツール群が使う generate_content / streamGenerateContent（チャットも同じ
+エンドポイントを使う）、countTokens と batchGenerateContent / batches.get のサブセットを実装し、
+決定的な PNG と思考パートを返す。
+レイテンシ分布・429/500 の注入率・画像ペイロードサイズを設定でき、
+クォータを消費せずに負荷試験やベンチマーク（bench.py）を行える。
+
+Usage:
+    python mock_server.py --port 8765 --latency lognormal --latency-ms 800 --rate-429 0.05
+
+    # ツール側は SDK の環境変数でモックへ向ける
+    export GOOGLE_GEMINI_BASE_URL=http://127.0.0.1:8765
+    export GEMINI_API_KEY=mock
+    python generate.py "テスト"
+"""
+
+import argparse
+import base64
+import hashlib
+import json
+import math
+import random
+import struct
+import sys
+import threading
+import time
+import zlib
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+
+class _QuietHTTPServer(ThreadingHTTPServer):
+    """クライアント側のキャンセル（ヘッジの負け側など）による切断はエラー表示しない"""
+
+    def handle_error(self, request, client_address):
+        if isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            return
+        super().handle_error(request, client_address)
+
+
+@dataclass
+class MockConfig:
+    """モックの振る舞い設定"""
+
+    latency: str = "fixed"  # fixed / uniform / lognormal / exponential
+    latency_ms: float = 200.0  # 中央値（fixed は固定値、uniform は [0, 2x]）
+    latency_sigma: float = 0.5  # lognormal の σ
+    ttfb_ratio: float = 0.3  # ストリーミング時、最初のチャンクまでに使う割合
+    rate_429: float = 0.0
+    rate_500: float = 0.0
+    image_kb: int = 64  # 最終画像のおおよそのサイズ
+    thinking_images: int = 1
+    reject_candidate_count: bool = False
+    unavailable_models: list = field(default_factory=list)  # 常に 503 を返すモデル（フォールバック検証用）
+    key_rpm: int = 0  # API キーごとの毎分リクエスト上限（0 は無制限。クレデンシャルプール検証用）
+    batch_seconds: float = 3.0  # バッチジョブが投入から完了するまでの秒数
+    seed: int = 0
+    stats: dict = field(
+        default_factory=lambda: {"requests": 0, "errors_429": 0, "errors_500": 0, "bytes_out": 0, "batches": 0, "count_tokens": 0}
+    )
+
+
+def _png(width: int, height: int, seed: bytes) -> bytes:
+    """決定的なノイズ PNG（ノイズなので圧縮が効かず、サイズを制御しやすい）"""
+    rng = random.Random(seed)
+    raw = bytearray()
+    row_bytes = width * 3
+    for _ in range(height):
+        raw.append(0)  # filter type: None
+        raw.extend(rng.randbytes(row_bytes))
+
+    def chunk(tag: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data) & 0xFFFFFFFF)
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", header)
+        + chunk(b"IDAT", zlib.compress(bytes(raw), 1))
+        + chunk(b"IEND", b"")
+    )
+
+
+def _dimensions(aspect_ratio: str | None, target_kb: int) -> tuple[int, int]:
+    """アスペクト比を保ったまま、RGB 生データが target_kb になる寸法"""
+    try:
+        w_ratio, h_ratio = (float(x) for x in (aspect_ratio or "1:1").split(":"))
+    except ValueError:
+        w_ratio, h_ratio = 1.0, 1.0
+    pixels = max(1, target_kb * 1024 // 3)
+    height = max(1, int(math.sqrt(pixels * h_ratio / w_ratio)))
+    width = max(1, pixels // height)
+    return width, height
+
+
+class MockGeminiServer:
+    """スレッドで動くモックサーバー。with 文で起動・停止できる"""
+
+    def __init__(self, config: MockConfig | None = None, host: str = "127.0.0.1", port: int = 0):
+        self.config = config or MockConfig()
+        self._rng = random.Random(self.config.seed)
+        self._rng_lock = threading.Lock()
+        self._key_requests = {}  # api_key -> [timestamp]
+        self._batches = {}  # id -> {"model", "display_name", "requests", "created", "cancelled", "output"}
+        handler = type("Handler", (_Handler,), {"mock": self})
+        self.httpd = _QuietHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "MockGeminiServer":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    # --- 振る舞い ---
+
+    def count(self, key: str, n: int = 1):
+        with self._rng_lock:
+            self.config.stats[key] += n
+
+    def key_throttled(self, api_key: str | None) -> float | None:
+        """キーが毎分上限を超えていれば、空くまでの秒数"""
+        if not self.config.key_rpm:
+            return None
+        now = time.monotonic()
+        with self._rng_lock:
+            recent = [t for t in self._key_requests.get(api_key, []) if t > now - 60]
+            if len(recent) >= self.config.key_rpm:
+                self._key_requests[api_key] = recent
+                self.config.stats["errors_429"] += 1
+                return recent[0] + 60 - now
+            self._key_requests[api_key] = recent + [now]
+        return None
+
+    def create_batch(self, model: str, body: dict) -> dict:
+        batch = body.get("batch") or {}
+        requests = ((batch.get("inputConfig") or {}).get("requests") or {}).get("requests") or []
+        with self._rng_lock:
+            batch_id = f"mock{len(self._batches) + 1:04d}"
+            self._batches[batch_id] = {
+                "model": model,
+                "display_name": batch.get("displayName"),
+                "requests": requests,
+                "created": time.time(),
+                "cancelled": False,
+                "output": None,
+            }
+        self.count("batches")
+        return self.batch_operation(batch_id)
+
+    def cancel_batch(self, batch_id: str) -> bool:
+        with self._rng_lock:
+            if batch_id not in self._batches:
+                return False
+            self._batches[batch_id]["cancelled"] = True
+        return True
+
+    def batch_operation(self, batch_id: str) -> dict | None:
+        """経過時間から PENDING → RUNNING → SUCCEEDED を決め、完了時は全レスポンスを inline で返す"""
+        job = self._batches.get(batch_id)
+        if job is None:
+            return None
+        elapsed = time.time() - job["created"]
+        if job["cancelled"]:
+            state = "BATCH_STATE_CANCELLED"
+        elif elapsed < 0.2 * self.config.batch_seconds:
+            state = "BATCH_STATE_PENDING"
+        elif elapsed < self.config.batch_seconds:
+            state = "BATCH_STATE_RUNNING"
+        else:
+            state = "BATCH_STATE_SUCCEEDED"
+
+        metadata = {
+            "@type": "type.googleapis.com/google.ai.generativelanguage.v1main.GenerateContentBatch",
+            "model": f"models/{job['model']}",
+            "displayName": job["display_name"],
+            "state": state,
+            "createTime": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(job["created"])),
+        }
+        if state == "BATCH_STATE_SUCCEEDED":
+            if job["output"] is None:
+                responses = []
+                for entry in job["requests"]:
+                    request = entry.get("request") or {}
+                    candidates = self.build_candidates(job["model"], request)
+                    responses.append({
+                        "response": {
+                            "candidates": candidates,
+                            "usageMetadata": self.usage(request, candidates),
+                            "modelVersion": job["model"],
+                        },
+                        "metadata": entry.get("metadata"),
+                    })
+                job["output"] = {"inlinedResponses": {"inlinedResponses": responses}}
+            metadata["output"] = job["output"]
+        done = state not in ("BATCH_STATE_PENDING", "BATCH_STATE_RUNNING")
+        return {"name": f"batches/{batch_id}", "metadata": metadata, "done": done}
+
+    def random(self) -> float:
+        with self._rng_lock:
+            return self._rng.random()
+
+    def sample_latency(self) -> float:
+        """設定された分布からレイテンシ（秒）をサンプル"""
+        c = self.config
+        median = c.latency_ms / 1000.0
+        with self._rng_lock:
+            if c.latency == "uniform":
+                return self._rng.uniform(0, 2 * median)
+            if c.latency == "lognormal":
+                return self._rng.lognormvariate(math.log(max(median, 1e-6)), c.latency_sigma)
+            if c.latency == "exponential":
+                return self._rng.expovariate(math.log(2) / max(median, 1e-6))
+        return median
+
+    def injected_error(self, model: str) -> int | None:
+        if model in self.config.unavailable_models:
+            self.count("errors_500")
+            return 503
+        r = self.random()
+        if r < self.config.rate_429:
+            self.count("errors_429")
+            return 429
+        if r < self.config.rate_429 + self.config.rate_500:
+            self.count("errors_500")
+            return 500
+        return None
+
+    def build_candidates(self, model: str, body: dict) -> list[dict]:
+        """リクエスト内容から決定的な候補（思考パート＋最終画像）を構築"""
+        gen_config = body.get("generationConfig") or {}
+        image_config = gen_config.get("imageConfig") or {}
+        count = int(gen_config.get("candidateCount") or 1)
+        digest = hashlib.sha256(
+            model.encode() + json.dumps(body.get("contents"), sort_keys=True).encode()
+        ).digest()
+
+        width, height = _dimensions(image_config.get("aspectRatio"), self.config.image_kb)
+        t_width, t_height = _dimensions(image_config.get("aspectRatio"), max(1, self.config.image_kb // 8))
+
+        candidates = []
+        for index in range(count):
+            seed = digest + bytes([index])
+            parts = [{"text": "Planning the composition...", "thought": True}]
+            for step in range(self.config.thinking_images):
+                parts.append({
+                    "inlineData": {
+                        "mimeType": "image/png",
+                        "data": base64.b64encode(_png(t_width, t_height, seed + bytes([step + 1]))).decode(),
+                    },
+                    "thought": True,
+                })
+            parts.append({"text": f"Mock image {digest.hex()[:8]}-{index} from {model}."})
+            parts.append({
+                "inlineData": {
+                    "mimeType": "image/png",
+                    "data": base64.b64encode(_png(width, height, seed)).decode(),
+                }
+            })
+            candidates.append({
+                "content": {"role": "model", "parts": parts},
+                "finishReason": "STOP",
+                "index": index,
+            })
+        return candidates
+
+    @staticmethod
+    def count_tokens(model: str, body: dict) -> dict:
+        """テキストは4文字1トークン、inline 画像は1枚固定（Gemini 3 は 1120、それ以外は 258）"""
+        total = 0
+        for content in body.get("contents") or []:
+            for part in content.get("parts") or []:
+                if "text" in part:
+                    total += max(1, len(part["text"]) // 4)
+                elif "inlineData" in part:
+                    total += 1120 if model.startswith("gemini-3") else 258
+        return {"totalTokens": total}
+
+    @staticmethod
+    def usage(body: dict, candidates: list[dict]) -> dict:
+        prompt_chars = len(json.dumps(body.get("contents")))
+        return {
+            "promptTokenCount": max(1, prompt_chars // 4),
+            "candidatesTokenCount": 1290 * len(candidates),
+            "totalTokenCount": max(1, prompt_chars // 4) + 1290 * len(candidates),
+        }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    mock: MockGeminiServer = None
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, payload: dict):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+        self.mock.count("bytes_out", len(data))
+
+    def _send_error(self, status: int, message: str, details: list | None = None):
+        names = {400: "INVALID_ARGUMENT", 404: "NOT_FOUND", 429: "RESOURCE_EXHAUSTED", 500: "INTERNAL", 503: "UNAVAILABLE"}
+        error = {"code": status, "message": message, "status": names.get(status, "UNKNOWN")}
+        if details:
+            error["details"] = details
+        self._send_json(status, {"error": error})
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == "/__stats":
+            self._send_json(200, self.mock.config.stats)
+            return
+        if "/batches/" in path:
+            batch_id = path.rsplit("/batches/", 1)[1]
+            if (operation := self.mock.batch_operation(batch_id)) is None:
+                self._send_error(404, f"Batch {batch_id} not found")
+                return
+            self._send_json(200, operation)
+            return
+        self._send_error(404, f"Unknown path {self.path}")
+
+    def do_POST(self):
+        path = urlparse(self.path).path
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"{}")
+        self.mock.count("requests")
+
+        if "/batches/" in path and path.endswith(":cancel"):
+            batch_id = path.rsplit("/batches/", 1)[1].rsplit(":", 1)[0]
+            if not self.mock.cancel_batch(batch_id):
+                self._send_error(404, f"Batch {batch_id} not found")
+                return
+            self._send_json(200, {})
+            return
+
+        if "/models/" not in path or ":" not in path:
+            self._send_error(404, f"Unknown path {path}")
+            return
+        model, method = path.split("/models/", 1)[1].rsplit(":", 1)
+        self.handle_model_call(model, method, body)
+
+    def handle_model_call(self, model: str, method: str, body: dict):
+        if method == "batchGenerateContent":
+            self._send_json(200, self.mock.create_batch(model, body))
+            return
+        if method == "countTokens":
+            self.mock.count("count_tokens")
+            self._send_json(200, self.mock.count_tokens(model, body))
+            return
+        if method not in ("generateContent", "streamGenerateContent"):
+            self._send_error(404, f"Unsupported method {method}")
+            return
+
+        gen_config = body.get("generationConfig") or {}
+        if self.mock.config.reject_candidate_count and int(gen_config.get("candidateCount") or 1) > 1:
+            self._send_error(400, "Multiple candidates is not enabled for this model")
+            return
+
+        if (wait := self.mock.key_throttled(self.headers.get("x-goog-api-key"))) is not None:
+            retry = {"@type": "type.googleapis.com/google.rpc.RetryInfo", "retryDelay": f"{wait:.0f}s"}
+            self._send_error(429, "Quota exceeded for this API key", [retry])
+            return
+
+        latency = self.mock.sample_latency()
+        if status := self.mock.injected_error(model):
+            time.sleep(latency * self.mock.config.ttfb_ratio)
+            self._send_error(status, "Injected error")
+            return
+
+        candidates = self.mock.build_candidates(model, body)
+        usage = self.mock.usage(body, candidates)
+
+        if method == "generateContent":
+            time.sleep(latency)
+            self._send_json(200, {"candidates": candidates, "usageMetadata": usage, "modelVersion": model})
+            return
+
+        # streamGenerateContent (SSE): パートごとに1チャンク。最初のチャンクまでに ttfb_ratio 分待つ
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        parts = candidates[0]["content"]["parts"]
+        time.sleep(latency * self.mock.config.ttfb_ratio)
+        remaining = latency * (1 - self.mock.config.ttfb_ratio)
+        for i, part in enumerate(parts):
+            chunk = {
+                "candidates": [{"content": {"role": "model", "parts": [part]}, "index": 0}],
+                "modelVersion": model,
+            }
+            if i == len(parts) - 1:
+                chunk["candidates"][0]["finishReason"] = "STOP"
+                chunk["usageMetadata"] = usage
+            data = f"data: {json.dumps(chunk)}\r\n\r\n".encode()
+            self.wfile.write(data)
+            self.wfile.flush()
+            self.mock.count("bytes_out", len(data))
+            if i < len(parts) - 1:
+                time.sleep(remaining / max(1, len(parts) - 1))
+
+
+def add_mock_arguments(parser: argparse.ArgumentParser):
+    """MockConfig を CLI 引数として追加（bench.py と共用）"""
+    parser.add_argument("--latency", default="fixed", choices=["fixed", "uniform", "lognormal", "exponential"])
+    parser.add_argument("--latency-ms", type=float, default=200.0, help="レイテンシ中央値 (ms)")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="lognormal の σ")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="429 を返す確率")
+    parser.add_argument("--rate-500", type=float, default=0.0, help="500 を返す確率")
+    parser.add_argument("--image-kb", type=int, default=64, help="最終画像のおおよそのサイズ (KB)")
+    parser.add_argument("--thinking-images", type=int, default=1, help="思考画像の枚数")
+    parser.add_argument("--reject-candidate-count", action="store_true", help="candidateCount>1 を 400 で拒否")
+    parser.add_argument("--unavailable-model", action="append", default=[], help="常に 503 を返すモデル（複数指定可）")
+    parser.add_argument("--batch-seconds", type=float, default=3.0, help="バッチジョブの完了までの秒数")
+    parser.add_argument("--key-rpm", type=int, default=0, help="API キーごとの毎分リクエスト上限 (0=無制限)")
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def config_from_args(args) -> MockConfig:
+    return MockConfig(
+        latency=args.latency,
+        latency_ms=args.latency_ms,
+        latency_sigma=args.latency_sigma,
+        rate_429=args.rate_429,
+        rate_500=args.rate_500,
+        image_kb=args.image_kb,
+        thinking_images=args.thinking_images,
+        reject_candidate_count=args.reject_candidate_count,
+        unavailable_models=args.unavailable_model,
+        key_rpm=args.key_rpm,
+        batch_seconds=args.batch_seconds,
+        seed=args.seed,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local mock of the Gemini generate_content API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    add_mock_arguments(parser)
+    args = parser.parse_args()
+
+    server = MockGeminiServer(config_from_args(args), host=args.host, port=args.port)
+    print(f"🧪 Mock Gemini API at {server.base_url}")
+    print(f"   export GOOGLE_GEMINI_BASE_URL={server.base_url} GEMINI_API_KEY=mock")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        print("\n👋 Bye!")
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
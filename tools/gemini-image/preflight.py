@@ -0,0 +1,356 @@
+#!/usr/bin/env python3
+"""
+送信前のプリフライト（リクエストサイズ・トークン数の見積もりと上限チェック）
+
+generate_content の前に contents を検査し、サーバー側で時間をかけて失敗するはずの
+リクエストを手元で止める。
+
+- PIL 画像は SDK と同じ形式（JPEG ファイル由来なら JPEG、それ以外は PNG）で1回だけエンコードし、
+  フォールバック・ヘッジ・キー切り替えでの再送でも使い回す
+- 長辺が max_side を超える画像は縮小する。合計が送信上限を超える場合は長辺を半分ずつ
+  （768px まで）縮小し、それでも収まらなければ PreflightError
+- 入力トークン数をローカルで見積もる（上限の 80% を超えたら count_tokens で確認）。
+  count_tokens の結果は内容ハッシュでキャッシュし、キャッシュがあれば常にそちらを使う
+- 見積もったトークン数（入力＋出力画像）をクレデンシャルプールに渡し、tpm を事前に予算化する
+
+環境変数:
+    GEMINI_PREFLIGHT=off|local|count   (default: local)
+        count にすると常に count_tokens で数える（キャッシュ済みなら通信しない）
+    GEMINI_PREFLIGHT_MAX_SIDE          画像の長辺の上限 px (default: 3072)
+    GEMINI_TOKEN_CACHE                 キャッシュファイル (default: ~/.gemini-image/token_cache.json)
+
+Usage:
+    python preflight.py estimate "プロンプト" -i ref1.png ref2.png -m pro
+    python preflight.py estimate "プロンプト" -i ref1.png --count   # count_tokens で確認
+    python preflight.py clear-cache
+"""
+
+import argparse
+import hashlib
+import io
+import json
+import math
+import os
+import threading
+from pathlib import Path
+
+from google.genai import errors, types
+from PIL import Image
+
+MAX_REQUEST_BYTES = 20 * 1024 * 1024  # inline リクエストの上限
+MAX_IMAGE_SIDE = int(os.environ.get("GEMINI_PREFLIGHT_MAX_SIDE", "3072"))
+MIN_IMAGE_SIDE = 768
+COUNT_THRESHOLD = 0.8  # ローカル見積もりが上限のこの割合を超えたら count_tokens で確認
+TOKEN_CACHE_FILE = Path(os.environ.get("GEMINI_TOKEN_CACHE", "~/.gemini-image/token_cache.json")).expanduser()
+CACHE_SIZE = 5000
+
+# モデル → 入力トークン上限・入力画像の上限枚数
+MODEL_LIMITS = {
+    "gemini-3-pro-image-preview": {"input_tokens": 65536, "images": 14},
+    "gemini-2.5-flash-image": {"input_tokens": 32768, "images": None},
+    "gemini-2.0-flash-exp": {"input_tokens": 1048576, "images": None},
+}
+
+# 出力画像1枚あたりのトークン数（解像度別）
+OUTPUT_IMAGE_TOKENS = {
+    "gemini-3-pro-image-preview": {"1K": 1120, "2K": 1120, "4K": 2000},
+}
+DEFAULT_OUTPUT_IMAGE_TOKENS = 1290
+
+
+class PreflightError(ValueError):
+    """送信前に上限超過と判定したリクエスト"""
+
+
+def preflight_mode() -> str:
+    return os.environ.get("GEMINI_PREFLIGHT", "local").lower()
+
+
+def text_tokens(text: str) -> int:
+    """テキストのトークン数の概算（ASCII は4文字、それ以外は1文字で1トークン）"""
+    ascii_chars = sum(1 for c in text if ord(c) < 128)
+    return math.ceil(ascii_chars / 4 + (len(text) - ascii_chars))
+
+
+def image_tokens(model: str, width: int, height: int) -> int:
+    """入力画像1枚のトークン数（Gemini 3 は既定の高解像度で固定、それ以前は 768px タイル単位）"""
+    if model.startswith("gemini-3"):
+        return 1120
+    if width <= 384 and height <= 384:
+        return 258
+    return 258 * math.ceil(width / 768) * math.ceil(height / 768)
+
+
+def output_tokens(model: str, config) -> int:
+    """応答画像のトークン数の見積もり"""
+    if config is None:
+        return 0
+    if isinstance(config, dict):
+        config = types.GenerateContentConfig(**config)
+    if config.response_modalities and "IMAGE" not in config.response_modalities:
+        return 0
+    size = config.image_config.image_size if config.image_config else None
+    return OUTPUT_IMAGE_TOKENS.get(model, {}).get(size or "1K", DEFAULT_OUTPUT_IMAGE_TOKENS)
+
+
+def encode_image(image: Image.Image, max_side: int = MAX_IMAGE_SIDE) -> types.Part:
+    """PIL 画像を（必要なら縮小して）1回だけエンコードした Part にする"""
+    keep_jpeg = image.format == "JPEG" and getattr(image, "filename", "") and image.mode in ("1", "L", "RGB", "RGBX", "CMYK")
+    if max(image.size) > max_side:
+        scale = max_side / max(image.size)
+        image = image.resize((max(1, round(image.width * scale)), max(1, round(image.height * scale))), Image.LANCZOS)
+        print(f"📐 Downscaled reference image to {image.width}x{image.height}")
+    buf = io.BytesIO()
+    if keep_jpeg:
+        image.save(buf, "JPEG", **({"quality": "keep"} if image.format == "JPEG" else {"quality": 90}))
+        mime_type = "image/jpeg"
+    else:
+        image.save(buf, "PNG")
+        mime_type = "image/png"
+    return types.Part.from_bytes(data=buf.getvalue(), mime_type=mime_type)
+
+
+def _parts(contents) -> list:
+    """contents を平らなパートのリストにする（Content は parts を展開）"""
+    if not isinstance(contents, list):
+        contents = [contents]
+    flat = []
+    for item in contents:
+        if isinstance(item, types.Content):
+            flat.extend(item.parts or [])
+        else:
+            flat.append(item)
+    return flat
+
+
+def _inline(part):
+    return part.inline_data if isinstance(part, types.Part) and part.inline_data else None
+
+
+def payload_bytes(contents) -> int:
+    """送信サイズ（inline データは base64 換算）"""
+    size = 0
+    for part in _parts(contents):
+        if isinstance(part, str):
+            size += len(part.encode("utf-8"))
+        elif isinstance(part, Image.Image):
+            size += base64_len(encode_image(part).inline_data.data)
+        elif blob := _inline(part):
+            size += base64_len(blob.data)
+        elif isinstance(part, types.Part) and part.text:
+            size += len(part.text.encode("utf-8"))
+        else:
+            size += len(json.dumps(part, default=str))
+    return size + 512
+
+
+def base64_len(data: bytes) -> int:
+    return (len(data) + 2) // 3 * 4
+
+
+def estimate_input_tokens(model: str, contents) -> int:
+    """contents の入力トークン数をローカルで見積もる"""
+    tokens = 0
+    for part in _parts(contents):
+        if isinstance(part, str):
+            tokens += text_tokens(part)
+        elif isinstance(part, Image.Image):
+            tokens += image_tokens(model, *part.size)
+        elif blob := _inline(part):
+            if blob.mime_type and blob.mime_type.startswith("image/"):
+                with Image.open(io.BytesIO(blob.data)) as image:
+                    tokens += image_tokens(model, *image.size)
+        elif isinstance(part, types.Part) and part.text:
+            tokens += text_tokens(part.text)
+    return tokens
+
+
+def content_hash(model: str, contents) -> str:
+    """count_tokens キャッシュのキー"""
+    h = hashlib.sha256(model.encode("utf-8"))
+    for part in _parts(contents):
+        if isinstance(part, str):
+            h.update(b"t" + part.encode("utf-8"))
+        elif blob := _inline(part):
+            h.update(b"b" + hashlib.sha256(blob.data).digest())
+        elif isinstance(part, types.Part):
+            h.update(b"p" + part.model_dump_json(exclude_none=True).encode("utf-8"))
+        else:
+            h.update(b"j" + json.dumps(part, default=str, sort_keys=True).encode("utf-8"))
+    return h.hexdigest()[:24]
+
+
+class TokenCache:
+    """count_tokens の結果を内容ハッシュで保存（ワンショット CLI 間で共有）"""
+
+    def __init__(self, path: Path = TOKEN_CACHE_FILE):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._data = None
+
+    def _load(self) -> dict:
+        if self._data is None:
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self._data = json.load(f)
+            except (OSError, json.JSONDecodeError):
+                self._data = {}
+        return self._data
+
+    def get(self, key: str) -> int | None:
+        with self._lock:
+            return self._load().get(key)
+
+    def put(self, key: str, tokens: int):
+        with self._lock:
+            data = self._load()
+            data.pop(key, None)
+            data[key] = tokens
+            while len(data) > CACHE_SIZE:
+                data.pop(next(iter(data)))
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_suffix(f".{os.getpid()}.tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            tmp.replace(self.path)
+
+
+class Preflight:
+    """
+    送信前の検査
+
+    Args:
+        mode: off / local / count
+        count_fn: count_fn(model, contents) -> int（count_tokens の呼び出し）。None なら見積もりのみ
+    """
+
+    def __init__(
+        self,
+        mode: str = "local",
+        count_fn=None,
+        cache: TokenCache | None = None,
+        max_side: int = MAX_IMAGE_SIDE,
+        max_bytes: int = MAX_REQUEST_BYTES,
+    ):
+        self.mode = mode
+        self.count_fn = count_fn
+        self.cache = cache or TokenCache()
+        self.max_side = max_side
+        self.max_bytes = max_bytes
+
+    @classmethod
+    def from_env(cls, count_fn=None) -> "Preflight":
+        return cls(mode=preflight_mode(), count_fn=count_fn)
+
+    def prepare(self, contents) -> list:
+        """画像をエンコード済み Part に置き換え、送信上限に収まるまで縮小する"""
+        contents = list(contents) if isinstance(contents, list) else [contents]
+        originals = {}
+        for i, item in enumerate(contents):
+            if isinstance(item, Image.Image):
+                originals[i] = item
+                contents[i] = encode_image(item, self.max_side)
+
+        side = self.max_side
+        while payload_bytes(contents) > self.max_bytes:
+            if not originals or side <= MIN_IMAGE_SIDE:
+                raise PreflightError(
+                    f"Request is {payload_bytes(contents) / 1024 / 1024:.1f} MB, "
+                    f"over the {self.max_bytes / 1024 / 1024:.0f} MB inline limit"
+                )
+            side = max(MIN_IMAGE_SIDE, side // 2)
+            for i, image in originals.items():
+                if max(image.size) > side:
+                    contents[i] = encode_image(image, side)
+        return contents
+
+    def count_tokens(self, model: str, contents, remote: bool = True) -> int | None:
+        """count_tokens（キャッシュ優先）。remote=False ならキャッシュのみ。得られなければ None"""
+        key = content_hash(model, contents)
+        if (cached := self.cache.get(key)) is not None:
+            return cached
+        if not remote or self.count_fn is None:
+            return None
+        try:
+            tokens = self.count_fn(model, contents)
+        except errors.APIError as e:
+            print(f"⚠️ count_tokens failed ({e.code}), using local estimate")
+            return None
+        self.cache.put(key, tokens)
+        return tokens
+
+    def check(self, model: str, contents, config=None) -> tuple[list, int]:
+        """
+        リクエストを検査して送信用に整える
+
+        Returns:
+            (送信用 contents, 見積もりトークン数（入力＋出力）)
+
+        Raises:
+            PreflightError: 画像枚数・送信サイズ・入力トークン数が上限を超える
+        """
+        if self.mode == "off":
+            return contents, 0
+
+        limits = MODEL_LIMITS.get(model, {})
+        images = sum(1 for part in _parts(contents) if isinstance(part, Image.Image) or _inline(part))
+        if limits.get("images") and images > limits["images"]:
+            raise PreflightError(f"{model} accepts at most {limits['images']} images, got {images}")
+
+        contents = self.prepare(contents)
+        tokens = estimate_input_tokens(model, contents)
+        limit = limits.get("input_tokens")
+        remote = self.mode == "count" or bool(limit and tokens > limit * COUNT_THRESHOLD)
+        tokens = self.count_tokens(model, contents, remote=remote) or tokens
+        if limit and tokens > limit:
+            raise PreflightError(f"Request has ~{tokens} input tokens, over the {limit} limit of {model}")
+        return contents, tokens + output_tokens(model, config)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Request size and token pre-flight")
+    sub = parser.add_subparsers(dest="command", required=True)
+    estimate = sub.add_parser("estimate", help="送信サイズとトークン数を表示")
+    estimate.add_argument("prompt")
+    estimate.add_argument("-i", "--images", nargs="+", default=[], help="参照画像")
+    estimate.add_argument("-m", "--model", default="pro", choices=["flash", "pro"])
+    estimate.add_argument("-s", "--size", default="2K", choices=["1K", "2K", "4K"])
+    estimate.add_argument("--count", action="store_true", help="count_tokens で数える（要 API キー）")
+    sub.add_parser("clear-cache", help="count_tokens のキャッシュを消去")
+    args = parser.parse_args()
+
+    if args.command == "clear-cache":
+        TOKEN_CACHE_FILE.unlink(missing_ok=True)
+        print(f"🗑️  Removed {TOKEN_CACHE_FILE}")
+        return
+
+    model = "gemini-3-pro-image-preview" if args.model == "pro" else "gemini-2.5-flash-image"
+    config = types.GenerateContentConfig(
+        response_modalities=["TEXT", "IMAGE"],
+        image_config=types.ImageConfig(image_size=args.size if args.model == "pro" else None),
+    )
+    count_fn = None
+    if args.count:
+        from dotenv import load_dotenv
+        from gemini_client import create_client
+
+        load_dotenv()
+        client = create_client()
+        count_fn = lambda m, c: client.models.count_tokens(model=m, contents=c).total_tokens
+    preflight = Preflight(mode="count" if args.count else "local", count_fn=count_fn)
+
+    contents = [args.prompt] + [Image.open(path) for path in args.images]
+    try:
+        prepared, tokens = preflight.check(model, contents, config)
+    except PreflightError as e:
+        print(f"❌ {e}")
+        return
+    print(f"📦 Payload: {payload_bytes(prepared) / 1024:.1f} KB ({len(args.images)} images)")
+    print(f"🔢 Tokens: ~{tokens} (output image {output_tokens(model, config)})")
+    limit = MODEL_LIMITS.get(model, {}).get("input_tokens")
+    if limit:
+        print(f"   Input limit of {model}: {limit}")
+
+
+if __name__ == "__main__":
+    main()
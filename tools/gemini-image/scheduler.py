@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+"""
+生成呼び出しの優先度スケジューラ
+
+呼び出しごとに優先度クラス（interactive / daily / bulk）を持ち、待ちが発生する場所
+（同時実行スロット、クレデンシャルプールのクォータ待ち）では重み付き公平キュー（WFQ）の
+順で送り出す。重みは interactive 16 : daily 4 : bulk 1。
+
+- interactive が待っている間は、まだ始まっていない bulk を後回しにする（プリエンプション）
+- スロット数を指定した場合、reserved 個は interactive 専用に空けておく。実行中の bulk が
+  スロットを埋め尽くして対話的な呼び出しが待たされることが無い
+- 別プロセス（generate_from_yaml.py の夜間バッチなど）の bulk 呼び出しは、
+  どこかのプロセスで interactive が実行中なら新しい呼び出しの開始を待つ
+  （~/.gemini-image/scheduler/ のマーカーファイルで共有。待ちは最大 GEMINI_BULK_YIELD_MAX 秒）
+
+優先度の決め方（上から優先）:
+    with scheduler.priority("bulk"): ...   # コード中で明示
+    GEMINI_PRIORITY=bulk                   # 環境変数
+    scheduler.set_default("bulk")          # ツールの既定（generate_from_yaml.py など）
+    interactive
+
+Usage:
+    python scheduler.py                    # 実行中の interactive 呼び出し（マーカー）の一覧
+"""
+
+import contextlib
+import contextvars
+import itertools
+import os
+import threading
+import time
+import uuid
+from pathlib import Path
+
+# 優先度クラス -> WFQ の重み
+PRIORITIES = {"interactive": 16, "daily": 4, "bulk": 1}
+MARKER_DIR = Path(os.environ.get("GEMINI_SCHED_DIR", "~/.gemini-image/scheduler")).expanduser()
+YIELD_MAX = float(os.environ.get("GEMINI_BULK_YIELD_MAX", "60"))
+YIELD_POLL = 0.25
+
+_priority = contextvars.ContextVar("gemini_priority", default=None)
+_tool_default = None
+
+
+def _validate(name: str) -> str:
+    if name not in PRIORITIES:
+        raise ValueError(f"Unknown priority {name!r} (choose from {', '.join(PRIORITIES)})")
+    return name
+
+
+def set_default(name: str):
+    """このプロセスの既定の優先度（環境変数 GEMINI_PRIORITY があればそちらが優先）"""
+    global _tool_default
+    _tool_default = _validate(name)
+
+
+def current_priority() -> str:
+    if name := _priority.get():
+        return name
+    if name := os.environ.get("GEMINI_PRIORITY"):
+        return _validate(name)
+    return _tool_default or "interactive"
+
+
+@contextlib.contextmanager
+def priority(name: str):
+    """ブロック内の呼び出しの優先度を指定"""
+    token = _priority.set(_validate(name))
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def request_cost(estimated_tokens: int = 0) -> float:
+    """WFQ のコスト（大きいリクエストほど、同じクラスの次の順番が遅れる）"""
+    return 1.0 + estimated_tokens / 1000
+
+
+class Ticket:
+    def __init__(self, priority: str, start: float, tag: float, seq: int, data=None):
+        self.priority = priority
+        self.start = start  # 仮想開始時刻
+        self.tag = tag  # 仮想終了時刻（小さい順に送り出す）
+        self.seq = seq
+        self.data = data
+        self.enqueued = time.perf_counter()
+        self.preempted = False
+
+
+class FairQueue:
+    """
+    重み付き公平キュー
+
+    送り出す順番だけを決める。排他は呼び出し側のロック（Condition）で行う。
+    """
+
+    def __init__(self, weights: dict = PRIORITIES):
+        self.weights = weights
+        self.virtual_time = 0.0
+        self._finish = {p: 0.0 for p in weights}
+        self._waiting: list[Ticket] = []
+        self._seq = itertools.count()
+        self.stats = {p: {"dispatched": 0, "preempted": 0, "wait_seconds": 0.0} for p in weights}
+
+    def enqueue(self, priority: str, cost: float = 1.0, data=None) -> Ticket:
+        start = max(self.virtual_time, self._finish[priority])
+        tag = self._finish[priority] = start + cost / self.weights[priority]
+        ticket = Ticket(priority, start, tag, next(self._seq), data)
+        self._waiting.append(ticket)
+        return ticket
+
+    def head(self, eligible=lambda ticket: True) -> Ticket | None:
+        """次に送り出すチケット。interactive が待っていれば bulk は選ばない"""
+        candidates = [t for t in self._waiting if eligible(t)]
+        if not candidates:
+            return None
+        best = min(candidates, key=lambda t: (t.tag, t.seq))
+        if best.priority == "bulk" and any(t.priority == "interactive" for t in self._waiting):
+            if not best.preempted:
+                best.preempted = True
+                self.stats["bulk"]["preempted"] += 1
+            candidates = [t for t in candidates if t.priority != "bulk"]
+            best = min(candidates, key=lambda t: (t.tag, t.seq)) if candidates else None
+        return best
+
+    def dispatch(self, ticket: Ticket) -> float:
+        """送り出したチケットを外し、待ち時間を返す"""
+        self._waiting.remove(ticket)
+        self.virtual_time = max(self.virtual_time, ticket.start)
+        waited = time.perf_counter() - ticket.enqueued
+        stats = self.stats[ticket.priority]
+        stats["dispatched"] += 1
+        stats["wait_seconds"] += waited
+        return waited
+
+    def cancel(self, ticket: Ticket):
+        if ticket in self._waiting:
+            self._waiting.remove(ticket)
+
+    def __len__(self):
+        return len(self._waiting)
+
+
+# ---------------------------------------------------------------------------
+# プロセスをまたぐ interactive の通知
+# ---------------------------------------------------------------------------
+
+
+@contextlib.contextmanager
+def interactive_marker():
+    """実行中の interactive 呼び出しを他プロセスへ知らせるマーカー"""
+    path = MARKER_DIR / f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+    try:
+        MARKER_DIR.mkdir(parents=True, exist_ok=True)
+        path.touch()
+    except OSError:
+        path = None
+    try:
+        yield
+    finally:
+        if path:
+            path.unlink(missing_ok=True)
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def foreign_interactive() -> list[int]:
+    """interactive 呼び出しを実行中の他プロセスの pid（終了済みのマーカーは削除）"""
+    if not MARKER_DIR.exists():
+        return []
+    pids = []
+    for path in MARKER_DIR.iterdir():
+        try:
+            pid = int(path.name.split("-", 1)[0])
+        except ValueError:
+            continue
+        if pid == os.getpid():
+            continue
+        if _alive(pid):
+            pids.append(pid)
+        else:
+            path.unlink(missing_ok=True)
+    return pids
+
+
+def yield_to_interactive(max_wait: float = YIELD_MAX) -> float:
+    """他プロセスの interactive が終わるまで待つ（最大 max_wait 秒）。待った秒数を返す"""
+    started = time.perf_counter()
+    while foreign_interactive() and time.perf_counter() - started < max_wait:
+        time.sleep(YIELD_POLL)
+    return time.perf_counter() - started
+
+
+# ---------------------------------------------------------------------------
+# 同時実行スロット
+# ---------------------------------------------------------------------------
+
+
+class Scheduler:
+    """
+    プロセス内の同時実行スロットを WFQ の順で割り当てる
+
+    slots=None なら上限なし（優先度の効果はクロスプロセスの譲り合いとプールの待ち順のみ）。
+    """
+
+    def __init__(self, slots: int | None = None, reserved: int = 1):
+        self._cond = threading.Condition()
+        self.queue = FairQueue()
+        self.running = 0
+        self.configure(slots, reserved)
+
+    @classmethod
+    def from_env(cls) -> "Scheduler":
+        slots = int(os.environ.get("GEMINI_SCHED_SLOTS") or 0) or None
+        return cls(slots, int(os.environ.get("GEMINI_SCHED_RESERVED", "1")))
+
+    def configure(self, slots: int | None = None, reserved: int = 1):
+        with self._cond:
+            self.slots = slots
+            # 全スロットを予約すると bulk が永久に走れないため、最低1つは残す
+            self.reserved = min(reserved, slots - 1) if slots else 0
+            self._cond.notify_all()
+
+    def _has_capacity(self, ticket: Ticket) -> bool:
+        if self.slots is None:
+            return True
+        limit = self.slots if ticket.priority == "interactive" else self.slots - self.reserved
+        return self.running < limit
+
+    @contextlib.contextmanager
+    def slot(self, estimated_tokens: int = 0):
+        """スロットを確保して実行する。待った秒数（他プロセスへの譲り合いを含む）を yield"""
+        name = current_priority()
+        waited = yield_to_interactive() if name == "bulk" else 0.0
+        marker = interactive_marker() if name == "interactive" else contextlib.nullcontext()
+        with marker:
+            with self._cond:
+                ticket = self.queue.enqueue(name, request_cost(estimated_tokens))
+                while self.queue.head(self._has_capacity) is not ticket:
+                    self._cond.wait()
+                waited += self.queue.dispatch(ticket)
+                self.running += 1
+                self._cond.notify_all()
+            try:
+                yield waited
+            finally:
+                with self._cond:
+                    self.running -= 1
+                    self._cond.notify_all()
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "slots": self.slots,
+                "reserved": self.reserved,
+                "running": self.running,
+                "queued": len(self.queue),
+                "by_priority": {p: dict(s) for p, s in self.queue.stats.items()},
+            }
+
+
+SCHEDULER = Scheduler.from_env()
+
+
+def main():
+    pids = foreign_interactive()
+    if not pids:
+        print("💤 No interactive calls in flight")
+        return
+    for pid in sorted(set(pids)):
+        print(f"⚡ interactive call in flight: pid {pid} ({pids.count(pid)})")
+
+
+if __name__ == "__main__":
+    main()
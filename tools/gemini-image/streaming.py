@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Gemini ストリーミングレスポンス処理
+
+generate_content_stream / send_message_stream が返すチャンクを逐次処理する。
+テキストは到着した時点で表示し、画像（思考過程の中間画像を含む）は
+パートが届いた時点で保存する。最初のチャンク到着までの時間 (TTFB) も記録する。
+"""
+
+import sys
+import time
+from typing import Callable, Iterable
+
+from tracing import decode_image, save_image
+
+
+def consume_stream(
+    chunks: Iterable,
+    final_path: Callable[[], str],
+    thinking_path: Callable[[int], str] | None = None,
+    started_at: float | None = None,
+    echo: bool = True,
+) -> dict:
+    """
+    ストリームを消費して結果を組み立てる
+
+    Args:
+        chunks: GenerateContentResponse のイテレータ
+        final_path: 最終画像の保存先を返す関数
+        thinking_path: 思考画像の保存先を返す関数 (index -> path)。None なら保存しない
+        started_at: リクエスト開始時刻 (time.perf_counter)。None なら呼び出し時点
+        echo: テキストを到着次第 stdout に表示する
+
+    Returns:
+        dict: 生成結果 (text, image_path, thinking, ttfb, elapsed)
+    """
+    if started_at is None:
+        started_at = time.perf_counter()
+
+    result = {"text": None, "image_path": None, "thinking": [], "ttfb": None, "elapsed": None}
+    text_parts: list[str] = []
+    thought_text: list[str] = []
+
+    def flush_thought():
+        # 連続する思考テキストのデルタを1ステップにまとめる
+        if thought_text:
+            result["thinking"].append({"type": "text", "content": "".join(thought_text)})
+            thought_text.clear()
+
+    for chunk in chunks:
+        if result["ttfb"] is None:
+            result["ttfb"] = time.perf_counter() - started_at
+            if echo:
+                print(f"⚡ First byte: {result['ttfb']:.2f}s", file=sys.stderr)
+
+        for part in chunk.parts or []:
+            is_thought = bool(getattr(part, "thought", False))
+
+            if part.text:
+                if is_thought:
+                    thought_text.append(part.text)
+                else:
+                    flush_thought()
+                    text_parts.append(part.text)
+                    if echo:
+                        print(part.text, end="", flush=True)
+                continue
+
+            image = decode_image(part)
+            if image is None:
+                continue
+
+            if is_thought:
+                flush_thought()
+                if thinking_path is None:
+                    continue
+                path = thinking_path(len(result["thinking"]))
+                save_image(image, path)
+                result["thinking"].append({"type": "image", "path": path})
+                if echo:
+                    print(f"\n🧠 Thinking image saved: {path}", file=sys.stderr)
+            else:
+                path = final_path()
+                save_image(image, path)
+                result["image_path"] = path
+                if echo:
+                    print(f"\n🖼️  Image saved: {path}", file=sys.stderr)
+
+    flush_thought()
+    if text_parts:
+        result["text"] = "".join(text_parts)
+        if echo:
+            print()
+    result["elapsed"] = time.perf_counter() - started_at
+
+    return result
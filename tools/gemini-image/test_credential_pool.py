@@ -0,0 +1,40 @@
+"""
+credential_pool.py のテスト
+
+Usage:
+    python -m pytest tools/gemini-image/test_credential_pool.py -q
+"""
+
+from credential_pool import Credential, CredentialPool
+
+
+def pool(tpm: int) -> tuple[CredentialPool, Credential]:
+    cred = Credential("key0", "test", tpm=tpm)
+    return CredentialPool([cred], max_wait=0.1), cred
+
+
+def test_concurrent_acquire_reserves_tokens():
+    p, cred = pool(tpm=3000)
+    assert p.acquire(2000) is cred
+    assert cred.window_tokens() == 2000
+    # 1件目が実行中のあいだは 2件目の見積もりが tpm に収まらない
+    assert p.acquire(2000) is None
+    assert p.acquire(1000) is cred
+    assert cred.window_tokens() == 3000
+
+
+def test_release_settles_reservation():
+    p, cred = pool(tpm=3000)
+    p.acquire(2000)
+    p.acquire(500)
+    p.release(cred, tokens=1200, estimated_tokens=2000)
+    assert cred.window_tokens() == 1700
+    p.release(cred, estimated_tokens=500)  # 失敗したリクエストは予約を取り消す
+    assert cred.window_tokens() == 1200
+    assert cred.in_flight == 0
+
+
+def test_oversized_request_passes_on_empty_window():
+    p, cred = pool(tpm=3000)
+    assert p.acquire(5000) is cred
+    assert p.acquire(1) is None
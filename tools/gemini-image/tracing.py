@@ -0,0 +1,450 @@
+#!/usr/bin/env python3
+"""
+Gemini API 呼び出しのトレーシングとメトリクス
+
+gemini_client.create_client() が返すクライアント経由の全呼び出し
+（generate_content / ストリーミング / チャット / ファイルアップロード）について、
+以下を1レコードとして記録する。
+
+- spans: queue_wait（優先度スケジューラ・キーの空き待ち）/ request_build / network / ttfb（ストリーム時）
+  + 呼び出し後にツール側で計測する decode / disk_write
+- 送受信バイト数、usage_metadata のトークン数、HTTP リトライ回数、モデルID
+
+出力先:
+- JSONL: 環境変数 GEMINI_TRACE_FILE（1行1レコード、追記）
+- Prometheus テキスト: 環境変数 GEMINI_METRICS_PORT を設定するとプロセス内で /metrics を公開
+  ワンショットの CLI 向けには JSONL を集計して公開する `serve` サブコマンドを使う
+
+Usage:
+    export GEMINI_TRACE_FILE=~/.gemini-image/trace.jsonl
+    python generate.py "テスト"
+    python tracing.py summary ~/.gemini-image/trace.jsonl
+    python tracing.py serve ~/.gemini-image/trace.jsonl --port 9464
+"""
+
+import argparse
+import contextlib
+import contextvars
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+SPAN_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+# 実行中の呼び出し（HTTP フックから参照）と、直近に終わった呼び出し（decode / disk_write の帰属先）
+_current = contextvars.ContextVar("gemini_current_call", default=None)
+_last = contextvars.ContextVar("gemini_last_call", default=None)
+
+
+class CallRecord:
+    """API 呼び出し1回分の計測値"""
+
+    def __init__(self, op: str, model: str):
+        self.call_id = uuid.uuid4().hex[:12]
+        self.op = op
+        self.model = model
+        self.tool = Path(sys.argv[0]).stem if sys.argv and sys.argv[0] else "python"
+        self.timestamp = datetime.now(timezone.utc).isoformat(timespec="milliseconds")
+        self.started = time.perf_counter()
+        self.first_request_at = None
+        self.dispatched_at = None  # 記録開始後に順番待ちした場合、その終了時刻
+        self.spans: dict[str, float] = {}
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.http_requests = 0
+        self.tokens: dict[str, int] = {}
+        self.status = "ok"
+        self.error = None
+        self.attrs: dict = {}
+
+    @property
+    def retries(self) -> int:
+        return max(0, self.http_requests - 1)
+
+    # --- HTTP フック ---
+
+    def on_request(self, request):
+        self.http_requests += 1
+        if self.first_request_at is None:
+            self.first_request_at = time.perf_counter()
+        try:
+            self.bytes_sent += len(request.content)
+        except Exception:
+            self.bytes_sent += int(request.headers.get("content-length") or 0)
+
+    def on_response(self, response):
+        length = response.headers.get("content-length")
+        if length:
+            self.bytes_received += int(length)
+            self.attrs["_measured_rx"] = True
+
+    # --- レスポンス ---
+
+    def observe_response(self, response):
+        """usage_metadata と（Content-Length が無い場合の）受信バイト推定"""
+        usage = getattr(response, "usage_metadata", None)
+        if usage:
+            for key, attr in (
+                ("prompt", "prompt_token_count"),
+                ("candidates", "candidates_token_count"),
+                ("thoughts", "thoughts_token_count"),
+                ("total", "total_token_count"),
+            ):
+                if value := getattr(usage, attr, None):
+                    self.tokens[key] = value
+
+        if not self.attrs.get("_measured_rx"):
+            self.bytes_received += _estimate_payload(response)
+
+    def to_dict(self) -> dict:
+        return {
+            "kind": "call",
+            "call_id": self.call_id,
+            "ts": self.timestamp,
+            "tool": self.tool,
+            "op": self.op,
+            "model": self.model,
+            "status": self.status,
+            "error": self.error,
+            "spans": {k: round(v, 4) for k, v in self.spans.items()},
+            "bytes_sent": self.bytes_sent,
+            "bytes_received": self.bytes_received,
+            "tokens": self.tokens,
+            "retries": self.retries,
+            **{k: v for k, v in self.attrs.items() if not k.startswith("_")},
+        }
+
+
+def _estimate_payload(response) -> int:
+    """inline_data（base64 換算）とテキストから受信サイズを推定"""
+    total = 0
+    for candidate in getattr(response, "candidates", None) or []:
+        for part in (candidate.content.parts if candidate.content else None) or []:
+            if part.inline_data and part.inline_data.data:
+                total += len(part.inline_data.data) * 4 // 3
+            if part.text:
+                total += len(part.text.encode("utf-8"))
+    return total
+
+
+class _Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(SPAN_BUCKETS) + 1)
+        self.sum = 0.0
+        self.n = 0
+
+    def observe(self, value: float):
+        self.sum += value
+        self.n += 1
+        for i, bound in enumerate(SPAN_BUCKETS):
+            if value <= bound:
+                self.counts[i] += 1
+                return
+        self.counts[-1] += 1
+
+
+class Tracer:
+    """レコードの出力とメトリクス集計"""
+
+    def __init__(self, trace_file: str | None = None):
+        self.trace_file = Path(trace_file).expanduser() if trace_file else None
+        self._lock = threading.Lock()
+        self.calls = defaultdict(int)  # (op, model, status)
+        self.counters = defaultdict(int)  # (name, model[, kind])
+        self.histograms = defaultdict(_Histogram)  # (span, model)
+        self._server = None
+
+    # --- 記録 ---
+
+    @contextlib.contextmanager
+    def call(self, op: str, model: str, **attrs):
+        """API 呼び出しを計測するコンテキスト。レコードを yield する"""
+        record = CallRecord(op, model)
+        record.attrs.update(attrs)
+        token = _current.set(record)
+        try:
+            yield record
+        except BaseException as e:
+            record.status = "error"
+            record.error = f"{type(e).__name__}: {getattr(e, 'code', '') or ''}".rstrip(": ")
+            raise
+        finally:
+            _current.reset(token)
+            self.finish(record)
+
+    def finish(self, record: CallRecord):
+        now = time.perf_counter()
+        record.spans.setdefault("queue_wait", 0.0)
+        base = record.dispatched_at or record.started
+        if record.first_request_at is not None:
+            record.spans["request_build"] = max(0.0, record.first_request_at - base)
+            record.spans["network"] = now - record.first_request_at
+        else:
+            record.spans["network"] = now - base
+        _last.set((record.call_id, record.model))
+        row = record.to_dict()
+        self.emit(row)
+        self._aggregate_call(row)
+
+    def mark_dispatched(self):
+        """実行中の呼び出しの順番待ち（スケジューラ・キーの空き待ち）が終わった"""
+        if record := _current.get():
+            record.dispatched_at = time.perf_counter()
+            record.spans["queue_wait"] = record.dispatched_at - record.started
+
+    def add_span(self, name: str, seconds: float, **attrs):
+        """実行中（ストリーム中）または直近の呼び出しに decode / disk_write などのスパンを追加"""
+        if record := _current.get():
+            call_id, model = record.call_id, record.model
+        else:
+            call_id, model = _last.get() or (None, "unknown")
+        row = {
+            "kind": "span",
+            "call_id": call_id,
+            "ts": datetime.now(timezone.utc).isoformat(timespec="milliseconds"),
+            "name": name,
+            "seconds": round(seconds, 4),
+            **attrs,
+        }
+        self.emit(row)
+        self._aggregate_span(row, model)
+
+    @contextlib.contextmanager
+    def span(self, name: str, **attrs):
+        started = time.perf_counter()
+        try:
+            yield attrs
+        finally:
+            self.add_span(name, time.perf_counter() - started, **attrs)
+
+    def _aggregate_call(self, row: dict):
+        model = row["model"]
+        with self._lock:
+            self.calls[(row["op"], model, row["status"])] += 1
+            self.counters[("bytes_sent", model)] += row["bytes_sent"]
+            self.counters[("bytes_received", model)] += row["bytes_received"]
+            self.counters[("retries", model)] += row["retries"]
+            for kind, value in row["tokens"].items():
+                self.counters[("tokens", model, kind)] += value
+            for name, seconds in row["spans"].items():
+                self.histograms[(name, model)].observe(seconds)
+
+    def _aggregate_span(self, row: dict, model: str):
+        with self._lock:
+            self.histograms[(row["name"], model)].observe(row["seconds"])
+            if "bytes" in row:
+                self.counters[(f"{row['name']}_bytes", model)] += row["bytes"]
+
+    def emit(self, row: dict):
+        if not self.trace_file:
+            return
+        line = json.dumps(row, ensure_ascii=False)
+        with self._lock:
+            self.trace_file.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.trace_file, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+    # --- Prometheus ---
+
+    def render_prometheus(self) -> str:
+        lines = []
+        with self._lock:
+            lines += [
+                "# HELP gemini_calls_total Gemini API calls",
+                "# TYPE gemini_calls_total counter",
+            ]
+            for (op, model, status), n in sorted(self.calls.items()):
+                lines.append(f'gemini_calls_total{{op="{op}",model="{model}",status="{status}"}} {n}')
+
+            by_name = defaultdict(list)
+            for key, value in sorted(self.counters.items()):
+                by_name[key[0]].append((key[1:], value))
+            for name, entries in by_name.items():
+                metric = f"gemini_{name}_total"
+                lines += [f"# TYPE {metric} counter"]
+                for labels, value in entries:
+                    label = f'model="{labels[0]}"' + (f',kind="{labels[1]}"' if len(labels) > 1 else "")
+                    lines.append(f"{metric}{{{label}}} {value}")
+
+            lines += [
+                "# HELP gemini_span_seconds Time spent per phase of an API call",
+                "# TYPE gemini_span_seconds histogram",
+            ]
+            for (span, model), hist in sorted(self.histograms.items()):
+                label = f'span="{span}",model="{model}"'
+                cumulative = 0
+                for bound, count in zip(SPAN_BUCKETS, hist.counts):
+                    cumulative += count
+                    lines.append(f'gemini_span_seconds_bucket{{{label},le="{bound}"}} {cumulative}')
+                lines.append(f'gemini_span_seconds_bucket{{{label},le="+Inf"}} {hist.n}')
+                lines.append(f"gemini_span_seconds_sum{{{label}}} {hist.sum:.6f}")
+                lines.append(f"gemini_span_seconds_count{{{label}}} {hist.n}")
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+        """/metrics をバックグラウンドスレッドで公開"""
+        if self._server:
+            return self._server
+        tracer = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.rstrip("/") != "/metrics":
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                body = tracer.render_prometheus().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self._server
+
+    def replay(self, path: str):
+        """JSONL を読み込んでメトリクスを再構築（serve / summary 用）"""
+        models = {}
+        with open(Path(path).expanduser(), "r", encoding="utf-8") as f:
+            for line in f:
+                row = json.loads(line)
+                if row.get("kind") == "call":
+                    models[row["call_id"]] = row["model"]
+                    self._aggregate_call(row)
+                elif row.get("kind") == "span":
+                    self._aggregate_span(row, models.get(row.get("call_id"), "unknown"))
+
+
+TRACER = Tracer(os.environ.get("GEMINI_TRACE_FILE"))
+
+if os.environ.get("GEMINI_METRICS_PORT"):
+    TRACER.serve(int(os.environ["GEMINI_METRICS_PORT"]))
+
+
+def current_call() -> CallRecord | None:
+    return _current.get()
+
+
+def httpx_event_hooks() -> dict:
+    """SDK の httpx クライアントに渡すイベントフック（バイト数・リトライの計測）"""
+
+    def on_request(request):
+        if record := _current.get():
+            record.on_request(request)
+
+    def on_response(response):
+        if record := _current.get():
+            record.on_response(response)
+
+    return {"request": [on_request], "response": [on_response]}
+
+
+def httpx_async_event_hooks() -> dict:
+    """httpx_event_hooks の非同期クライアント版（ヘッジの .aio 呼び出し用）"""
+
+    async def on_request(request):
+        if record := _current.get():
+            record.on_request(request)
+
+    async def on_response(response):
+        if record := _current.get():
+            record.on_response(response)
+
+    return {"request": [on_request], "response": [on_response]}
+
+
+def decode_image(part):
+    """part.as_image() を decode スパンとして計測"""
+    with TRACER.span("decode"):
+        return part.as_image()
+
+
+def save_image(image, path) -> str:
+    """image.save() を disk_write スパンとして計測"""
+    with TRACER.span("disk_write") as attrs:
+        image.save(str(path))
+        attrs["bytes"] = os.path.getsize(path)
+    return str(path)
+
+
+# --- CLI ---
+
+
+def _percentile(values: list[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))]
+
+
+def summarize(path: str):
+    """モデル別の呼び出し数・エラー率・レイテンシ・バイト数・トークン数"""
+    per_model = defaultdict(lambda: {"calls": 0, "errors": 0, "retries": 0, "network": [],
+                                     "bytes_sent": 0, "bytes_received": 0, "tokens": 0})
+    with open(Path(path).expanduser(), "r", encoding="utf-8") as f:
+        for line in f:
+            row = json.loads(line)
+            if row.get("kind") != "call":
+                continue
+            m = per_model[row["model"]]
+            m["calls"] += 1
+            m["errors"] += row["status"] != "ok"
+            m["retries"] += row.get("retries", 0)
+            m["network"].append(row["spans"].get("network", 0.0))
+            m["bytes_sent"] += row.get("bytes_sent", 0)
+            m["bytes_received"] += row.get("bytes_received", 0)
+            m["tokens"] += row.get("tokens", {}).get("total", 0)
+
+    print(f"{'model':<32} {'calls':>6} {'err%':>6} {'retry':>6} {'p50s':>7} {'p95s':>7} "
+          f"{'sentMB':>8} {'recvMB':>8} {'tokens':>10}")
+    for model, m in sorted(per_model.items()):
+        err = 100 * m["errors"] / m["calls"]
+        print(f"{model:<32} {m['calls']:>6} {err:>6.1f} {m['retries']:>6} "
+              f"{_percentile(m['network'], 50):>7.2f} {_percentile(m['network'], 95):>7.2f} "
+              f"{m['bytes_sent'] / 1e6:>8.2f} {m['bytes_received'] / 1e6:>8.2f} {m['tokens']:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gemini API trace tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_summary = sub.add_parser("summary", help="JSONL トレースをモデル別に集計")
+    p_summary.add_argument("trace_file")
+    p_serve = sub.add_parser("serve", help="JSONL トレースを Prometheus 形式で公開")
+    p_serve.add_argument("trace_file")
+    p_serve.add_argument("--host", default="127.0.0.1")
+    p_serve.add_argument("--port", type=int, default=9464)
+    args = parser.parse_args()
+
+    if args.command == "summary":
+        summarize(args.trace_file)
+        return
+
+    tracer = Tracer()
+    tracer.replay(args.trace_file)
+    server = tracer.serve(args.port, args.host)
+    print(f"📈 Serving metrics at http://{args.host}:{args.port}/metrics")
+    try:
+        while True:
+            time.sleep(60)
+            # 追記分を取り込み直す
+            fresh = Tracer()
+            fresh.replay(args.trace_file)
+            with tracer._lock:
+                tracer.calls, tracer.counters, tracer.histograms = fresh.calls, fresh.counters, fresh.histograms
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+複数バリアント生成と best-of-N 選択
+
+1リクエストで candidate_count=N を要求できるモデルではそのまま N 候補を受け取り、
+非対応のモデル（400 が返る）では同じリクエストを N 本並列に投げる。
+全バリアントを <出力名>_variants/ 以下に保存し、ローカルの簡易スコア
+（シャープネス・コントラスト）で最良のものを出力パスへコピーする。
+"""
+
+import contextvars
+import json
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from google.genai import errors, types
+from PIL import Image, ImageFilter, ImageStat
+
+from gemini_client import GeminiClient, served_model
+from tracing import decode_image, save_image
+
+# candidate_count > 1 を拒否したモデル（プロセス内で記憶し、以降は最初から並列化）
+_candidate_unsupported: set[str] = set()
+_lock = threading.Lock()
+
+SCORE_SIZE = 512
+
+
+def score_image(path: str) -> dict:
+    """
+    画像の簡易品質スコア
+
+    - sharpness: エッジ画像の分散（ぼやけ・潰れた文字ほど低い）
+    - contrast: 輝度の標準偏差（のっぺりした画像ほど低い）
+    """
+    with Image.open(path) as img:
+        gray = img.convert("L")
+        gray.thumbnail((SCORE_SIZE, SCORE_SIZE))
+        edges = gray.filter(ImageFilter.FIND_EDGES)
+        return {
+            "sharpness": ImageStat.Stat(edges).var[0],
+            "contrast": ImageStat.Stat(gray).stddev[0],
+        }
+
+
+def rank_variants(paths: list[str]) -> list[dict]:
+    """スコアを正規化して合成し、高い順に並べる"""
+    scored = [{"path": p, **score_image(p)} for p in paths]
+    for key in ("sharpness", "contrast"):
+        values = [s[key] for s in scored]
+        lo, hi = min(values), max(values)
+        for s in scored:
+            s[f"{key}_norm"] = (s[key] - lo) / (hi - lo) if hi > lo else 1.0
+    for s in scored:
+        s["score"] = round(0.7 * s["sharpness_norm"] + 0.3 * s["contrast_norm"], 4)
+    return sorted(scored, key=lambda s: s["score"], reverse=True)
+
+
+def _final_images(candidate) -> list:
+    images = []
+    for part in (candidate.content.parts if candidate.content else None) or []:
+        if hasattr(part, "thought") and part.thought:
+            continue
+        if image := decode_image(part):
+            images.append(image)
+    return images
+
+
+def _request_candidates(client, model_id, contents, config, n) -> list:
+    """candidate_count=n で1リクエスト。(画像, 応答モデル) のリスト、非対応なら None"""
+    with _lock:
+        if model_id in _candidate_unsupported:
+            return None
+    try:
+        response = client.models.generate_content(
+            model=model_id,
+            contents=contents,
+            config=config.model_copy(update={"candidate_count": n}),
+        )
+    except errors.ClientError as e:
+        if e.code != 400:
+            raise
+        with _lock:
+            _candidate_unsupported.add(model_id)
+        return None
+
+    served = served_model()
+    images = []
+    for candidate in response.candidates or []:
+        images.extend((image, served) for image in _final_images(candidate)[-1:])
+    return images
+
+
+def _request_one(client, model_id, contents, config) -> list:
+    response = client.models.generate_content(model=model_id, contents=contents, config=config)
+    served = served_model()
+    images = []
+    for candidate in response.candidates or []:
+        images.extend((image, served) for image in _final_images(candidate)[-1:])
+    return images[:1]
+
+
+def generate_variants(
+    client: GeminiClient,
+    model_id: str,
+    contents: list,
+    config: types.GenerateContentConfig,
+    n: int,
+    output_path: str,
+    max_workers: int = 4,
+) -> dict:
+    """
+    N バリアントを生成して保存し、最良のものを output_path に置く
+
+    Returns:
+        dict: image_path (選ばれた画像), variants (スコア順), mode (candidates / fanout),
+              model (選ばれた画像を生成したモデル)
+    """
+    output = Path(output_path)
+    variant_dir = output.with_name(f"{output.stem}_variants")
+    variant_dir.mkdir(parents=True, exist_ok=True)
+
+    images = _request_candidates(client, model_id, contents, config, n)
+    mode = "candidates"
+    if images is None:
+        images, mode = [], "fanout"
+
+    # 不足分（非対応 or 候補数が足りない）は並列で追加生成
+    missing = n - len(images)
+    if missing > 0:
+        if mode == "candidates" and images:
+            mode = "candidates+fanout"
+        # 呼び出し元の contextvars（scheduler の優先度・トレース）をワーカースレッドへ引き継ぐ
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, missing))) as pool:
+            futures = [
+                pool.submit(contextvars.copy_context().run, _request_one, client, model_id, contents, config)
+                for _ in range(missing)
+            ]
+            for future in futures:
+                try:
+                    images.extend(future.result())
+                except Exception as e:
+                    print(f"   ⚠️ Variant failed: {e}")
+
+    models = {}
+    for i, (image, served) in enumerate(images[:n], start=1):
+        path = variant_dir / f"v{i:02d}{output.suffix or '.png'}"
+        save_image(image, str(path))
+        models[str(path)] = served
+
+    result = {"image_path": None, "variants": [], "mode": mode, "model": None}
+    if not models:
+        return result
+
+    ranked = rank_variants(list(models))
+    for v in ranked:
+        v["model"] = models[v["path"]]
+    shutil.copyfile(ranked[0]["path"], output)
+    result["image_path"] = str(output)
+    result["variants"] = ranked
+    result["model"] = ranked[0]["model"]
+
+    with open(variant_dir / "variants.json", "w", encoding="utf-8") as f:
+        json.dump(
+            {"default": ranked[0]["path"], "mode": mode, "model": model_id, "variants": ranked},
+            f,
+            ensure_ascii=False,
+            indent=2,
+        )
+
+    return result
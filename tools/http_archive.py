@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+Record/replay HTTP archive for the Voicy scraper.
+
+Responses are stored content-addressed and gzip-compressed, so identical bodies
+(app bundles shared by every episode page) are kept once:
+
+    <root>/bodies/ab/<sha256>.gz    response bodies
+    <root>/entries/<key>.json       method, url, status, headers, body hash, validators
+
+Modes (HttpArchive.attach routes every request of a Playwright context):
+    record      fetch from the network and store every successful response
+    replay      serve only from the archive and never touch the network (misses are aborted)
+    revalidate  send If-None-Match / If-Modified-Since for archived URLs;
+                304 serves the archived body, 200 updates the archive
+
+Archive location: ~/.voicy-scraper/http (override with VOICY_HTTP_ARCHIVE)
+
+Usage:
+    python fetch_voicy_all.py --http-cache record       # build the corpus
+    python fetch_voicy_all.py --http-cache replay       # offline, no network
+    python fetch_voicy_all.py --from-archive            # re-run the parser over archived pages
+    python http_archive.py stats
+    python http_archive.py list --pattern '*/channel/3577/*'
+    python http_archive.py clear
+"""
+
+import argparse
+import fnmatch
+import gzip
+import hashlib
+import json
+import os
+import shutil
+from datetime import datetime
+from pathlib import Path
+
+ARCHIVE_DIR = Path(os.environ.get("VOICY_HTTP_ARCHIVE", "~/.voicy-scraper/http")).expanduser()
+MODES = ("off", "record", "replay", "revalidate")
+# Bodies are stored decoded, so these no longer describe them
+DROP_HEADERS = {"content-encoding", "content-length", "transfer-encoding", "connection"}
+
+
+def request_key(method, url, post_data=None):
+    blob = f"{method.upper()} {url}\n{post_data or ''}"
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()[:32]
+
+
+def _write_atomic(path, data):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(f".{os.getpid()}.tmp")
+    with open(tmp, "wb") as f:
+        f.write(data)
+    tmp.replace(path)
+
+
+class HttpArchive:
+    def __init__(self, root=ARCHIVE_DIR, mode="record", skip=None):
+        if mode not in MODES:
+            raise ValueError(f"Unknown archive mode {mode!r} (choose from {', '.join(MODES)})")
+        self.root = Path(root)
+        self.mode = mode
+        self.skip = skip  # url -> bool; matching requests are aborted and not archived
+        self.stats = {"hits": 0, "stored": 0, "unchanged": 0, "revalidated": 0, "misses": 0, "skipped": 0,
+                      "network_bytes": 0}
+
+    # --- storage ---
+
+    def _entry_path(self, key):
+        return self.root / "entries" / f"{key}.json"
+
+    def _body_path(self, sha):
+        return self.root / "bodies" / sha[:2] / f"{sha}.gz"
+
+    def get(self, method, url, post_data=None):
+        try:
+            with open(self._entry_path(request_key(method, url, post_data)), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+
+    def body(self, entry):
+        with gzip.open(self._body_path(entry["sha256"]), "rb") as f:
+            return f.read()
+
+    def put(self, method, url, status, headers, body, post_data=None):
+        sha = hashlib.sha256(body).hexdigest()
+        body_path = self._body_path(sha)
+        if not body_path.exists():
+            _write_atomic(body_path, gzip.compress(body, mtime=0))
+        headers = {k.lower(): v for k, v in headers.items()}
+        entry = {
+            "method": method.upper(),
+            "url": url,
+            "status": status,
+            "headers": {k: v for k, v in headers.items() if k not in DROP_HEADERS},
+            "sha256": sha,
+            "size": len(body),
+            "etag": headers.get("etag"),
+            "last_modified": headers.get("last-modified"),
+            "recorded_at": datetime.now().isoformat(timespec="seconds"),
+        }
+        if post_data:
+            entry["post_data"] = post_data
+        _write_atomic(self._entry_path(request_key(method, url, post_data)),
+                      json.dumps(entry, ensure_ascii=False, indent=2).encode("utf-8"))
+        return entry
+
+    def entries(self, pattern=None):
+        entry_dir = self.root / "entries"
+        if not entry_dir.exists():
+            return
+        for path in sorted(entry_dir.glob("*.json")):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    entry = json.load(f)
+            except (OSError, json.JSONDecodeError):
+                continue
+            if pattern is None or fnmatch.fnmatch(entry["url"], pattern):
+                yield entry
+
+    def summary(self):
+        entries = list(self.entries())
+        bodies = list((self.root / "bodies").glob("*/*.gz")) if (self.root / "bodies").exists() else []
+        return {
+            "entries": len(entries),
+            "bodies": len(bodies),
+            "raw_bytes": sum(e["size"] for e in entries),
+            "stored_bytes": sum(p.stat().st_size for p in bodies),
+        }
+
+    # --- Playwright routing ---
+
+    async def attach(self, context):
+        """Route every request of the context through the archive."""
+        await context.route("**/*", self.handle)
+
+    async def _fulfill(self, route, entry):
+        await route.fulfill(status=entry["status"], headers=entry["headers"], body=self.body(entry))
+
+    async def handle(self, route):
+        request = route.request
+        if self.skip and self.skip(request.url):
+            self.stats["skipped"] += 1
+            await route.abort("blockedbyclient")
+            return
+        post_data = request.post_data
+        entry = self.get(request.method, request.url, post_data)
+
+        if self.mode == "replay":
+            if entry is None:
+                self.stats["misses"] += 1
+                await route.abort("internetdisconnected")
+                return
+            self.stats["hits"] += 1
+            await self._fulfill(route, entry)
+            return
+
+        headers = dict(request.headers)
+        if self.mode == "revalidate" and entry:
+            if entry.get("etag"):
+                headers["if-none-match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["if-modified-since"] = entry["last_modified"]
+        try:
+            response = await route.fetch(headers=headers)
+        except Exception:
+            if entry is None:
+                await route.abort("failed")
+                return
+            # Network failed: the archived copy is better than nothing
+            self.stats["hits"] += 1
+            await self._fulfill(route, entry)
+            return
+
+        if response.status == 304 and entry:
+            self.stats["revalidated"] += 1
+            await self._fulfill(route, entry)
+            return
+
+        body = await response.body()
+        self.stats["network_bytes"] += len(body)
+        if response.ok:
+            stored = self.put(request.method, request.url, response.status, response.headers, body, post_data)
+            self.stats["unchanged" if entry and entry["sha256"] == stored["sha256"] else "stored"] += 1
+        await route.fulfill(response=response, body=body)
+
+    def print_stats(self):
+        s = self.stats
+        print(f"HTTP archive ({self.mode}): {s['hits']} hits, {s['revalidated']} revalidated (304), "
+              f"{s['stored']} stored, {s['unchanged']} unchanged, {s['misses']} misses, "
+              f"{s['network_bytes'] / 1024 / 1024:.1f} MB from network")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Voicy scraper HTTP archive")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("stats", help="Entry/body counts and sizes")
+    list_parser = sub.add_parser("list", help="List archived requests")
+    list_parser.add_argument("--pattern", help="fnmatch pattern on the URL")
+    sub.add_parser("clear", help="Delete the archive")
+    args = parser.parse_args()
+
+    archive = HttpArchive()
+    if args.command == "clear":
+        shutil.rmtree(archive.root, ignore_errors=True)
+        print(f"Removed {archive.root}")
+    elif args.command == "list":
+        for entry in archive.entries(args.pattern):
+            print(f"{entry['recorded_at']}  {entry['status']}  {entry['size']:>9}  {entry['method']} {entry['url']}")
+    else:
+        summary = archive.summary()
+        print(f"{archive.root}")
+        print(f"  entries: {summary['entries']}, bodies: {summary['bodies']}, "
+              f"{summary['raw_bytes'] / 1024 / 1024:.1f} MB raw -> {summary['stored_bytes'] / 1024 / 1024:.1f} MB stored")
+
+
+if __name__ == "__main__":
+    main()
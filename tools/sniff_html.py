@@ -1,7 +1,21 @@
 import re
+import sys
 
-with open("page.html", "r", encoding="utf-8") as f:
-    content = f.read()
+# Usage: python sniff_html.py [page.html | URL]
+# A URL is read from the scraper's HTTP archive (fetch_voicy_all.py --http-cache record), no network.
+source = sys.argv[1] if len(sys.argv) > 1 else "page.html"
+if source.startswith(("http://", "https://")):
+    from http_archive import HttpArchive
+
+    archive = HttpArchive(mode="replay")
+    entry = archive.get("GET", source)
+    if entry is None:
+        print(f"Not in the HTTP archive ({archive.root}): {source}")
+        sys.exit(1)
+    content = archive.body(entry).decode("utf-8", errors="replace")
+else:
+    with open(source, "r", encoding="utf-8") as f:
+        content = f.read()
 
 # Look for script tags with json type
 scripts = re.findall(r'<script[^>]*type="application/json"[^>]*>(.*?)</script>', content, re.DOTALL)
@@ -0,0 +1,78 @@
+"""
+Tests for episode_store.py
+
+Usage:
+    python -m pytest tools/test_episode_store.py -q
+"""
+
+from episode_store import EpisodeStore
+
+
+def episode(n):
+    return {"url": f"https://voicy.jp/channel/3577/{n}", "title": f"episode {n}", "date": "2024-01-02",
+            "body": f"body {n}", "transcript": None}
+
+
+def test_put_after_torn_tail(tmp_path):
+    store = EpisodeStore(tmp_path)
+    store.put(episode(1))
+    store.put(episode(2))
+    segment, = store.segments()
+    intact = segment.stat().st_size
+    # Interrupted append: frame header and part of the payload made it to disk
+    with open(segment, "ab") as f:
+        f.write(segment.read_bytes()[:12])
+
+    store = EpisodeStore(tmp_path)
+    assert [r["title"] for r in store.scan()] == ["episode 1", "episode 2"]
+    store.put(episode(3))
+
+    assert [r["title"] for r in store.scan()] == ["episode 1", "episode 2", "episode 3"]
+    assert store.get(episode(3)["url"])["body"] == "body 3"
+    assert store.index[episode(3)["url"]]["offset"] == intact
+    assert store.reindex() == 3
+
+
+def test_put_and_scan_current_versions(tmp_path):
+    store = EpisodeStore(tmp_path)
+    store.put(episode(1))
+    assert store.put(episode(1)) is None  # unchanged content is not appended again
+    store.put({**episode(1), "transcript": "updated"})
+
+    assert [r["transcript"] for r in store.scan()] == ["updated"]
+    assert len(list(store.scan(all_versions=True))) == 2
+    assert EpisodeStore(tmp_path).get(episode(1)["url"])["transcript"] == "updated"
+
+
+def test_frame_without_index_line_is_indexed_on_load(tmp_path):
+    store = EpisodeStore(tmp_path)
+    store.put(episode(1))
+    store.put(episode(2))
+    # Interrupted put(): the frame is in the segment but its index line was never written
+    lines = store.index_path.read_text(encoding="utf-8").splitlines(keepends=True)
+    store.index_path.write_text(lines[0], encoding="utf-8")
+
+    store = EpisodeStore(tmp_path)
+    assert store.get(episode(2)["url"])["body"] == "body 2"
+    assert [r["title"] for r in store.scan()] == ["episode 1", "episode 2"]
+    assert len(EpisodeStore(tmp_path).index) == 2
+
+
+def test_compact_keeps_new_segments_and_ignores_stale_tmp(tmp_path):
+    # Leftover from an interrupted compact: episode 2 is indexed there but its segment was moved out
+    stale = EpisodeStore(tmp_path / "compact.tmp")
+    stale.put(episode(2))
+    for segment in stale.segments():
+        segment.unlink()
+    store = EpisodeStore(tmp_path)
+    store.put(episode(1))
+    store.put({**episode(1), "transcript": "updated"})
+    store.put(episode(2))
+    old, = store.segments()
+
+    assert store.compact() == 2
+    new, = store.segments()
+    assert new.name > old.name
+    assert not (tmp_path / "compact.tmp").exists()
+    assert [(r["title"], r["transcript"]) for r in EpisodeStore(tmp_path).scan()] == [
+        ("episode 1", "updated"), ("episode 2", None)]
@@ -1,72 +1,156 @@
 import os
 import sys
 import argparse
+import shutil
+import subprocess
+import tempfile
+from pathlib import Path
 from dotenv import load_dotenv
-from google import genai
 from google.genai import types
 
+# gemini-image の共通クライアント（計測付き）を利用
+sys.path.insert(0, str(Path(__file__).resolve().parent / "gemini-image"))
+from gemini_client import create_client
+import audio_preprocess
+import scheduler
+from transcript_cache import TranscriptCache, cache_key, file_sha256
+
 # Load environment variables
 load_dotenv()
 
-def transcribe_audio(file_path):
-    # api_key = os.getenv("GEMINI_API_KEY") or os.getenv("GOOGLE_API_KEY")
-    # if not api_key:
-    #     print("Warning: API Key not found in env, attempting default credentials...")
-    
-    # Let the client attempt to find credentials automatically (Env, ADC, etc.)
-    try:
-        client = genai.Client(api_key=os.getenv("GEMINI_API_KEY") or os.getenv("GOOGLE_API_KEY"))
-    except Exception:
-        # Fallback to no-arg constructor which uses default lookups
-        client = genai.Client()
-
-    print(f"Uploading file: {file_path}...")
-    
-    # Upload the file to the File API
-    # The new SDK handles file uploads for prompting
-    try:
-        with open(file_path, "rb") as f:
-            file_content = f.read()
-        
-        # Depending on SDK version, we might send bytes directly or upload.
-        # For large files, uploads are better.
-        # We will try the upload_file pattern if available in this SDK version,
-        # otherwise we might encode inline relative to size constraints.
-        # But 'google-genai' usually wraps the API well.
-        # Let's try the recommended flow for querying with media.
-        
-        # For simplicity with the newer SDK:
-        response = client.models.generate_content(
-            model="gemini-2.0-flash-exp",
-            contents=[
-                types.Part.from_bytes(data=file_content, mime_type="audio/mp3"),
-                "この音声を日本語で詳細に書き起こしてください。話者分離は不要ですが、段落を適切に分けて読みやすくしてください。"
-            ]
-        )
-        
+MODEL = "gemini-2.0-flash-exp"
+DEFAULT_PROMPT = "この音声を日本語で詳細に書き起こしてください。話者分離は不要ですが、段落を適切に分けて読みやすくしてください。"
+# 0 = send the whole file in one request (as before); chunking is opt-in via --chunk-minutes
+CHUNK_SECONDS = 0
+
+
+def split_audio(file_path, chunk_seconds, workdir):
+    """
+    Split audio into chunk_seconds segments without re-encoding.
+    Needs ffmpeg; without it (or with chunk_seconds=0) the whole file is one chunk.
+    """
+    if not chunk_seconds or not shutil.which("ffmpeg"):
+        return [Path(file_path)]
+    suffix = Path(file_path).suffix or ".mp3"
+    pattern = Path(workdir) / f"chunk_%03d{suffix}"
+    subprocess.run(
+        [
+            "ffmpeg", "-hide_banner", "-loglevel", "error",
+            "-i", str(file_path),
+            "-f", "segment", "-segment_time", str(chunk_seconds), "-reset_timestamps", "1",
+            "-c", "copy", "-map_metadata", "-1", "-fflags", "+bitexact",  # same input -> same chunk bytes
+            str(pattern),
+        ],
+        check=True,
+    )
+    return sorted(Path(workdir).glob(f"chunk_*{suffix}"))
+
+
+def transcribe_chunk(client, chunk_path, prompt, model):
+    with open(chunk_path, "rb") as f:
+        file_content = f.read()
+    response = client.models.generate_content(
+        model=model,
+        contents=[
+            types.Part.from_bytes(data=file_content, mime_type=audio_preprocess.mime_type(chunk_path)),
+            prompt,
+        ],
+    )
+    return response.text
+
+
+def transcribe_audio(file_path, prompt=DEFAULT_PROMPT, model=MODEL, chunk_seconds=CHUNK_SECONDS,
+                     use_cache=True, force=False, preprocess=False, echo=True):
+    """
+    Transcribe an audio file, reusing cached chunks.
+
+    Results are cached per chunk keyed by (chunk audio hash, prompt, model), so an
+    interrupted run resumes from the last finished chunk and only changed chunks are re-sent.
+    force=True re-transcribes everything and overwrites the cache.
+    preprocess=True downmixes/resamples/trims the audio first (see audio_preprocess.py).
+    echo=False skips printing the transcript (for callers that store it themselves).
+    """
+    if preprocess:
+        file_path = audio_preprocess.preprocess(file_path)
+    cache = TranscriptCache() if use_cache else None
+    file_key = cache_key(f"{file_sha256(file_path)}:{chunk_seconds}", prompt, model)
+
+    if cache and not force and (texts := cache.get_file(file_key)) is not None:
+        print(f"✅ Transcript cache hit ({len(texts)} chunks)")
+        text = "\n\n".join(texts)
+        if echo:
+            print("\n--- Transcription ---\n")
+            print(text)
+        return text
+
+    client = None
+    texts, keys = [], []
+    with tempfile.TemporaryDirectory() as workdir:
+        chunks = split_audio(file_path, chunk_seconds, workdir)
+        for i, chunk in enumerate(chunks, 1):
+            chunk_sha = file_sha256(chunk)
+            key = cache_key(chunk_sha, prompt, model)
+            text = cache.get_chunk(key) if cache and not force else None
+            if text is not None:
+                print(f"⏭️  Chunk {i}/{len(chunks)} cached")
+            else:
+                if client is None:
+                    # Let the client attempt to find credentials automatically (Env, ADC, etc.)
+                    client = create_client(api_key=os.getenv("GEMINI_API_KEY") or os.getenv("GOOGLE_API_KEY"))
+                print(f"Transcribing chunk {i}/{len(chunks)}: {chunk.name} ({chunk.stat().st_size / 1024 / 1024:.1f} MB)...")
+                text = transcribe_chunk(client, chunk, prompt, model)
+                if cache:
+                    cache.put_chunk(key, text, model=model, audio_sha256=chunk_sha, source=str(file_path), index=i)
+            texts.append(text)
+            keys.append(key)
+
+    if cache:
+        cache.put_file(file_key, keys, model=model, source=str(file_path), chunk_seconds=chunk_seconds)
+
+    text = "\n\n".join(texts)
+    if echo:
         print("\n--- Transcription ---\n")
-        print(response.text)
-        return response.text
+        print(text)
+    return text
 
-    except Exception as e:
-        print(f"Error during transcription: {e}")
-        # Fallback query about the error
-        try:
-             # Just in case the bytes method failed or file is too large (20MB+), 
-             # we implies we should use the file API explicit upload.
-             # Note: For this first pass, we assume the file fits in the limit or the SDK handles it.
-             pass
-        except:
-            pass
-        sys.exit(1)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Transcribe audio file using Gemini.")
-    parser.add_argument("file_path", help="Path to the audio file")
+    parser.add_argument("file_paths", nargs="+", help="Path to the audio file(s)")
+    parser.add_argument("--prompt", default=DEFAULT_PROMPT, help="Transcription prompt")
+    parser.add_argument("--model", default=MODEL, help="Model to use")
+    parser.add_argument("--chunk-minutes", type=float, default=CHUNK_SECONDS / 60,
+                        help="Split into chunks of this length, e.g. 10 for long episodes "
+                             "(needs ffmpeg; default 0 = whole file in one request)")
+    parser.add_argument("--no-cache", action="store_true", help="Do not read or write the transcript cache")
+    parser.add_argument("--force", action="store_true", help="Re-transcribe even if cached")
+    parser.add_argument("--preprocess", action="store_true",
+                        help="Downmix to mono, resample and trim silence before upload (needs ffmpeg)")
+    parser.add_argument("-j", "--jobs", type=int, help="Parallel preprocessing workers (default: CPU count)")
     args = parser.parse_args()
+    # daily-ops の書き起こし（対話的な画像生成を優先し、夜間バッチよりは先に通す）
+    scheduler.set_default("daily")
 
-    if not os.path.exists(args.file_path):
-        print(f"Error: File not found: {args.file_path}")
-        sys.exit(1)
+    for file_path in args.file_paths:
+        if not os.path.exists(file_path):
+            print(f"Error: File not found: {file_path}")
+            sys.exit(1)
 
-    transcribe_audio(args.file_path)
+    try:
+        file_paths = args.file_paths
+        if args.preprocess:
+            # Preprocess every file up front in a worker pool, then transcribe one by one
+            file_paths = audio_preprocess.preprocess_many(file_paths, workers=args.jobs)
+        for file_path in file_paths:
+            transcribe_audio(
+                file_path,
+                prompt=args.prompt,
+                model=args.model,
+                chunk_seconds=int(args.chunk_minutes * 60),
+                use_cache=not args.no_cache,
+                force=args.force,
+            )
+    except Exception as e:
+        # Finished chunks are already cached; re-running resumes from there
+        print(f"Error during transcription: {e}")
+        sys.exit(1)
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+書き起こし結果の永続キャッシュ
+
+キーは（音声の内容ハッシュ, プロンプト, モデル）。分割して書き起こした場合はチャンクごとに
+保存するため、途中で止めても次回は終わったチャンクを飛ばして再開でき、
+一部だけ変わった音声やチャンク設定の変更でも変わったチャンクだけを送り直す。
+
+ファイル単位の索引（ファイルのハッシュ → チャンクのキー一覧）も保存し、
+全チャンクが揃っていれば音声を分割せずに結果を返す。
+
+保存先: ~/.gemini-image/transcripts/（GEMINI_TRANSCRIPT_CACHE で変更可）
+
+Usage:
+    python transcript_cache.py stats
+    python transcript_cache.py clear
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+from datetime import datetime
+from pathlib import Path
+
+CACHE_DIR = Path(os.environ.get("GEMINI_TRANSCRIPT_CACHE", "~/.gemini-image/transcripts")).expanduser()
+
+
+def file_sha256(path: str | Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def cache_key(audio_sha: str, prompt: str, model: str) -> str:
+    return hashlib.sha256(f"{model}\n{prompt}\n{audio_sha}".encode("utf-8")).hexdigest()[:32]
+
+
+class TranscriptCache:
+    """チャンク単位の書き起こし結果とファイル単位の索引"""
+
+    def __init__(self, root: Path = CACHE_DIR):
+        self.root = Path(root)
+        self.chunk_dir = self.root / "chunks"
+        self.file_dir = self.root / "files"
+
+    def _read(self, path: Path) -> dict | None:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+
+    def _write(self, path: Path, data: dict):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        tmp.replace(path)
+
+    def get_chunk(self, key: str) -> str | None:
+        entry = self._read(self.chunk_dir / f"{key}.json")
+        return entry["text"] if entry else None
+
+    def put_chunk(self, key: str, text: str, **meta):
+        self._write(self.chunk_dir / f"{key}.json", {
+            "text": text,
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            **meta,
+        })
+
+    def get_file(self, key: str) -> list[str] | None:
+        """ファイル単位の結果（全チャンクが揃っている場合のみ）をチャンクごとのリストで返す"""
+        entry = self._read(self.file_dir / f"{key}.json")
+        if not entry:
+            return None
+        texts = [self.get_chunk(chunk_key) for chunk_key in entry["chunks"]]
+        return None if any(text is None for text in texts) else texts
+
+    def put_file(self, key: str, chunk_keys: list[str], **meta):
+        self._write(self.file_dir / f"{key}.json", {
+            "chunks": chunk_keys,
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            **meta,
+        })
+
+    def stats(self) -> dict:
+        chunks = list(self.chunk_dir.glob("*.json")) if self.chunk_dir.exists() else []
+        files = list(self.file_dir.glob("*.json")) if self.file_dir.exists() else []
+        return {
+            "files": len(files),
+            "chunks": len(chunks),
+            "bytes": sum(p.stat().st_size for p in chunks + files),
+        }
+
+    def clear(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Transcript cache")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("stats", help="キャッシュ件数とサイズ")
+    sub.add_parser("clear", help="キャッシュを消去")
+    args = parser.parse_args()
+
+    cache = TranscriptCache()
+    if args.command == "clear":
+        cache.clear()
+        print(f"🗑️  Removed {cache.root}")
+        return
+    stats = cache.stats()
+    print(f"📂 {cache.root}")
+    print(f"   files: {stats['files']}, chunks: {stats['chunks']}, {stats['bytes'] / 1024:.1f} KB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+Streaming Voicy pipeline: episode discovery -> page scrape -> audio download -> transcription -> markdown.
+
+Each stage runs its own workers and hands items to the next stage through a bounded
+asyncio.Queue, so stages overlap instead of running one after another:
+
+    discover (1)  ->  scrape (-s)  ->  download (-d)  ->  transcribe (-t)  ->  write (1)
+
+- The first episode is transcribed while the list page is still being scrolled
+- A full queue blocks the stage in front of it (backpressure), so a slow transcriber never
+  leaves hundreds of scraped pages or audio files waiting in memory
+- A backfill takes about as long as its slowest stage, not the sum of all stages;
+  the per-stage summary at the end shows which one that was
+
+The scraped text is saved as soon as a page is read (same file as fetch_voicy_all.py);
+the write stage rewrites it with the transcript appended. Episodes without an audio URL
+skip straight to the write stage.
+
+Usage:
+    python voicy_pipeline.py --latest                 # daily run: newest episode only
+    python voicy_pipeline.py                          # backfill the whole channel
+    python voicy_pipeline.py -s 2 -d 4 -t 2 --queue-size 8
+    python voicy_pipeline.py --no-transcribe          # scrape + download only
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+
+from playwright.async_api import async_playwright
+
+import fetch_voicy_all
+from browser_service import open_browser
+from audio_download import AUDIO_DIR, AudioDownloader, filename_for
+from http_archive import MODES as HTTP_CACHE_MODES, HttpArchive
+from transcribe_audio import transcribe_audio
+
+sys.path.insert(0, str(Path(__file__).resolve().parent / "gemini-image"))
+import scheduler
+
+QUEUE_SIZE = 4
+DONE = object()  # end-of-stream marker, one per downstream worker
+
+
+class Stage:
+    """
+    Workers that take items from inbox, run fn and put the result on outbox.
+
+    fn returns the item for the next stage (None drops it). When every worker has seen
+    DONE, one DONE per downstream worker is passed on.
+    """
+
+    def __init__(self, name, fn, workers, inbox, outbox=None):
+        self.name = name
+        self.fn = fn
+        self.workers = workers
+        self.inbox = inbox
+        self.outbox = outbox
+        self.next_workers = 1
+        self.stats = {"items": 0, "failed": 0, "busy": 0.0, "blocked": 0.0, "first": None}
+
+    async def _worker(self, started):
+        while (item := await self.inbox.get()) is not DONE:
+            t0 = time.perf_counter()
+            try:
+                result = await self.fn(item)
+            except Exception as e:
+                self.stats["failed"] += 1
+                print(f"[{self.name}] failed: {type(e).__name__}: {e}")
+                continue
+            finally:
+                self.stats["busy"] += time.perf_counter() - t0
+            self.stats["items"] += 1
+            if self.stats["first"] is None:
+                self.stats["first"] = time.perf_counter() - started
+            if result is not None and self.outbox is not None:
+                t0 = time.perf_counter()
+                await self.outbox.put(result)
+                self.stats["blocked"] += time.perf_counter() - t0
+
+    async def run(self, started):
+        await asyncio.gather(*(self._worker(started) for _ in range(self.workers)))
+        if self.outbox is not None:
+            for _ in range(self.next_workers):
+                await self.outbox.put(DONE)
+
+
+def connect(stages):
+    for stage, downstream in zip(stages, stages[1:]):
+        stage.next_workers = downstream.workers
+
+
+def print_summary(stages, elapsed):
+    print(f"\nPipeline finished in {elapsed:.1f}s")
+    print(f"{'stage':<11} {'workers':>7} {'items':>6} {'failed':>6} {'busy/worker':>12} {'blocked':>8} {'first':>7}")
+    for stage in stages:
+        s = stage.stats
+        first = f"{s['first']:.1f}s" if s["first"] is not None else "-"
+        print(f"{stage.name:<11} {stage.workers:>7} {s['items']:>6} {s['failed']:>6} "
+              f"{s['busy'] / stage.workers:>11.1f}s {s['blocked']:>7.1f}s {first:>7}")
+    slowest = max(stages, key=lambda stage: stage.stats["busy"] / stage.workers)
+    print(f"Slowest stage: {slowest.name}")
+
+
+async def run(latest=False, scrapers=2, downloads=4, transcribers=1, queue_size=QUEUE_SIZE,
+              audio_dir=AUDIO_DIR, transcribe=True, block=True, http_cache="off"):
+    archive = HttpArchive(mode=http_cache) if http_cache != "off" else None
+    to_scrape, to_download, to_transcribe, to_write = (asyncio.Queue(queue_size) for _ in range(4))
+    seen = set()
+
+    async with (async_playwright() as p, open_browser(p) as session,
+                AudioDownloader(audio_dir, concurrency=downloads) as downloader):
+        context, list_page, page_stats = await fetch_voicy_all.new_scraping_context(session, block=block,
+                                                                                     archive=archive)
+        pages = asyncio.Queue()
+        for _ in range(scrapers):
+            pages.put_nowait(await fetch_voicy_all.new_scraping_page(session, context, page_stats, block=block))
+
+        async def discover():
+            try:
+                async for links in fetch_voicy_all.scroll_episode_links(list_page, latest=latest):
+                    for url in links:
+                        if url not in seen:
+                            seen.add(url)
+                            await to_scrape.put(url)
+            except Exception as e:
+                # Episodes found so far still go through the rest of the pipeline
+                print(f"[discover] failed: {type(e).__name__}: {e}")
+            finally:
+                for _ in range(scrapers):
+                    await to_scrape.put(DONE)
+
+        async def scrape(url):
+            page = await pages.get()
+            try:
+                record = await fetch_voicy_all.extract_episode(page, url)
+            finally:
+                pages.put_nowait(page)
+            filename = fetch_voicy_all.save_episode(record)
+            if not record.get("audio_url"):
+                print(f"Notice: No audio URL found for {url}")
+            return record, filename
+
+        async def download(item):
+            record, filename = item
+            if not record.get("audio_url"):
+                return record, filename, None
+            dest = Path(audio_dir) / filename_for(record["audio_url"], Path(filename).stem)
+            return record, filename, await downloader.download(record["audio_url"], dest)
+
+        async def transcribe_stage(item):
+            record, filename, audio_path = item
+            if transcribe and audio_path:
+                record["transcript"] = await asyncio.to_thread(transcribe_audio, str(audio_path), echo=False)
+            return record, filename
+
+        async def write(item):
+            record, _ = item
+            if record.get("transcript"):
+                fetch_voicy_all.save_episode(record)
+            return None
+
+        stages = [
+            Stage("scrape", scrape, scrapers, to_scrape, to_download),
+            Stage("download", download, downloads, to_download, to_transcribe),
+            Stage("transcribe", transcribe_stage, transcribers, to_transcribe, to_write),
+            Stage("write", write, 1, to_write),
+        ]
+        connect(stages)
+        started = time.perf_counter()
+        await asyncio.gather(discover(), *(stage.run(started) for stage in stages))
+        elapsed = time.perf_counter() - started
+
+    print_summary(stages, elapsed)
+    downloader.print_stats()
+    if archive:
+        archive.print_stats()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scrape, download, transcribe and save Voicy episodes as a streaming pipeline.")
+    parser.add_argument("--latest", action="store_true", help="Only process the newest episode")
+    parser.add_argument("-s", "--scrapers", type=int, default=2, help="Pages scraping episodes in parallel")
+    parser.add_argument("-d", "--downloads", type=int, default=4, help="Parallel audio downloads")
+    parser.add_argument("-t", "--transcribers", type=int, default=1, help="Parallel transcriptions")
+    parser.add_argument("--queue-size", type=int, default=QUEUE_SIZE,
+                        help="Items buffered between stages before the upstream stage waits")
+    parser.add_argument("--audio-dir", default=AUDIO_DIR, help=f"Audio directory (default: {AUDIO_DIR})")
+    parser.add_argument("--no-transcribe", action="store_true", help="Scrape and download only")
+    parser.add_argument("--no-block", action="store_true",
+                        help="Load images, fonts, media, stylesheets and trackers (for debugging selectors)")
+    parser.add_argument("--http-cache", choices=HTTP_CACHE_MODES, default=os.environ.get("VOICY_HTTP_CACHE", "off"),
+                        help="HTTP archive mode for the pages (see http_archive.py)")
+    args = parser.parse_args()
+    # daily-ops の書き起こし（対話的な画像生成を優先し、夜間バッチよりは先に通す）
+    scheduler.set_default("daily")
+    asyncio.run(run(
+        latest=args.latest,
+        scrapers=args.scrapers,
+        downloads=args.downloads,
+        transcribers=args.transcribers,
+        queue_size=args.queue_size,
+        audio_dir=args.audio_dir,
+        transcribe=not args.no_transcribe,
+        block=not args.no_block,
+        http_cache=args.http_cache,
+    ))